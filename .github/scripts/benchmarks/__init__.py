@@ -0,0 +1,8 @@
+"""Benchmarks for the parts of the pipeline whose cost grows with the tree.
+
+Run from `.github/scripts` as modules (`uv run python -m benchmarks.graph`), so
+`ci` imports exactly as the entry scripts import it. Not collected by pytest:
+they measure, they do not assert, and a timing is not a property to gate on.
+The mesh harness is run small by tests all the same, for what it stages
+rather than how fast: the real mesh must build every image exactly once.
+"""
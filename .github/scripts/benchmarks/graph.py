@@ -0,0 +1,52 @@
+"""How long the graph walks take on a synthetic tree of thousands of images.
+
+    uv run python -m benchmarks.graph --images 10000 --depth 2000 --fan-in 500
+
+Times the two walks on their own, then `references.graph` end to end over a
+tree written to a temporary directory, which adds reading and parsing every
+file. The default depth is well past the interpreter's recursion limit, which
+the recursive level walk could not have reached.
+"""
+
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from benchmarks.synthetic import edges, write_tree
+from ci.references import _dependents_of, _levels_of, graph
+
+
+def timed[T](label: str, run: Callable[[], T]) -> T:
+    started = time.perf_counter()
+    result = run()
+    print(f"{label:<28} {time.perf_counter() - started:8.3f}s")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, default=10_000)
+    parser.add_argument("--depth", type=int, default=2_000)
+    parser.add_argument("--fan-in", type=int, default=500)
+    arguments = parser.parse_args()
+
+    synthetic = edges(arguments.images, arguments.depth, arguments.fan_in)
+    total = sum(map(len, synthetic.values()))
+    print(f"{arguments.images} images, {total} edges, chains of {arguments.depth}")
+
+    levels = timed("levels", lambda: _levels_of(synthetic))
+    timed("dependents", lambda: _dependents_of(synthetic))
+    print(f"{'deepest level':<28} {max(levels.values()):8d}")
+
+    with tempfile.TemporaryDirectory() as scratch:
+        root = Path(scratch)
+        definitions = timed("write tree", lambda: write_tree(root, synthetic))
+        timed("graph (read + parse + walk)", lambda: graph(definitions, root))
+
+
+if __name__ == "__main__":
+    main()
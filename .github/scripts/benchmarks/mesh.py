@@ -0,0 +1,367 @@
+"""How the work-stealing mesh behaves end to end, with every worker on one machine.
+
+    uv run python -m benchmarks.mesh --workers 4 --slots 2 --deal skewed
+    uv run python -m benchmarks.mesh --timelines ./timelines --platform amd64
+
+Launches full workers in this process. Each one serves the real endpoint
+(`serve_mesh`), drains its queue with the real scheduler (`run_worker`), and
+steals through the real `MeshClient`, signed requests and all, over plain HTTP
+on loopback. Three things are stood in for. Builds sleep for their durations --
+recorded ones from a directory of run timelines (see `ci.timeline`), or a
+synthetic spread. The GitHub refs API the rendezvous goes through is an
+in-memory transport with a configurable latency. And there are no tunnels: each
+worker publishes a made-up quick-tunnel hostname that its peers' clients
+resolve to its loopback port, which is what `peer_origin` is for.
+
+Everything runs on a clock `--speedup` times faster than the wall, so a
+forty-minute run replays in well under a minute with the scheduler's own grace
+and poll periods intact. Figures are reported on that clock, in the recorded
+run's seconds. Loopback round trips are scaled up with it, so at the default
+speedup a millisecond of real latency reads as a tenth of a second -- about
+what a quick tunnel costs.
+
+Reports the makespan against the floor no schedule can beat, how long steals
+waited, how many requests the mesh and the rendezvous made, and how long
+workers lingered after the run's last build ended -- the tail that
+`peers_drained` and the grace period decide between them.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import random
+import statistics
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable, Mapping, Sequence
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from enum import StrEnum
+from pathlib import Path
+from typing import assert_never
+
+import httpx
+
+from ci import timeline
+from ci.discovery import deal
+from ci.domain import BuildOutcome, BuildSucceeded, Hostname, Platform, Task
+from ci.env import write_summary
+from ci.mesh import MeshClient, Rendezvous, serve_mesh
+from ci.scheduling import TaskQueue, run_worker
+from ci.timeline import RunShape, WorkerTimeline
+
+_SECRET = b"benchmark-mesh-key-not-a-secret!"
+
+# What the rendezvous is told each worker booted from. Never resolved.
+_COMMIT = "0" * 40
+
+
+class Deal(StrEnum):
+    """How the tasks are split before anyone steals."""
+
+    # What the plan job does: a seeded shuffle, dealt round-robin.
+    RANDOM = "random"
+    # Everything to the first worker: the most stealing a run can need.
+    SKEWED = "skewed"
+
+
+@dataclass(frozen=True, slots=True)
+class Topology:
+    """The run to stage. Durations are in the recorded run's seconds."""
+
+    workers: int = 4
+    slots: int = 2
+    deal: Deal = Deal.RANDOM
+    # Expected peers that never boot, as when a runner is never assigned.
+    absent: int = 0
+    # Delay between one worker publishing and the next booting.
+    stagger_seconds: float = 0.0
+    # Per rendezvous request: GitHub's API is the slow hop in discovery.
+    api_latency_seconds: float = 0.3
+    grace_seconds: float = 90.0
+    poll_seconds: float = 3.0
+    speedup: float = 120.0
+    seed: int = 0
+
+
+@dataclass(frozen=True, slots=True)
+class Result:
+    shape: RunShape
+    # Request counts, keyed "METHOD what": the rendezvous's and the peers'.
+    requests: Mapping[str, int]
+    # Per worker: from the run's last build ending to that worker returning.
+    lingered: tuple[float, ...]
+    # How many times each image was built, across every worker.
+    built: Mapping[str, int]
+    stolen: int
+
+
+class RefsApi:
+    """The slice of GitHub's git refs API the rendezvous uses, in memory."""
+
+    def __init__(self, latency: Callable[[], None]) -> None:
+        self._latency = latency
+        self._refs: dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.requests: Counter[str] = Counter()
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        self._latency()
+        path = request.url.path
+        with self._lock:
+            if request.method == "POST" and path.endswith("/git/refs"):
+                self.requests["POST refs (publish)"] += 1
+                created = json.loads(request.content)
+                self._refs[created["ref"]] = created["sha"]
+                return httpx.Response(201, json=created)
+            if request.method == "GET" and "/git/matching-refs/" in path:
+                self.requests["GET matching-refs (discover)"] += 1
+                prefix = "refs/" + path.split("/git/matching-refs/", 1)[1]
+                matching = sorted(ref for ref in self._refs if ref.startswith(prefix))
+                return httpx.Response(200, json=[{"ref": ref} for ref in matching])
+            if request.method == "DELETE" and "/git/refs/" in path:
+                self.requests["DELETE refs (cleanup)"] += 1
+                self._refs.pop(path.split("/git/", 1)[1], None)
+                return httpx.Response(204)
+        return httpx.Response(404, json={"message": "Not Found"})
+
+
+@dataclass
+class _Mesh:
+    """What the workers share: the loopback ports, the counters, the clock."""
+
+    topology: Topology
+    durations: Mapping[str, float]
+    api: RefsApi
+    epoch: float = field(default_factory=time.monotonic)
+    ports: dict[Hostname, int] = field(default_factory=dict)
+    peer_requests: Counter[str] = field(default_factory=Counter)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def clock(self) -> float:
+        return (time.monotonic() - self.epoch) * self.topology.speedup
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds / self.topology.speedup)
+
+    def origin(self, hostname: Hostname) -> str:
+        with self.lock:
+            return f"http://127.0.0.1:{self.ports[hostname]}"
+
+    def count(self, request: httpx.Request) -> None:
+        with self.lock:
+            self.peer_requests[f"{request.method} {request.url.path} (peer)"] += 1
+
+    def build(self, task: Task) -> BuildOutcome:
+        started = self.clock()
+        self.sleep(self.durations[task.image])
+        return BuildSucceeded(
+            task=task, attempts=1, duration_seconds=self.clock() - started, started_at=started
+        )
+
+
+def _worker(mesh: _Mesh, worker_id: int, tasks: Sequence[Task]) -> WorkerTimeline:
+    """One full worker: serve, publish, drain, steal, stop."""
+    topology = mesh.topology
+    queue = TaskQueue(tasks)
+    waits: list[float] = []
+    mesh.sleep(topology.stagger_seconds * worker_id)
+    with ExitStack() as scope:
+        github = scope.enter_context(
+            httpx.Client(
+                base_url="https://api.github.com", transport=httpx.MockTransport(mesh.api.handle)
+            )
+        )
+        peers = scope.enter_context(
+            httpx.Client(timeout=15.0, event_hooks={"request": [mesh.count]})
+        )
+        port = scope.enter_context(serve_mesh(worker_id, _SECRET, queue))
+        hostname = Hostname(f"mesh-bench-{worker_id}.trycloudflare.com")
+        with mesh.lock:
+            mesh.ports[hostname] = port
+
+        client = MeshClient(
+            secret=_SECRET,
+            worker_id=worker_id,
+            rendezvous=Rendezvous(repository="bench/mesh", run_id="1", platform=Platform.AMD64),
+            github=github,
+            peers_client=peers,
+            expected_peers=topology.workers + topology.absent - 1,
+            peer_origin=mesh.origin,
+        )
+        client.publish(hostname, _COMMIT)
+        began = mesh.clock()
+        outcomes = run_worker(
+            queue=queue,
+            mesh=client,
+            execute=mesh.build,
+            slots=topology.slots,
+            grace_seconds=topology.grace_seconds,
+            poll_seconds=topology.poll_seconds,
+            sleep=mesh.sleep,
+            clock=mesh.clock,
+            on_steal=waits.append,
+        )
+        finished = mesh.clock()
+
+    return WorkerTimeline(
+        worker=f"bench/{worker_id}",
+        platform=str(Platform.AMD64),
+        slots=topology.slots,
+        began=began,
+        finished=finished,
+        spans=timeline.spans_of(outcomes, frozenset(task.image for task in tasks), 0.0),
+        steal_waits=tuple(waits),
+    )
+
+
+def shares(tasks: Sequence[Task], topology: Topology) -> tuple[tuple[Task, ...], ...]:
+    match topology.deal:
+        case Deal.RANDOM:
+            return deal(tasks, topology.workers, topology.seed)
+        case Deal.SKEWED:
+            return (tuple(tasks), *(() for _ in range(topology.workers - 1)))
+        case other:
+            assert_never(other)
+
+
+def run(durations: Mapping[str, float], topology: Topology) -> Result:
+    """Stages the run and waits for every worker to stop."""
+    api = RefsApi(lambda: time.sleep(topology.api_latency_seconds / topology.speedup))
+    mesh = _Mesh(topology, durations, api)
+    tasks = tuple(
+        Task(
+            image=image,
+            dockerfile=f"{image}/Dockerfile",
+            context=image,
+            platform=Platform.AMD64,
+            max_retries=0,
+        )
+        for image in durations
+    )
+
+    timelines: dict[int, WorkerTimeline] = {}
+    failures: list[BaseException] = []
+
+    def boot(worker_id: int, share: Sequence[Task]) -> None:
+        try:
+            timelines[worker_id] = _worker(mesh, worker_id, share)
+        except BaseException as error:
+            failures.append(error)
+
+    threads = [
+        threading.Thread(target=boot, args=(worker_id, share), name=f"bench-worker-{worker_id}")
+        for worker_id, share in enumerate(shares(tasks, topology))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if failures:
+        raise RuntimeError(f"{len(failures)} worker(s) raised") from failures[0]
+
+    ordered = tuple(timelines[worker_id] for worker_id in sorted(timelines))
+    spans = tuple(span for worker in ordered for span in worker.spans)
+    last_build = max((span.end for span in spans), default=0.0)
+    return Result(
+        shape=timeline.shape(ordered),
+        requests=dict(sorted((api.requests + mesh.peer_requests).items())),
+        lingered=tuple(max(0.0, worker.finished - last_build) for worker in ordered),
+        built=Counter(span.image for span in spans),
+        stolen=sum(span.stolen for span in spans),
+    )
+
+
+def recorded(directory: Path, platform: str | None) -> dict[str, float]:
+    """Each image's last build duration on one platform, from saved timelines.
+
+    One platform, because a mesh is: the workers for each architecture steal
+    only from each other. Left unset, the platform with the most builds.
+    """
+    spans = [span for worker in timeline.load_all(directory) for span in worker.spans]
+    counts = Counter(span.platform for span in spans)
+    chosen = platform or (counts.most_common(1)[0][0] if counts else None)
+    return {
+        span.image: span.duration
+        for span in sorted(spans, key=lambda span: span.end)
+        if span.platform == chosen
+    }
+
+
+def synthetic(images: int, seed: int) -> dict[str, float]:
+    """A long-tailed spread around four minutes, like this repository's images."""
+    rng = random.Random(seed)
+    return {
+        f"bench-{index:03d}": rng.lognormvariate(math.log(240.0), 0.9) for index in range(images)
+    }
+
+
+def report(result: Result, topology: Topology) -> list[str]:
+    run_shape = result.shape
+    waits = run_shape.steal_waits
+    duplicates = sum(count - 1 for count in result.built.values())
+    return [
+        f"### Mesh benchmark: {topology.workers} worker(s) x {topology.slots} slot(s), "
+        f"{topology.deal} deal, {topology.absent} absent",
+        "",
+        f"- makespan **{run_shape.makespan:.0f}s** against a floor of "
+        f"{run_shape.lower_bound:.0f}s ({len(result.built)} image(s), "
+        f"{run_shape.total_work:.0f}s of work)",
+        f"- {result.stolen} build(s) stolen; steal wait median "
+        f"{statistics.median(waits) if waits else 0.0:.1f}s, max "
+        f"{max(waits, default=0.0):.1f}s",
+        f"- lingered after the last build: max {max(result.lingered, default=0.0):.1f}s, "
+        f"mean {statistics.fmean(result.lingered) if result.lingered else 0.0:.1f}s",
+        f"- images built more than once: {duplicates}",
+        "",
+        "| Requests | Count |",
+        "| --- | --- |",
+        *(f"| {what} | {count} |" for what, count in result.requests.items()),
+        "",
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--slots", type=int, default=2)
+    parser.add_argument("--deal", type=Deal, choices=tuple(Deal), default=Deal.RANDOM)
+    parser.add_argument("--absent", type=int, default=0)
+    parser.add_argument("--stagger", type=float, default=0.0)
+    parser.add_argument("--api-latency", type=float, default=0.3)
+    parser.add_argument("--grace", type=float, default=90.0)
+    parser.add_argument("--poll", type=float, default=3.0)
+    parser.add_argument("--speedup", type=float, default=120.0)
+    parser.add_argument("--images", type=int, default=32)
+    parser.add_argument("--timelines", type=Path)
+    parser.add_argument("--platform")
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    topology = Topology(
+        workers=arguments.workers,
+        slots=arguments.slots,
+        deal=arguments.deal,
+        absent=arguments.absent,
+        stagger_seconds=arguments.stagger,
+        api_latency_seconds=arguments.api_latency,
+        grace_seconds=arguments.grace,
+        poll_seconds=arguments.poll,
+        speedup=arguments.speedup,
+        seed=arguments.seed,
+    )
+    durations = (
+        recorded(arguments.timelines, arguments.platform)
+        if arguments.timelines
+        else synthetic(arguments.images, arguments.seed)
+    )
+    lines = report(run(durations, topology), topology)
+    print("\n".join(lines))
+    write_summary(lines)
+
+
+if __name__ == "__main__":
+    main()
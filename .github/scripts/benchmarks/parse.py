@@ -0,0 +1,48 @@
+"""How fast `references.graph` reads and parses a tree, by size and by pool width.
+
+    uv run python -m benchmarks.parse --sizes 500,2000,10000 --workers 1,4
+
+For each tree size, writes a synthetic tree and times `graph` over it with a
+cold parse cache at each worker count, reporting files per second. A width of
+one is the serial path; below the pool minimum every width is, which is the
+point of having one, and the rows show where the crossover actually sits.
+"""
+
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.synthetic import edges, write_tree
+from ci.references import ParseCache, graph
+
+
+def counts(raw: str) -> tuple[int, ...]:
+    return tuple(int(part) for part in raw.split(",") if part.strip())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=counts, default=(500, 2_000, 10_000))
+    parser.add_argument("--workers", type=counts, default=(1, 4))
+    parser.add_argument("--depth", type=int, default=50)
+    parser.add_argument("--fan-in", type=int, default=50)
+    arguments = parser.parse_args()
+
+    print(f"{'files':>8} {'workers':>8} {'seconds':>9} {'files/s':>10}")
+    for size in arguments.sizes:
+        synthetic = edges(size, arguments.depth, arguments.fan_in)
+        with tempfile.TemporaryDirectory() as scratch:
+            root = Path(scratch)
+            definitions = write_tree(root, synthetic)
+            for width in arguments.workers:
+                started = time.perf_counter()
+                graph(definitions, root, ParseCache(), workers=width)
+                elapsed = time.perf_counter() - started
+                print(f"{size:>8} {width:>8} {elapsed:>9.3f} {size / elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""What authenticating a mesh request costs, and what concurrent handlers see.
+
+    uv run python -m benchmarks.signing --requests 200000 --threads 1,8,32
+
+First the primitive: tags and body digests per second, one-shot (`Derivation.over`
+with the key, setting BLAKE2b up for every message) against prepared (the state
+`ci.mesh` now sets up once and copies). Then the whole check a handler makes --
+`verify_headers` and `verify_body` over a steal request -- from several threads
+at once, as the threaded server runs it, reporting verifications per second and
+the 99th-percentile latency of one. The GIL serialises the hashing, so the
+latency under many threads is mostly queueing; it is the number that says
+whether authentication stays negligible as steal traffic grows.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.parse import counts
+from ci.domain import HeadersAuthentic
+from ci.mesh import (
+    BODY,
+    REQUEST,
+    body_digest,
+    canonical_request,
+    derive_run_key,
+    sign_request,
+    verify_body,
+    verify_headers,
+)
+
+KEY = derive_run_key("benchmark-repository-secret", "1")
+
+BODY_BYTES = json.dumps({"count": 1}).encode()
+
+
+def rate(label: str, run: Callable[[], object], count: int) -> None:
+    started = time.perf_counter()
+    for _ in range(count):
+        run()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<32} {count / elapsed:>12,.0f}/s {elapsed / count * 1e6:>8.2f}us")
+
+
+def verify_once(timestamp: str, digest: str, signature: str) -> None:
+    outcome = verify_headers(
+        key=KEY,
+        method="POST",
+        path="/steal",
+        timestamp=timestamp,
+        declared_length=str(len(BODY_BYTES)),
+        digest=digest,
+        presented=signature,
+        now=float(timestamp),
+    )
+    assert isinstance(outcome, HeadersAuthentic)
+    verify_body(BODY_BYTES, outcome)
+
+
+def concurrent(threads: int, requests: int) -> tuple[float, float]:
+    """Verifications per second, and the p99 latency of one in microseconds."""
+    timestamp = f"{time.time():.3f}"
+    digest = body_digest(BODY_BYTES)
+    signature = sign_request(KEY, "POST", "/steal", timestamp, len(BODY_BYTES), digest)
+    share = max(1, requests // threads)
+
+    def handler(_: int) -> list[int]:
+        latencies = []
+        for _ in range(share):
+            started = time.perf_counter_ns()
+            verify_once(timestamp, digest, signature)
+            latencies.append(time.perf_counter_ns() - started)
+        return latencies
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = [latency for batch in pool.map(handler, range(threads)) for latency in batch]
+    elapsed = time.perf_counter() - started
+    p99 = statistics.quantiles(latencies, n=100)[-1] / 1e3
+    return len(latencies) / elapsed, p99
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200_000)
+    parser.add_argument("--threads", type=counts, default=(1, 8, 32))
+    arguments = parser.parse_args()
+
+    canonical = canonical_request("POST", "/steal", f"{time.time():.3f}", 11, "0" * 64)
+    prepared = REQUEST.prepared(KEY)
+    unkeyed = BODY.prepared()
+    count = arguments.requests
+    rate("sign, one-shot", lambda: REQUEST.over(canonical, key=KEY), count)
+    rate("sign, prepared", lambda: prepared.over(canonical), count)
+    rate("body digest, one-shot", lambda: BODY.over(BODY_BYTES), count)
+    rate("body digest, prepared", lambda: unkeyed.over(BODY_BYTES), count)
+
+    print()
+    print(f"{'threads':>8} {'verifies/s':>12} {'p99':>10}")
+    for threads in arguments.threads:
+        throughput, p99 = concurrent(threads, count)
+        print(f"{threads:>8} {throughput:>12,.0f} {p99:>8.1f}us")
+
+
+if __name__ == "__main__":
+    main()
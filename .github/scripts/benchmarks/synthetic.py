@@ -0,0 +1,80 @@
+"""Synthetic trees, shaped like a large fork of this repository but bigger.
+
+Two shapes matter to the graph walks, and both are generated: long chains,
+which is what the level computation recurses through, and wide fan-in, which is
+what the inversion scans. Every image depends only on images before it, so the
+tree is acyclic by construction and every level is known.
+"""
+
+from __future__ import annotations
+
+import random
+from collections.abc import Mapping
+from pathlib import Path
+
+from ci.domain import Dependency, Usage
+
+REGISTRY = "ghcr.io/benchmark/dockerfiles"
+
+
+def name_of(index: int) -> str:
+    return f"img-{index:05d}"
+
+
+def edges(
+    images: int, depth: int, fan_in: int, seed: int = 0
+) -> Mapping[str, tuple[Dependency, ...]]:
+    """`images` images in chains of `depth`, every thousandth one a collector.
+
+    A chain link is built on the image before it. A collector copies artifacts
+    out of `fan_in` earlier images chosen at random, which is the shape of
+    `code-server-full` multiplied.
+    """
+    rng = random.Random(seed)
+    graph: dict[str, tuple[Dependency, ...]] = {}
+    for index in range(images):
+        found: list[Dependency] = []
+        if index % depth:
+            found.append(Dependency(image=name_of(index - 1), usage=Usage.BASE, argument="BASE"))
+        if index % 1000 == 999:
+            found.extend(
+                Dependency(image=name_of(source), usage=Usage.ARTIFACT, argument=f"DEP_{n}")
+                for n, source in enumerate(rng.sample(range(index), min(fan_in, index)))
+            )
+        graph[name_of(index)] = tuple(found)
+    return graph
+
+
+def dockerfile(found: tuple[Dependency, ...]) -> str:
+    """A Dockerfile declaring exactly `found`, in the form the parser reads."""
+    lines: list[str] = []
+    base: Dependency | None = None
+    for dependency in found:
+        if dependency.usage is Usage.BASE:
+            base = dependency
+            continue
+        lines.append(f"ARG {dependency.argument}={REGISTRY}:{dependency.image}")
+        lines.append(f"FROM ${{{dependency.argument}}} AS {dependency.argument.lower()}")
+    if base is None:
+        lines.append("FROM scratch")
+    else:
+        lines.append(f"ARG {base.argument}={REGISTRY}:{base.image}")
+        lines.append(f"FROM ${{{base.argument}}}")
+    lines.extend(
+        f"COPY --from={dependency.argument.lower()} /out /in/{dependency.image}"
+        for dependency in found
+        if dependency.usage is Usage.ARTIFACT
+    )
+    lines.append("RUN true")
+    return "\n".join(lines) + "\n"
+
+
+def write_tree(root: Path, graph: Mapping[str, tuple[Dependency, ...]]) -> Mapping[str, Path]:
+    """Writes one `<image>/Dockerfile` per image; returns discovery's mapping."""
+    definitions: dict[str, Path] = {}
+    for image, found in graph.items():
+        directory = root / image
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / "Dockerfile").write_text(dockerfile(found), encoding="utf-8")
+        definitions[image] = Path(image) / "Dockerfile"
+    return definitions
@@ -2,10 +2,11 @@
 
 """Entry point: build this worker's share, stealing from peers when idle.
 
-A thin imperative shell. It acquires the resources the mesh needs -- HTTP
-clients, a verified cloudflared, a quick tunnel, a listening endpoint -- as
-nested scopes, so every one of them is released on every exit path, then hands
-control to the scheduler.
+A thin imperative shell. It provisions the runner -- disk, clean egress,
+cloudflared, BuildKit -- as concurrent stages (see `ci.provisioning`), acquires
+the resources the mesh needs -- HTTP clients, a quick tunnel, a listening
+endpoint -- as nested scopes, so every one of them is released on every exit
+path, then hands control to the scheduler once the builds' prerequisites are in.
 """
 
 from __future__ import annotations
@@ -13,18 +14,25 @@ from __future__ import annotations
 import logging
 import os
 import sys
+import threading
+import time
+from collections.abc import Callable
 from contextlib import ExitStack
 from functools import partial
 
 import httpx
 
-from ci.docker import build_and_push, free_disk_space
+from ci import timeline
+from ci.bases import NOTHING_WARMED, start_mirror, warm_share
+from ci.disk import DiskGovernor, Watermarks
+from ci.docker import build_and_push, free_disk_space, warm_builder
 from ci.domain import (
     BuildFailed,
     BuildOutcome,
     BuildSucceeded,
     Installed,
     InstallFailed,
+    InstallOutcome,
     Platform,
     Task,
     TunnelReady,
@@ -32,8 +40,11 @@ from ci.domain import (
 )
 from ci.env import (
     COUNT,
+    FLAG,
+    GIBIBYTES,
     INDEX,
     JSON_ARRAY,
+    NAME_LIST,
     OPTIONAL_TEXT,
     TEXT,
     BuildIdentity,
@@ -42,16 +53,40 @@ from ci.env import (
     write_summary,
 )
 from ci.logs import configure
+from ci.manifests import IncrementalFusion
 from ci.mesh import MeshClient, Rendezvous, SoloMesh, derive_run_key, serve_mesh
+from ci.persisted import configured_path
+from ci.provenance import ResolutionCache
+from ci.provisioning import Provisioning, Stage
 from ci.report import outcome_rows, provenance_section
 from ci.scheduling import TaskQueue, run_worker
 from ci.tunnel import quick_tunnel, resolve_binary
 from ci.utilisation import effective_parallelism, intervals_of, peak_concurrency
+from setup_egress import provision as provision_egress
 
 logger = logging.getLogger("ci.worker")
 
+_NOT_PROVISIONED: InstallOutcome = InstallFailed("cloudflared provisioning raised")
+
 GITHUB_API = "https://api.github.com"
 
+# How long builds wait for clean egress before starting on the runner's own
+# path: the bound `timeout-minutes` gave it as a step of its own. Provisioning
+# is two API calls and a process launch, so anything past this is stuck.
+EGRESS_DEADLINE_SECONDS = 180.0
+
+# How long builds wait for the Docker Hub mirror before creating builders that
+# pull from Hub directly. One small image to pull and a container to start.
+MIRROR_DEADLINE_SECONDS = 90.0
+
+
+def memory_bytes() -> int:
+    """The runner's physical memory, for the capacity history; 0 if unknowable."""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError):
+        return 0
+
 
 def summarise(
     worker_id: int, outcomes: tuple[BuildOutcome, ...], dealt: frozenset[str], slots: int
@@ -92,7 +127,6 @@ def summarise(
 
 def main() -> int:
     configure()
-    free_disk_space()
 
     identity = BuildIdentity.from_environment()
     worker_id = read("WORKER_ID", INDEX)
@@ -143,19 +177,109 @@ def main() -> int:
     slots = read("BUILD_SLOTS", COUNT, default=detected)
     logger.info("Using %d build slot(s) (runner reports %d CPU(s))", slots, detected)
 
+    # The one-off cleanup above buys a starting margin; this keeps it. Below
+    # the low mark idle builders are pruned, and new builds wait until the
+    # high mark is restored. Defaults sized for a hosted runner after cleanup,
+    # where one of the larger images can write several GiB on its own.
+    try:
+        watermarks = Watermarks.gibibytes(
+            low=read("DISK_LOW_WATERMARK_GIB", GIBIBYTES, default=10),
+            high=read("DISK_HIGH_WATERMARK_GIB", GIBIBYTES, default=20),
+        )
+    except ValueError as error:
+        logger.error("Disk watermarks are inconsistent: %s", error)
+        return 1
+    governor = DiskGovernor(watermarks)
+
+    # Started only once the configuration is known to be good, so a worker that
+    # is going to exit 1 does not leave apt half-way through a purge. Nothing
+    # below waits on a stage until it needs what that stage provides.
+    provisioning = Provisioning()
+    disk = provisioning.start("disk cleanup", free_disk_space, fallback=None)
+    egress: Stage[dict[str, str]] = provisioning.start(
+        "clean egress", provision_egress, fallback={}, deadline_seconds=EGRESS_DEADLINE_SECONDS
+    )
+    # Awaited by nothing: a build whose builder boots first pulls the image
+    # itself, and the daemon folds the two pulls into one.
+    provisioning.start("BuildKit image", warm_builder, fallback=None)
+    # The mirror is awaited with egress, so no builder is created without it
+    # that could have had it; its warm-up is awaited by nothing, and the first
+    # builds pull through the mirror alongside it.
+    mirror: Stage[dict[str, str]] = provisioning.start(
+        "Docker Hub mirror", start_mirror, fallback={}, deadline_seconds=MIRROR_DEADLINE_SECONDS
+    )
+    provisioning.start(
+        "base images",
+        partial(warm_share, tasks, platform, mirror.wait),
+        fallback=NOTHING_WARMED,
+        needs=(mirror,),
+    )
+    cloudflared = (
+        provisioning.start(
+            "cloudflared", partial(resolve_binary, platform), fallback=_NOT_PROVISIONED
+        )
+        if repository_secret
+        else None
+    )
+
+    def prerequisites() -> None:
+        """Blocks until builds may start: disk freed and egress published."""
+        disk.wait()
+        # In this process rather than `$GITHUB_ENV`: the builds that read
+        # BUILD_PROXY_URL run here, and a later step has no use for it.
+        os.environ.update(egress.wait())
+        os.environ.update(mirror.wait())
+        write_summary([f"### Worker {worker_id}: provisioning", "", *provisioning.summary()])
+
     # The run's identity is fixed before any task is dealt, so it is bound once
     # here rather than threaded through the scheduler: `run_worker` needs a
     # `Task -> BuildOutcome`, and partial application is what turns the
-    # two-argument builder into exactly that without inventing a wrapper.
-    build = partial(build_and_push, identity=identity)
+    # builder into exactly that without inventing a wrapper.
+    #
+    # One provenance cache for every slot: siblings dealt to this worker share
+    # their dependencies, and each would otherwise inspect them separately.
+    lookup = ResolutionCache()
+    build: Callable[[Task], BuildOutcome] = partial(
+        build_and_push, identity=identity, governor=governor, lookup=lookup
+    )
+    # Opt-in: whichever worker finishes an image's last platform fuses its batch
+    # manifest there and then. See `ci.manifests` for why only that tag.
+    if read("INCREMENTAL_MANIFESTS", FLAG, default=False):
+        architectures = read_json("PLATFORMS", NAME_LIST)
+        fusion = IncrementalFusion(
+            identity, tuple(filter(None, map(Platform.parse, architectures)))
+        )
+        build = fusion.around(build)
+
+    # Each successful steal's wait, for the run timeline. Appended from the
+    # slot threads, hence the lock.
+    steal_waits: list[float] = []
+    waits_lock = threading.Lock()
+
+    def stole_after(seconds: float) -> None:
+        with waits_lock:
+            steal_waits.append(seconds)
+
+    # One reading of each clock, so the outcomes' monotonic starts can be placed
+    # on the wall clock the other workers' timelines share.
+    offset = time.time() - time.monotonic()
+    began = time.time()
 
-    if not repository_secret:
+    if cloudflared is None:
         logger.warning(
             "MESH_SECRET is not configured; work stealing is disabled and this "
             "worker will build only the %d task(s) it was dealt.",
             len(tasks),
         )
-        outcomes = run_worker(queue=queue, mesh=SoloMesh(), execute=build, slots=slots)
+        prerequisites()
+        outcomes = run_worker(
+            queue=queue,
+            mesh=SoloMesh(),
+            execute=build,
+            slots=slots,
+            admit=governor.admit,
+            on_steal=stole_after,
+        )
     else:
         with ExitStack() as scope:
             github = scope.enter_context(
@@ -184,7 +308,7 @@ def main() -> int:
             # Joining the mesh is best-effort throughout. Every failure below
             # leaves the worker building the share it was dealt, which is the
             # whole point of dealing disjointly in the first place.
-            match resolve_binary(platform):
+            match cloudflared.wait():
                 case Installed(path, version):
                     logger.info("Using cloudflared %s", version)
                     match scope.enter_context(quick_tunnel(path, port)):
@@ -195,9 +319,40 @@ def main() -> int:
                 case InstallFailed(reason):
                     logger.warning("cloudflared unavailable (%s); building solo", reason)
 
-            outcomes = run_worker(queue=queue, mesh=client, execute=build, slots=slots)
+            prerequisites()
+            outcomes = run_worker(
+                queue=queue,
+                mesh=client,
+                execute=build,
+                slots=slots,
+                admit=governor.admit,
+                on_steal=stole_after,
+            )
+
+    finished = time.time()
 
     summarise(worker_id, outcomes, dealt, slots)
+    # Optional, like the caches: without TIMELINE_FILE the run-wide report has
+    # one worker fewer to describe, and nothing else changes.
+    timeline_path = configured_path(read("TIMELINE_FILE", OPTIONAL_TEXT, default=""))
+    if timeline_path is not None:
+        timeline.save(
+            timeline_path,
+            timeline.WorkerTimeline(
+                worker=f"{platform}/{worker_id}",
+                platform=str(platform),
+                slots=slots,
+                began=began,
+                finished=finished,
+                spans=timeline.spans_of(outcomes, dealt, offset),
+                steal_waits=tuple(steal_waits),
+                cpus=detected,
+                memory_bytes=memory_bytes(),
+            ),
+        )
+    logger.info(
+        "Provenance lookups: %d answered from cache, %d inspected.", lookup.hits, lookup.misses
+    )
 
     failures = tuple(outcome for outcome in outcomes if isinstance(outcome, BuildFailed))
     successes = tuple(outcome for outcome in outcomes if isinstance(outcome, BuildSucceeded))
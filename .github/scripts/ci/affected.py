@@ -0,0 +1,142 @@
+"""Which images a change can have affected, read off the git diff.
+
+Every run planned every image for every platform, so a commit touching one
+Dockerfile queued sixty builds to change two of them. This module narrows a
+plan to the images whose inputs changed, and to everything that consumes them,
+transitively -- a rebuilt base that its consumers were not rebuilt on would be
+exactly the skew the provenance labels exist to expose.
+
+*Narrowing is an optimisation, never a correctness condition.* Whenever the
+diff cannot be trusted to describe what changed, the answer is everything:
+a base commit git cannot find, a diff that fails, a change to the orchestration
+itself. Scheduled runs are not given a base at all, so they still rebuild the
+whole tree and pick up whatever moved upstream.
+
+The mapping is pure and the git call is its only effect, the split the rest of
+`ci` uses, so which images a path implicates is testable without a repository.
+"""
+
+from __future__ import annotations
+
+import logging
+import subprocess
+from collections import deque
+from collections.abc import Iterable, Mapping, Sequence
+from dataclasses import dataclass
+from pathlib import PurePosixPath
+
+from ci.discovery import IGNORE_FILE
+from ci.domain import Task
+
+logger = logging.getLogger("ci.affected")
+
+# A change under any of these can alter how every image is built or tagged, so
+# none of them can be attributed to particular images. The discovery ignore file
+# is among them because editing it can add or remove images outright.
+_EVERYTHING_UNDER = (".github/",)
+_EVERYTHING_AT = (IGNORE_FILE,)
+
+# What `github.event.before` holds for a push that created its branch: there is
+# no previous commit, so there is nothing to diff against.
+_NO_COMMIT = "0" * 40
+
+
+@dataclass(frozen=True, slots=True)
+class Everything:
+    """Plan the whole tree, and why."""
+
+    reason: str
+
+
+@dataclass(frozen=True, slots=True)
+class Only:
+    """Plan these images: the changed ones and every consumer of them."""
+
+    images: frozenset[str]
+    changed: frozenset[str]
+
+
+Scope = Everything | Only
+
+
+def _owners(path: str, tasks: Sequence[Task]) -> frozenset[str]:
+    """The images whose Dockerfile is `path` or whose context contains it.
+
+    The context is the build's whole input besides the Dockerfile, so any file
+    inside it may be `COPY`ed, and a change to one is a change to the image. A
+    context at the root contains every path there is.
+    """
+    within = PurePosixPath(path)
+    return frozenset(
+        task.image
+        for task in tasks
+        if path == task.dockerfile
+        or task.context in ("", ".")
+        or within.is_relative_to(PurePosixPath(task.context))
+    )
+
+
+def _consumers(images: Iterable[str], tasks: Sequence[Task]) -> frozenset[str]:
+    """`images` and everything that consumes them, however indirectly."""
+    dependents: Mapping[str, tuple[str, ...]] = {task.image: task.dependents for task in tasks}
+    reached = set(images)
+    pending = deque(reached)
+    while pending:
+        for consumer in dependents.get(pending.popleft(), ()):
+            if consumer not in reached:
+                reached.add(consumer)
+                pending.append(consumer)
+    return frozenset(reached)
+
+
+def scope(changed: Sequence[str], tasks: Sequence[Task]) -> Scope:
+    """The images a set of changed paths can have affected. Pure and total.
+
+    A path no image owns -- a README, the licence -- affects nothing. A deleted
+    image's Dockerfile is such a path too, since no task names it any longer,
+    and there is nothing left to build for it.
+    """
+    for path in changed:
+        if path.startswith(_EVERYTHING_UNDER) or path in _EVERYTHING_AT:
+            return Everything(f"{path} changes how every image is built")
+
+    direct = frozenset(image for path in changed for image in _owners(path, tasks))
+    return Only(images=_consumers(direct, tasks), changed=direct)
+
+
+def changed_since(base: str, root: str = ".") -> tuple[str, ...] | None:
+    """The paths that differ between `base` and HEAD, or absence if git cannot say.
+
+    Three dots would ask for the merge base; two are right here, because `base`
+    is what the branch pointed at before this push, so the diff is exactly what
+    the push brought in, whatever its shape.
+    """
+    try:
+        completed = subprocess.run(
+            ("git", "-C", root, "diff", "--name-only", "--no-renames", base, "HEAD"),
+            capture_output=True,
+            text=True,
+            check=False,
+            timeout=60,
+        )
+    except (OSError, subprocess.SubprocessError) as error:
+        logger.warning("Could not diff against %s: %s", base, error)
+        return None
+    if completed.returncode != 0:
+        logger.warning("Could not diff against %s: %s", base, completed.stderr.strip())
+        return None
+    return tuple(line for line in completed.stdout.splitlines() if line)
+
+
+def plan_scope(base: str, tasks: Sequence[Task], root: str = ".") -> Scope:
+    """The scope of a run based on `base`, degrading to everything on any doubt.
+
+    `--no-renames` above is what keeps a move honest: it is reported as a deletion
+    and an addition, and the addition is the path an image now owns.
+    """
+    if not base.strip() or base == _NO_COMMIT:
+        return Everything("no base commit to compare against")
+    changed = changed_since(base, root)
+    if changed is None:
+        return Everything(f"the diff against {base[:12]} could not be read")
+    return scope(changed, tasks)
@@ -0,0 +1,219 @@
+"""Learning which upstreams blackhole the runner's address, from mihomo's own log.
+
+`_PROXIED_DOMAINS` holds only domains observed to fail, and so far the observer
+was a person reading a nine-minute apt stall after the fact. mihomo already sees
+every connection a build makes through it, and logs each DIRECT dial that times
+out. This module reads that log at the end of each job and keeps a persisted
+list of candidates: hosts whose direct connections timed out repeatedly, with
+the number of jobs that saw it happen.
+
+A candidate is adopted -- rendered into the allowlist beside the hand-written
+entries -- once it has failed in `ADOPT_AFTER_JOBS` separate jobs. One job is
+not enough. A single upstream outage would otherwise move a host onto WARP for
+good, and the allowlist's whole argument is that only hosts actually failing
+belong on it. A candidate no job has seen fail for `FORGET_AFTER_DAYS` is
+dropped, which is how a host that recovers leaves the list.
+
+An adopted host cannot be seen failing by the log: its connections go through
+WARP, so it stops producing DIRECT timeouts the moment it is adopted. Left to
+the log alone, every adopted host would be forgotten on schedule whether or not
+it had recovered, stall the next two jobs, and be adopted again -- a fortnightly
+flap. So each job also dials every adopted host directly, outside the proxy, and
+one whose dial still times out has its `last_seen` refreshed. An adopted host is
+therefore dropped `FORGET_AFTER_DAYS` after the last job that found it still
+blackholed, which is the same rule a host on the DIRECT path is held to.
+
+*One writer.* Every build worker and reconcile job sees its own timeouts, and a
+cache entry restores one of them: had each job saved the candidates it had
+updated, the newest would have overwritten every sibling's sightings, and a
+host failing on every runner of a run would have counted as one job. So a job
+records only a `Sighting` -- what it saw, and nothing it was told -- and one job
+at the end of the run folds every sighting into the candidates and saves them.
+
+Policy, because what gets routed through a tunnel should not change without
+anyone choosing it. EGRESS_LEARNING is:
+
+- `off`: nothing is read or adopted;
+- `observe`: candidates are recorded, reported, and not adopted (the default);
+- `adopt`: candidates past the threshold join the allowlist.
+
+Some hosts are never adopted however they fail: the registries whose terms
+depend on the runner's own address. See `_NEVER_PROXIED`.
+
+The parsing and the bookkeeping are pure; the log and the document are read and
+written by the entry scripts.
+"""
+
+from __future__ import annotations
+
+import datetime
+import ipaddress
+import re
+from collections import Counter
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass
+from enum import StrEnum
+from pathlib import Path
+
+from pydantic import TypeAdapter
+
+from ci import persisted
+
+# Timeouts one job must see for a host before it counts as a sighting. A single
+# timeout is a slow server; several is the retransmit budget being spent.
+TIMEOUTS_PER_SIGHTING = 3
+
+ADOPT_AFTER_JOBS = 2
+
+FORGET_AFTER_DAYS = 14
+
+# Hosts whose terms key on the source address: Docker Hub waives its pull limits
+# for GitHub-hosted runners by IP, and a tunnelled pull lands in the anonymous
+# bucket instead. GHCR and GitHub are the push path and the control plane, which
+# `ci.egress` keeps off the proxy altogether. A timeout against any of these is
+# for someone to look at, not for a tunnel to hide.
+_NEVER_PROXIED: tuple[str, ...] = (
+    "docker.io",
+    "docker.com",
+    "ghcr.io",
+    "github.com",
+    "githubusercontent.com",
+)
+
+# A DIRECT dial that timed out, as mihomo logs it at `warning`:
+#   [TCP] dial DIRECT (match Match/) 172.17.0.2:50112 --> ppa.launchpadcontent.net:443
+#   error: dial tcp 185.125.190.80:443: i/o timeout
+# Only DIRECT: a timeout through WARP is the watchdog's business, not evidence
+# about the runner's own path.
+_DIRECT_TIMEOUT = re.compile(
+    r"dial DIRECT \(.*?\) \S+ --> (?P<host>[^\s:]+):\d+ error: "
+    r".*(?:i/o timeout|connection timed out|deadline exceeded)",
+    re.IGNORECASE,
+)
+
+
+class Learning(StrEnum):
+    OFF = "off"
+    OBSERVE = "observe"
+    ADOPT = "adopt"
+
+
+LEARNING: TypeAdapter[Learning] = TypeAdapter(Learning)
+
+
+@dataclass(frozen=True, slots=True)
+class Candidate:
+    """How many jobs saw a host's direct connections time out, and when last."""
+
+    jobs: int
+    last_seen: datetime.date
+
+
+Candidates = Mapping[str, Candidate]
+
+_CANDIDATES: TypeAdapter[dict[str, Candidate]] = TypeAdapter(dict[str, Candidate])
+
+
+def _eligible(host: str) -> bool:
+    """A name, not an address, and not one of the hosts that must stay direct."""
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        pass
+    else:
+        return False
+    return "." in host and not any(
+        host == kept or host.endswith(f".{kept}") for kept in _NEVER_PROXIED
+    )
+
+
+def direct_timeouts(lines: Iterable[str]) -> Counter[str]:
+    """Timed-out DIRECT dials per eligible host, from mihomo's log lines."""
+    found = (_DIRECT_TIMEOUT.search(line) for line in lines)
+    hosts = (match["host"].lower().rstrip(".") for match in found if match is not None)
+    return Counter(host for host in hosts if _eligible(host))
+
+
+def observed(
+    candidates: Candidates,
+    timeouts: Mapping[str, int],
+    today: datetime.date,
+    still_failing: Iterable[str] = (),
+) -> dict[str, Candidate]:
+    """The candidates after one job's timeouts, with stale entries forgotten. Pure.
+
+    `still_failing` are adopted hosts this job's direct probe found blackholed.
+    They are seen again without counting as a new sighting: the count is of jobs
+    whose builds the host stalled, and a probe stalls nothing.
+    """
+    refreshed = dict(candidates)
+    for host in still_failing:
+        if host in refreshed:
+            refreshed[host] = Candidate(jobs=refreshed[host].jobs, last_seen=today)
+    updated = {
+        host: candidate
+        for host, candidate in refreshed.items()
+        if (today - candidate.last_seen).days <= FORGET_AFTER_DAYS
+    }
+    for host, count in timeouts.items():
+        if count >= TIMEOUTS_PER_SIGHTING:
+            earlier = updated.get(host)
+            updated[host] = Candidate(jobs=(earlier.jobs if earlier else 0) + 1, last_seen=today)
+    return updated
+
+
+def adopted(candidates: Candidates, learning: Learning) -> tuple[str, ...]:
+    """The hosts to route through WARP on top of the hand-written allowlist."""
+    if learning is not Learning.ADOPT:
+        return ()
+    return tuple(
+        sorted(
+            host
+            for host, candidate in candidates.items()
+            if candidate.jobs >= ADOPT_AFTER_JOBS and _eligible(host)
+        )
+    )
+
+
+@dataclass(frozen=True, slots=True)
+class Sighting:
+    """What one job saw: its DIRECT timeouts, and adopted hosts still blackholed."""
+
+    day: datetime.date
+    timeouts: dict[str, int]
+    still_failing: tuple[str, ...] = ()
+
+
+_SIGHTING: TypeAdapter[Sighting | None] = TypeAdapter(Sighting | None)
+
+
+def folded(candidates: Candidates, sightings: Iterable[Sighting]) -> dict[str, Candidate]:
+    """The candidates after every job of a run, oldest day first. Pure.
+
+    Each sighting is a job, so a host several jobs saw failing gains a job for
+    each of them, as it would have had they run one after another.
+    """
+    updated = dict(candidates)
+    for sighting in sorted(sightings, key=lambda sighting: sighting.day):
+        updated = observed(updated, sighting.timeouts, sighting.day, sighting.still_failing)
+    return updated
+
+
+def save_sighting(path: Path, sighting: Sighting) -> None:
+    persisted.save(path, _SIGHTING, sighting)
+
+
+def load_sightings(directory: Path) -> tuple[Sighting, ...]:
+    """Every job's sighting under `directory`, skipping any that will not parse."""
+    found = (
+        persisted.load(path, _SIGHTING, None) for path in sorted(directory.glob("**/*.json"))
+    )
+    return tuple(sighting for sighting in found if sighting is not None)
+
+
+def load(path: Path) -> dict[str, Candidate]:
+    return persisted.load(path, _CANDIDATES, {})
+
+
+def save(path: Path, candidates: Candidates) -> None:
+    persisted.save(path, _CANDIDATES, dict(candidates))
@@ -13,7 +13,16 @@ Two properties hold on every path, and both are load-bearing:
 substituted asset is rejected without ever being handed to a decompressor. A gzip
 decoder is a far larger attack surface than a hash function, and running one over
 unverified input to find out whether the input was trustworthy has the order
-backwards.
+backwards. That is also why the digest is computed as the bytes arrive but the
+decompression is not: hashing in the same pass saves a full re-read for free,
+whereas decoding in it would mean decoding before the verdict.
+
+*Resume rather than restart.* A dropped connection leaves its bytes in the
+`.download` partial, and the next attempt asks for only the rest with an HTTP
+Range request. A server that answers 206 from the right offset is appended to;
+one that answers 200 has ignored the range and is taken from byte zero. Nothing
+about the partial is trusted: the digest still covers every byte, old and new,
+and a mismatch discards the partial along with the verdict.
 
 *Install atomically, or not at all.* The executable bit is set on a proven file
 which is then `replace`d into position -- one rename, so no observer sees a
@@ -34,14 +43,21 @@ import hashlib
 import logging
 import shutil
 import stat
-from collections.abc import Iterator
+import time
+from collections.abc import Callable, Iterator
 from contextlib import contextmanager
+from dataclasses import dataclass
 from enum import StrEnum
 from pathlib import Path
+from typing import TYPE_CHECKING
 
 import httpx
 
 from ci.domain import Installed, InstallFailed, InstallOutcome
+from ci.retry import backoff_seconds
+
+if TYPE_CHECKING:
+    from _hashlib import HASH
 
 logger = logging.getLogger("ci.assets")
 
@@ -49,6 +65,21 @@ logger = logging.getLogger("ci.assets")
 # enough that nothing is ever held in memory whole.
 _CHUNK_BYTES = 1 << 20
 
+# Connections one install will resume across before it gives up on the asset.
+# A partial left by the last of them is still resumed by the next install.
+_DOWNLOAD_ATTEMPTS = 3
+
+# The pause before a retry grows from about a second and is capped well short of
+# `with_retries`' minute: an asset download is on a provisioning step's critical
+# path, and three attempts are all it gets.
+_RETRY_DELAY_SECONDS = 1.0
+_RETRY_DELAY_CAP_SECONDS = 10.0
+
+# Client errors that say "not now" rather than "never". Every other 4xx -- a
+# pinned release that was deleted, a URL that is wrong -- answers the same way
+# on every attempt, so retrying it only delays the failure.
+_TRANSIENT_CLIENT_ERRORS = frozenset({408, 429})
+
 
 class Encoding(StrEnum):
     """How the published asset is packaged. Closed: these are the two we fetch."""
@@ -108,17 +139,103 @@ def _staging(*paths: Path) -> Iterator[None]:
             path.unlink(missing_ok=True)
 
 
-def _download(url: str, destination: Path, timeout_seconds: float) -> str | None:
-    """Streams `url` to `destination`. Returns a reason on failure, None on success."""
+@dataclass(frozen=True, slots=True)
+class _Fetched:
+    """A complete download: the SHA-256 of every byte in it, old and new."""
+
+    digest: str
+    # Whether any of those bytes came from an earlier attempt.
+    resumed: bool
+
+
+def _already_written(partial: Path) -> tuple[HASH, int]:
+    """The running digest of an earlier attempt's bytes, and how many there were.
+
+    Read once, and only when there is a partial to resume: the price of picking
+    the hash up where the dropped connection left it.
+    """
+    digest = hashlib.sha256()
+    written = 0
     try:
-        with httpx.stream("GET", url, follow_redirects=True, timeout=timeout_seconds) as response:
-            response.raise_for_status()
-            with destination.open("wb") as handle:
-                for chunk in response.iter_bytes(_CHUNK_BYTES):
-                    handle.write(chunk)
-    except (httpx.HTTPError, OSError) as error:
-        return f"download failed: {error}"
-    return None
+        with partial.open("rb") as handle:
+            while chunk := handle.read(_CHUNK_BYTES):
+                digest.update(chunk)
+                written += len(chunk)
+    except FileNotFoundError:
+        pass
+    return digest, written
+
+
+def _continues(response: httpx.Response, offset: int) -> bool:
+    """Whether a response carries the asset from exactly `offset` onwards."""
+    return response.status_code == 206 and response.headers.get(
+        "content-range", ""
+    ).startswith(f"bytes {offset}-")
+
+
+def _fetch(url: str, partial: Path, timeout_seconds: float) -> _Fetched:
+    """One connection's worth of download, hashed as it is written. Raises on failure."""
+    digest, offset = _already_written(partial)
+    if offset:
+        logger.info("Resuming %s from byte %d", partial.name, offset)
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    with httpx.stream(
+        "GET", url, headers=headers, follow_redirects=True, timeout=timeout_seconds
+    ) as response:
+        if offset and response.status_code == 416:
+            # Nothing left to send: an earlier attempt finished the transfer and
+            # failed after it. The digest decides whether the partial is whole.
+            return _Fetched(digest=digest.hexdigest(), resumed=True)
+        response.raise_for_status()
+        resumed = offset > 0 and _continues(response, offset)
+        if not resumed:
+            digest = hashlib.sha256()
+        with partial.open("ab" if resumed else "wb") as handle:
+            for chunk in response.iter_bytes(_CHUNK_BYTES):
+                digest.update(chunk)
+                handle.write(chunk)
+    return _Fetched(digest=digest.hexdigest(), resumed=resumed)
+
+
+def _is_permanent(error: Exception) -> bool:
+    """Whether the server has refused in a way another attempt cannot change."""
+    if not isinstance(error, httpx.HTTPStatusError):
+        return False
+    status = error.response.status_code
+    return 400 <= status < 500 and status not in _TRANSIENT_CLIENT_ERRORS
+
+
+def _download(
+    url: str,
+    partial: Path,
+    timeout_seconds: float,
+    sleep: Callable[[float], None] = time.sleep,
+) -> _Fetched | InstallFailed:
+    """Streams `url` into `partial`, resuming across dropped connections.
+
+    Attempts are spaced by jittered backoff, so a blip at the host is waited
+    out rather than met with three connections in the same second. A refusal
+    that no retry could change fails at once.
+    """
+    reason = "no attempt was made"
+    for attempt in range(1, _DOWNLOAD_ATTEMPTS + 1):
+        try:
+            return _fetch(url, partial, timeout_seconds)
+        except (httpx.HTTPError, OSError) as error:
+            reason = str(error)
+            if _is_permanent(error):
+                logger.warning("Download of %s refused: %s", url, error)
+                break
+            logger.warning(
+                "Download of %s failed (attempt %d/%d): %s",
+                url,
+                attempt,
+                _DOWNLOAD_ATTEMPTS,
+                error,
+            )
+        if attempt < _DOWNLOAD_ATTEMPTS:
+            sleep(backoff_seconds(attempt, _RETRY_DELAY_SECONDS, _RETRY_DELAY_CAP_SECONDS))
+    return InstallFailed(f"download failed: {reason}")
 
 
 def _decode(source: Path, destination: Path, encoding: Encoding) -> str | None:
@@ -146,6 +263,7 @@ def install(
     encoding: Encoding = Encoding.RAW,
     version: str = "pinned",
     timeout_seconds: float = 180.0,
+    sleep: Callable[[float], None] = time.sleep,
 ) -> InstallOutcome:
     """Fetches, verifies, and installs one pinned executable.
 
@@ -162,27 +280,44 @@ def install(
     download = destination.with_suffix(".download")
     staged = destination.with_suffix(".partial")
 
-    with _staging(download, staged):
-        if (failure := _download(url, download, timeout_seconds)) is not None:
-            return InstallFailed(failure)
+    with _staging(staged):
+        fetched = _download(url, download, timeout_seconds, sleep)
+        if isinstance(fetched, InstallFailed):
+            # The partial is kept, unless empty: it is what the next attempt
+            # resumes from, and it is never executed or decoded unverified.
+            if download.exists() and download.stat().st_size == 0:
+                download.unlink()
+            return fetched
+
+        if fetched.digest != expected_digest and fetched.resumed:
+            # The bytes resumed onto may have been another version's. One clean
+            # download settles whether the asset itself is wrong.
+            logger.warning("Resumed download of %s did not verify; fetching it whole.", url)
+            download.unlink(missing_ok=True)
+            fetched = _download(url, download, timeout_seconds, sleep)
+            if isinstance(fetched, InstallFailed):
+                download.unlink(missing_ok=True)
+                return fetched
+
+        with _staging(download):
+            # Before decompression, before chmod, before anything is moved into
+            # a path something else will execute.
+            if fetched.digest != expected_digest:
+                return InstallFailed(
+                    f"digest mismatch: expected {expected_digest}, got {fetched.digest}"
+                )
+
+            if (failure := _decode(download, staged, encoding)) is not None:
+                return InstallFailed(failure)
 
-        # Before decompression, before chmod, before anything is moved into a
-        # path something else will execute.
-        actual = digest_of(download)
-        if actual != expected_digest:
-            return InstallFailed(f"digest mismatch: expected {expected_digest}, got {actual}")
-
-        if (failure := _decode(download, staged, encoding)) is not None:
-            return InstallFailed(failure)
-
-        try:
-            staged.chmod(staged.stat().st_mode | stat.S_IEXEC | stat.S_IXGRP | stat.S_IXOTH)
-            staged.replace(destination)
-            # Written only after the binary is in place, so a stamp can never
-            # vouch for a file that was never installed.
-            _stamp_of(destination).write_text(expected_digest, encoding="utf-8")
-        except OSError as error:
-            return InstallFailed(f"could not install the verified binary: {error}")
+            try:
+                staged.chmod(staged.stat().st_mode | stat.S_IEXEC | stat.S_IXGRP | stat.S_IXOTH)
+                staged.replace(destination)
+                # Written only after the binary is in place, so a stamp can never
+                # vouch for a file that was never installed.
+                _stamp_of(destination).write_text(expected_digest, encoding="utf-8")
+            except OSError as error:
+                return InstallFailed(f"could not install the verified binary: {error}")
 
     logger.info("Installed %s %s (digest verified)", destination.name, version)
     return Installed(path=destination, version=version)
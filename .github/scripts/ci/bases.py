@@ -0,0 +1,321 @@
+"""The external bases a worker's share pulls, fetched once into a local mirror.
+
+Every build runs in a builder of its own, and a docker-container builder keeps
+its own content store: it sees nothing the daemon has pulled and nothing a
+sibling builder has. So `alpine:3.21`, the base of several images, was fetched
+from Docker Hub once per build that used it, often by several slots in the
+same minute, and every one of those fetches counted against the runner's pull
+allowance and waited on the same bytes.
+
+The worker now starts a pull-through registry on the docker bridge and points
+every builder's `docker.io` at it through a buildkitd configuration. The first
+fetch of a layer goes upstream and is kept; every later one, from any builder
+on the runner, is served locally. Alongside the first builds, a warm-up walks
+the share's Dockerfiles -- `references.bases_in`, the external half of the same
+parse the graph is read from -- and pulls each distinct base through the mirror
+for this worker's platform with bounded concurrency, so the builds that reach a
+base later find it already there.
+
+Nothing here is load-bearing. BuildKit falls back to the upstream registry when
+a mirror refuses or is absent, so a mirror that never starts costs exactly the
+fetches it would have saved; a base that fails to warm is fetched by its build,
+as before. Only Docker Hub is mirrored: a registry proxy fronts one upstream,
+and Hub is both where nearly every base here lives and the one that limits
+pulls. `lscr.io` and `ghcr.io` bases are still fetched directly.
+"""
+
+from __future__ import annotations
+
+import logging
+import subprocess
+import tempfile
+import time
+from collections.abc import Callable, Iterable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+import httpx
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+from ci.domain import Platform, Task
+from ci.egress import bridge_address
+from ci.references import bases_in
+
+logger = logging.getLogger("ci.bases")
+
+# Read by `build_and_push`, which hands it to `buildx create`. An environment
+# variable for the reason the proxy is one: it describes the runner a build
+# lands on, so a stolen task picks up its thief's mirror.
+CONFIG_VARIABLE = "BUILDKITD_CONFIG"
+# Where the warm-up finds the mirror; unset when there is none.
+MIRROR_VARIABLE = "BASE_MIRROR"
+
+MIRROR_PORT = 5000
+
+# Bases pulled at once. Enough to keep the link busy while one manifest round
+# trip is outstanding, few enough not to contend with the first builds' own
+# pulls for the same bandwidth.
+PREFETCH_CONCURRENCY = 4
+
+_MIRROR_NAME = "base-mirror"
+_MIRROR_IMAGE = "registry:2"
+_UPSTREAM = "https://registry-1.docker.io"
+_START_TIMEOUT_SECONDS = 120
+_READY_SECONDS = 30.0
+_READY_POLL_SECONDS = 0.5
+
+_HUB_HOSTS = frozenset({"docker.io", "index.docker.io", "registry-1.docker.io"})
+
+# Indexes first, so a multi-platform image answers with its index and the
+# platform is chosen here rather than by the mirror.
+_ACCEPT = ", ".join(
+    (
+        "application/vnd.oci.image.index.v1+json",
+        "application/vnd.docker.distribution.manifest.list.v2+json",
+        "application/vnd.oci.image.manifest.v1+json",
+        "application/vnd.docker.distribution.manifest.v2+json",
+    )
+)
+
+
+# --- which bases, and whether the mirror can serve them ---------------------
+
+
+@dataclass(frozen=True, slots=True)
+class HubImage:
+    """A Docker Hub reference in the form the registry API addresses it."""
+
+    repository: str
+    # A tag or a digest; the manifests endpoint takes either.
+    reference: str
+
+
+def on_hub(reference: str) -> HubImage | None:
+    """Where a reference lives on Docker Hub, or absence if it lives elsewhere.
+
+    A leading component is a registry host when it could not be a Hub namespace:
+    it has a dot or a port, or is `localhost`. Without one the image is on Hub,
+    and an unnamespaced one is an official image under `library/`.
+    """
+    name, _, digest = reference.partition("@")
+    host, slash, rest = name.partition("/")
+    if slash and ("." in host or ":" in host or host == "localhost"):
+        if host not in _HUB_HOSTS:
+            return None
+        name = rest
+    path, colon, tag = name.rpartition(":")
+    if not colon:
+        path, tag = name, "latest"
+    if "/" not in path:
+        path = f"library/{path}"
+    return HubImage(repository=path, reference=digest or tag)
+
+
+def wanted(tasks: Iterable[Task]) -> tuple[str, ...]:
+    """Every external base the tasks' Dockerfiles pull, once each.
+
+    Each file is read with the images its task depends on as the known set,
+    which is all `classify` needs to tell an internal reference apart in that
+    file. A file that cannot be read contributes nothing: its build will say
+    why, and a warm-up is no place to say it first.
+    """
+    found: set[str] = set()
+    for task in tasks:
+        known = frozenset({task.image, *(dependency.image for dependency in task.dependencies)})
+        try:
+            text = Path(task.dockerfile).read_text(encoding="utf-8")
+        except OSError:
+            continue
+        found.update(bases_in(text, known))
+    return tuple(sorted(found))
+
+
+def buildkitd_config(mirror: str) -> str:
+    """A buildkitd.toml sending `docker.io` to the mirror, over plain HTTP."""
+    return (
+        '[registry."docker.io"]\n'
+        f'  mirrors = ["{mirror}"]\n'
+        "\n"
+        f'[registry."{mirror}"]\n'
+        "  http = true\n"
+    )
+
+
+# --- the mirror -------------------------------------------------------------
+
+
+def _ready(mirror: str, deadline: float) -> bool:
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://{mirror}/v2/", timeout=2.0).status_code == 200:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(_READY_POLL_SECONDS)
+    return False
+
+
+def start_mirror(address: str | None = None) -> dict[str, str]:
+    """Starts the pull-through mirror, returning what builds must export to use it.
+
+    Published on the bridge address only: that is the one a builder's container
+    reaches the runner at, and it keeps the mirror off every other interface.
+    Raises when the mirror does not come up, and the caller falls back to
+    exporting nothing -- builders that pull from Hub directly.
+    """
+    mirror = f"{address or bridge_address()}:{MIRROR_PORT}"
+    result = subprocess.run(
+        (
+            "docker",
+            "run",
+            "--detach",
+            "--name",
+            _MIRROR_NAME,
+            "--publish",
+            f"{mirror}:5000",
+            "--env",
+            f"REGISTRY_PROXY_REMOTEURL={_UPSTREAM}",
+            _MIRROR_IMAGE,
+        ),
+        capture_output=True,
+        text=True,
+        check=False,
+        timeout=_START_TIMEOUT_SECONDS,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"docker run exited {result.returncode}")
+    if not _ready(mirror, time.monotonic() + _READY_SECONDS):
+        raise RuntimeError(f"the mirror at {mirror} did not answer in {_READY_SECONDS:.0f}s")
+
+    config = Path(tempfile.mkdtemp(prefix="buildkitd-")) / "buildkitd.toml"
+    config.write_text(buildkitd_config(mirror), encoding="utf-8")
+    logger.info("Docker Hub is mirrored at %s for this worker's builders.", mirror)
+    return {CONFIG_VARIABLE: str(config), MIRROR_VARIABLE: mirror}
+
+
+# --- warming it -------------------------------------------------------------
+
+
+class _Platform(BaseModel):
+    os: str = ""
+    architecture: str = ""
+
+
+class _Descriptor(BaseModel):
+    digest: str
+    platform: _Platform | None = None
+
+
+class _Manifest(BaseModel):
+    """An image manifest or an index; only the fields a pull follows."""
+
+    manifests: tuple[_Descriptor, ...] = ()
+    config: _Descriptor | None = None
+    layers: tuple[_Descriptor, ...] = ()
+
+
+_MANIFEST: TypeAdapter[_Manifest] = TypeAdapter(_Manifest)
+
+
+@dataclass(frozen=True, slots=True)
+class Warmed:
+    """What a warm-up fetched through the mirror."""
+
+    images: tuple[str, ...]
+    failed: tuple[str, ...]
+    bytes_read: int
+
+
+NOTHING_WARMED = Warmed(images=(), failed=(), bytes_read=0)
+
+
+def _manifest(client: httpx.Client, image: HubImage, reference: str) -> _Manifest:
+    response = client.get(
+        f"/v2/{image.repository}/manifests/{reference}", headers={"Accept": _ACCEPT}
+    )
+    response.raise_for_status()
+    return _MANIFEST.validate_json(response.content)
+
+
+def warm(client: httpx.Client, image: HubImage, platform: Platform) -> int:
+    """Pulls one image's platform manifest and blobs, returning the bytes read.
+
+    The bodies are read to the end and discarded: the mirror keeps what it
+    serves, and a blob it was not allowed to finish sending is not kept.
+    """
+    manifest = _manifest(client, image, image.reference)
+    if manifest.manifests:
+        chosen = next(
+            (
+                entry
+                for entry in manifest.manifests
+                if entry.platform is not None
+                and entry.platform.os == "linux"
+                and entry.platform.architecture == platform
+            ),
+            None,
+        )
+        if chosen is None:
+            raise LookupError(f"no linux/{platform} manifest")
+        manifest = _manifest(client, image, chosen.digest)
+
+    blobs = (*((manifest.config,) if manifest.config is not None else ()), *manifest.layers)
+    read = 0
+    for blob in blobs:
+        with client.stream("GET", f"/v2/{image.repository}/blobs/{blob.digest}") as response:
+            response.raise_for_status()
+            for chunk in response.iter_bytes():
+                read += len(chunk)
+    return read
+
+
+def prefetch(
+    client: httpx.Client,
+    references: Sequence[str],
+    platform: Platform,
+    concurrency: int = PREFETCH_CONCURRENCY,
+) -> Warmed:
+    """Warms every Hub reference through the mirror `client` addresses.
+
+    A failure is logged and counted, never raised: the build that needs that
+    base fetches it itself, which is all that would have happened without this.
+    """
+    hub = {reference: image for reference in references if (image := on_hub(reference))}
+
+    def one(item: tuple[str, HubImage]) -> int | None:
+        reference, image = item
+        try:
+            return warm(client, image, platform)
+        except (httpx.HTTPError, ValidationError, LookupError) as error:
+            logger.warning("Could not warm %s through the mirror: %s", reference, error)
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        read = dict(zip(hub, pool.map(one, hub.items()), strict=True))
+
+    warmed = Warmed(
+        images=tuple(reference for reference, size in read.items() if size is not None),
+        failed=tuple(reference for reference, size in read.items() if size is None),
+        bytes_read=sum(size for size in read.values() if size is not None),
+    )
+    logger.info(
+        "Warmed %d base image(s), %.0f MiB, through the mirror; %d failed.",
+        len(warmed.images),
+        warmed.bytes_read / (1 << 20),
+        len(warmed.failed),
+    )
+    return warmed
+
+
+def warm_share(
+    tasks: Sequence[Task],
+    platform: Platform,
+    mirror: Callable[[], dict[str, str]],
+) -> Warmed:
+    """Warms the bases `tasks` pull through the mirror `mirror` yields, if any."""
+    address = mirror().get(MIRROR_VARIABLE)
+    if address is None:
+        return NOTHING_WARMED
+    with httpx.Client(base_url=f"http://{address}", timeout=60.0, follow_redirects=True) as client:
+        return prefetch(client, wanted(tasks), platform)
@@ -0,0 +1,356 @@
+"""Choosing BUILD_SLOTS and WORKER_COUNT from what past runs measured.
+
+Each worker's summary reports its effective parallelism and peak concurrency,
+and the merged timeline reports the run's makespan against its floor. Those
+figures answered "was this run well configured?" and were then thrown away, so
+the next question -- what should the next run use? -- was answered by editing
+two numbers and waiting a day to see.
+
+The merge step now appends one record per platform per run to a persisted
+history: the configuration it ran with, the runner it ran on, each worker's
+utilisation (through the interval functions in `ci.utilisation`), the makespan,
+the critical path, and how long every image took. The recommender reads the
+history back and, for each platform, predicts the makespan of each candidate
+configuration from three measured quantities:
+
+- the *work*: the median duration of each image the latest run built, summed;
+- the *stretch* at a slot count: how much slower the same images built when
+  that many shared a runner, against their medians. Slots contend for disk and
+  network, so doubling them never doubles throughput, and this is the measure
+  of by how much it does not;
+- the *inefficiency*: each run's makespan over the floor no schedule could beat
+  -- the larger of the critical path and the work spread over every slot. This
+  is what booting, stealing and the tail cost a real run.
+
+A prediction is the floor for the candidate times the median inefficiency, with
+bounds from its spread: the 10th and 90th percentiles once there are enough
+runs to have them, the observed extremes until then. The recommendation is the
+candidate meeting the target makespan at its upper bound for the fewest runner
+minutes. Slot counts are drawn only from those the history has measured, since
+a stretch cannot be measured for a count that never ran; where the highest one
+measured kept its slots saturated, the recommendation says a higher count is
+worth trying.
+
+Pure throughout; the entry scripts own the file and the summary.
+"""
+
+from __future__ import annotations
+
+import datetime
+import statistics
+from collections import Counter
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass
+from pathlib import Path
+
+from pydantic import TypeAdapter
+
+from ci import persisted
+from ci.timeline import WorkerTimeline, shape
+from ci.utilisation import effective_parallelism, intervals_of, peak_concurrency
+
+# Runs kept per platform. Enough to see through a bad day, few enough that a
+# change to the images or the runners washes out within a few weeks of nightly
+# runs.
+KEEP_RUNS = 30
+
+# Runs needed before the bounds are percentiles rather than the observed range.
+PERCENTILE_RUNS = 5
+
+# Mean parallelism over slots at which a worker counts as saturated: its slots
+# were busy nearly all the time it held them, so more might have been used.
+SATURATED = 0.9
+
+MAX_WORKERS = 16
+
+
+@dataclass(frozen=True, slots=True)
+class WorkerUtilisation:
+    slots: int
+    parallelism: float
+    peak: int
+
+
+@dataclass(frozen=True, slots=True)
+class RunRecord:
+    """One platform's share of one run, as the history keeps it."""
+
+    run: str
+    day: datetime.date
+    platform: str
+    workers: int
+    slots: int
+    cpus: int
+    memory_bytes: int
+    makespan: float
+    critical_seconds: float
+    utilisation: tuple[WorkerUtilisation, ...]
+    # Each image's last successful build on this platform, in seconds.
+    durations: dict[str, float]
+
+    @property
+    def work(self) -> float:
+        return sum(self.durations.values())
+
+    @property
+    def floor(self) -> float:
+        capacity = self.workers * self.slots
+        return max(self.critical_seconds, self.work / capacity if capacity else 0.0)
+
+    @property
+    def inefficiency(self) -> float:
+        return self.makespan / self.floor if self.floor else 1.0
+
+
+History = tuple[RunRecord, ...]
+
+_HISTORY: TypeAdapter[History] = TypeAdapter(History)
+
+
+def _most_common(values: Iterable[int]) -> int:
+    counted = Counter(values).most_common(1)
+    return counted[0][0] if counted else 0
+
+
+def records_of(run: str, day: datetime.date, timelines: Sequence[WorkerTimeline]) -> History:
+    """One record per platform from a run's merged timelines. Pure."""
+    records = []
+    for platform in sorted({worker.platform for worker in timelines}):
+        workers = tuple(worker for worker in timelines if worker.platform == platform)
+        spans = tuple(span for worker in workers for span in worker.spans)
+        durations = {
+            span.image: span.duration
+            for span in sorted(spans, key=lambda span: span.end)
+            if span.succeeded
+        }
+        if not durations:
+            continue
+        run_shape = shape(workers)
+        utilisation = []
+        for worker in workers:
+            intervals = intervals_of((span.start, span.duration) for span in worker.spans)
+            utilisation.append(
+                WorkerUtilisation(
+                    slots=worker.slots,
+                    parallelism=effective_parallelism(intervals),
+                    peak=peak_concurrency(intervals),
+                )
+            )
+        records.append(
+            RunRecord(
+                run=run,
+                day=day,
+                platform=platform,
+                workers=len(workers),
+                slots=_most_common(worker.slots for worker in workers),
+                cpus=_most_common(worker.cpus for worker in workers),
+                memory_bytes=_most_common(worker.memory_bytes for worker in workers),
+                makespan=run_shape.makespan,
+                critical_seconds=run_shape.critical_seconds,
+                utilisation=tuple(utilisation),
+                durations=durations,
+            )
+        )
+    return tuple(records)
+
+
+def appended(history: History, records: History, keep: int = KEEP_RUNS) -> History:
+    """The history with `records` added, replacing any earlier attempt's. Pure.
+
+    Keyed on run and platform, so a re-run attempt supersedes the record of the
+    attempt it re-ran rather than counting the same run twice.
+    """
+    replaced = {(record.run, record.platform) for record in records}
+    merged = [record for record in history if (record.run, record.platform) not in replaced]
+    merged.extend(records)
+    kept: list[RunRecord] = []
+    for platform in sorted({record.platform for record in merged}):
+        kept.extend([record for record in merged if record.platform == platform][-keep:])
+    return tuple(kept)
+
+
+def load(path: Path) -> History:
+    return persisted.load(path, _HISTORY, ())
+
+
+def save(path: Path, history: History) -> None:
+    persisted.save(path, _HISTORY, history)
+
+
+# --- prediction -------------------------------------------------------------
+
+
+@dataclass(frozen=True, slots=True)
+class Prediction:
+    workers: int
+    slots: int
+    makespan: float
+    low: float
+    high: float
+
+    @property
+    def runner_seconds(self) -> float:
+        """What the build stage costs: every worker held for the whole makespan."""
+        return self.workers * self.makespan
+
+
+@dataclass(frozen=True, slots=True)
+class Recommendation:
+    platform: str
+    runner: str
+    chosen: Prediction
+    # The configuration the latest run used, predicted the same way.
+    current: Prediction
+    runs: int
+    meets_target: bool
+    # The most slots measured kept its workers saturated: try one more.
+    explore_slots: bool
+
+
+def _bounds(samples: Sequence[float]) -> tuple[float, float, float]:
+    """Median, and the 10th and 90th percentiles or, with few samples, the extremes."""
+    middle = statistics.median(samples)
+    if len(samples) < PERCENTILE_RUNS:
+        return middle, min(samples), max(samples)
+    deciles = statistics.quantiles(samples, n=10, method="inclusive")
+    return middle, deciles[0], deciles[-1]
+
+
+def stretch(records: Sequence[RunRecord]) -> dict[int, float]:
+    """How much slower images built at each slot count, against their medians."""
+    medians = {
+        image: statistics.median(
+            record.durations[image] for record in records if image in record.durations
+        )
+        for image in {image for record in records for image in record.durations}
+    }
+    ratios: dict[int, list[float]] = {}
+    for record in records:
+        relative = [
+            duration / medians[image]
+            for image, duration in record.durations.items()
+            if medians[image] > 0
+        ]
+        if relative:
+            ratios.setdefault(record.slots, []).append(statistics.median(relative))
+    return {slots: statistics.fmean(values) for slots, values in ratios.items()}
+
+
+def predict(records: Sequence[RunRecord], workers: int, slots: int) -> Prediction:
+    """The makespan `workers` x `slots` would take on the latest run's images.
+
+    `records` is one platform's history, oldest first, and must not be empty.
+    """
+    latest = records[-1]
+    factors = stretch(records)
+    medians = {
+        image: statistics.median(
+            record.durations[image] for record in records if image in record.durations
+        )
+        for image in latest.durations
+    }
+    factor = factors.get(slots, 1.0)
+    # The chain's own builds stretch too, relative to how it was measured.
+    critical = latest.critical_seconds * factor / factors.get(latest.slots, 1.0)
+    floor = max(critical, sum(medians.values()) * factor / (workers * slots))
+    middle, low, high = _bounds([record.inefficiency for record in records])
+    return Prediction(workers, slots, floor * middle, floor * low, floor * high)
+
+
+def recommend(history: History, target_seconds: float) -> tuple[Recommendation, ...]:
+    """Per platform, the cheapest measured configuration expected to meet the target."""
+    recommendations = []
+    for platform in sorted({record.platform for record in history}):
+        records = [record for record in history if record.platform == platform]
+        latest = records[-1]
+        measured = sorted({record.slots for record in records})
+        candidates = [
+            predict(records, workers, slots)
+            for slots in measured
+            for workers in range(1, MAX_WORKERS + 1)
+        ]
+        meeting = [candidate for candidate in candidates if candidate.high <= target_seconds]
+        chosen = (
+            min(meeting, key=lambda candidate: (candidate.runner_seconds, candidate.makespan))
+            if meeting
+            else min(candidates, key=lambda candidate: (candidate.high, candidate.workers))
+        )
+        widest = [
+            worker
+            for record in records
+            if record.slots == measured[-1]
+            for worker in record.utilisation
+            if worker.slots
+        ]
+        saturation = (
+            statistics.fmean(worker.parallelism / worker.slots for worker in widest)
+            if widest
+            else 0.0
+        )
+        recommendations.append(
+            Recommendation(
+                platform=platform,
+                runner=_runner(latest),
+                chosen=chosen,
+                current=predict(records, latest.workers, latest.slots),
+                runs=len(records),
+                meets_target=bool(meeting),
+                explore_slots=chosen.slots == measured[-1] and saturation >= SATURATED,
+            )
+        )
+    return tuple(recommendations)
+
+
+def _runner(record: RunRecord) -> str:
+    return f"{record.cpus} CPU, {record.memory_bytes / (1 << 30):.0f} GiB"
+
+
+def _minutes(seconds: float) -> str:
+    return f"{seconds / 60:.0f}"
+
+
+def _configuration(prediction: Prediction) -> str:
+    return (
+        f"{prediction.workers} x {prediction.slots} | {_minutes(prediction.makespan)} "
+        f"({_minutes(prediction.low)}–{_minutes(prediction.high)}) | "
+        f"{_minutes(prediction.runner_seconds)}"
+    )
+
+
+def report(recommendations: Sequence[Recommendation], target_seconds: float) -> list[str]:
+    """The recommendation table, then what a reader should know about it."""
+    if not recommendations:
+        return ["### Capacity", "", "No utilisation history yet; nothing to recommend."]
+    lines = [
+        "### Capacity",
+        "",
+        f"Target makespan {_minutes(target_seconds)} min. Makespans are predicted minutes "
+        "with their bounds; cost is runner minutes for the build stage.",
+        "",
+        "| Platform | Runner | Runs | Now: workers x slots | Makespan | Cost "
+        "| Suggested: workers x slots | Makespan | Cost |",
+        "| --- | --- | --- | --- | --- | --- | --- | --- | --- |",
+    ]
+    notes = []
+    for recommendation in recommendations:
+        lines.append(
+            f"| {recommendation.platform} | {recommendation.runner} "
+            f"| {recommendation.runs} | {_configuration(recommendation.current)} "
+            f"| {_configuration(recommendation.chosen)} |"
+        )
+        if not recommendation.meets_target:
+            notes.append(
+                f"- {recommendation.platform}: no measured configuration meets the target; "
+                "the suggestion is the fastest."
+            )
+        if recommendation.explore_slots:
+            notes.append(
+                f"- {recommendation.platform}: {recommendation.chosen.slots} slot(s) ran "
+                f"saturated; BUILD_SLOTS={recommendation.chosen.slots + 1} is worth a run."
+            )
+        if recommendation.runs < PERCENTILE_RUNS:
+            notes.append(
+                f"- {recommendation.platform}: {recommendation.runs} run(s) of history; "
+                "bounds are the observed range."
+            )
+    return [*lines, "", *notes]
@@ -13,6 +13,12 @@ that forgets its scope cannot be written, because `Scope` is a required field
 rather than a keyword with a default. The preconditions BLAKE2b would raise on
 are constructor invariants, so a malformed derivation fails at import -- before
 a run has built anything -- rather than at its first use.
+
+A derivation used for every message under one key -- a request signature, a
+body digest -- can be `prepared` once. The key is fitted, the scope mixed in
+and the key block compressed a single time, and each message then costs a copy
+of that state and the message itself. Same digests, about half the work for the
+short messages the mesh signs.
 """
 
 from __future__ import annotations
@@ -132,6 +138,33 @@ class Derivation:
             ).digest()
         )
 
+    def prepared(self, key: bytes = b"") -> Prepared:
+        """This derivation under one key, initialised once for many messages."""
+        return Prepared(
+            hashlib.blake2b(key=_fit_key(key), person=self.scope.label, digest_size=self.width)
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class Prepared:
+    """A derivation with its key already absorbed. Safe to share between threads.
+
+    The state is never updated in place; every message gets a copy, so one
+    `Prepared` serves any number of concurrent handlers. Digests are identical
+    to `Derivation.over` under the same key, which is what lets a caller swap
+    one for the other without a peer noticing.
+    """
+
+    state: hashlib.blake2b
+
+    def of(self, *parts: str) -> Digest:
+        return self.over(material(*parts))
+
+    def over(self, message: bytes) -> Digest:
+        copied = self.state.copy()
+        copied.update(message)
+        return Digest(copied.digest())
+
 
 def material(*parts: str) -> bytes:
     """Encodes parts into one message, injectively.
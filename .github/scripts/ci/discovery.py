@@ -6,9 +6,11 @@ independently, so the two can no longer disagree about which images exist.
 
 from __future__ import annotations
 
+import os
 import random
 from collections.abc import Callable, Iterable, Iterator, Mapping, Sequence
 from dataclasses import dataclass
+from fnmatch import fnmatchcase
 from itertools import groupby
 from operator import itemgetter
 from pathlib import Path
@@ -19,22 +21,34 @@ from pydantic.dataclasses import dataclass as pydantic_dataclass
 
 from ci.derive import Derivation, Scope
 from ci.domain import Platform, Task
-from ci.references import Graph, graph
+from ci.references import Graph, ParseCache, graph
 
-# Each glob is paired with the naming rule it implies, so no layout can be
-# admitted without stating what it is called. The two rules agree by
+# Each file-name pattern is paired with the naming rule it implies, so no layout
+# can be admitted without stating what it is called. The two rules agree by
 # construction: `<dir>/<stem>.Dockerfile` and `<dir>-<stem>/Dockerfile` name the
 # same image. That is deliberate -- it lets a directory keep its variants beside
 # the thing they vary (`code-server/base.Dockerfile`) instead of scattering them
 # across sibling top-level directories, without moving the published tag.
 _LAYOUTS: tuple[tuple[str, Callable[[Path], str]], ...] = (
-    ("**/Dockerfile", lambda path: path.parent.name),
+    ("Dockerfile", lambda path: path.parent.name),
     (
-        "**/*.Dockerfile",
+        "*.Dockerfile",
         lambda path: f"{path.parent.name}-{path.name.removesuffix('.Dockerfile')}",
     ),
 )
 
+# Directories no image definition lives in, however deep: version control,
+# dependency trees, caches. Pruned rather than filtered, which is the point --
+# their size is what the walk would otherwise spend its time on.
+_ALWAYS_IGNORED = (".git", "node_modules", "__pycache__", ".venv")
+
+# A repository-level list of further directories to prune, one pattern per
+# line. A pattern without a slash matches a directory of that name anywhere, as
+# in `.gitignore`; one with a slash matches a path relative to the root. A
+# vendored source tree is the case it exists for: its own Dockerfiles would
+# otherwise be claimed as images of this repository.
+IGNORE_FILE = ".discoveryignore"
+
 
 class ConflictingDockerfiles(RuntimeError):
     """Two or more paths claim one image name.
@@ -58,16 +72,59 @@ class ConflictingDockerfiles(RuntimeError):
         self.conflicts = dict(conflicts)
 
 
-def _claims(root: Path) -> Iterator[tuple[str, Path]]:
-    """Every (image name, Dockerfile) the tree asserts, before uniqueness holds."""
+def ignored_patterns(root: Path) -> tuple[str, ...]:
+    """The always-pruned directories plus whatever `IGNORE_FILE` adds."""
+    try:
+        lines = (root / IGNORE_FILE).read_text(encoding="utf-8").splitlines()
+    except FileNotFoundError:
+        lines = []
+    added = (line.strip().strip("/") for line in lines)
+    return (*_ALWAYS_IGNORED, *(line for line in added if line and not line.startswith("#")))
+
+
+def _pruned(relative: str, name: str, patterns: Sequence[str]) -> bool:
+    return any(
+        fnmatchcase(relative if "/" in pattern else name, pattern) for pattern in patterns
+    )
+
+
+def _files(root: Path, patterns: Sequence[str]) -> Iterator[Path]:
+    """Every file under `root`, in one walk that never enters a pruned directory.
+
+    `os.scandir` rather than a recursive glob per layout: two globs were two
+    full traversals of the checkout, each descending into every build context,
+    `.git` included, to find a few dozen files. The file type comes from the
+    directory entry, so no file is stat'ed to learn it. Symbolic links to
+    directories are not followed, which is what `**` did too.
+    """
+    pending = [(root, "")]
+    while pending:
+        directory, prefix = pending.pop()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                relative = f"{prefix}{entry.name}"
+                if entry.is_dir(follow_symlinks=False):
+                    if not _pruned(relative, entry.name, patterns):
+                        pending.append((Path(entry.path), f"{relative}/"))
+                elif entry.is_file():
+                    yield Path(entry.path)
+
+
+def _claims(root: Path, patterns: Sequence[str]) -> Iterator[tuple[str, Path]]:
+    """Every (image name, Dockerfile) the tree asserts, before uniqueness holds.
+
+    Both layouts are matched in the same pass over the same walk. Ordering is
+    not this function's concern: `definitions` sorts the union.
+    """
     return (
-        (name_of(dockerfile).lower(), dockerfile)
+        (name_of(path).lower(), path)
+        for path in _files(root, patterns)
         for pattern, name_of in _LAYOUTS
-        for dockerfile in root.glob(pattern)
+        if fnmatchcase(path.name, pattern)
     )
 
 
-def definitions(root: Path) -> Mapping[str, Path]:
+def definitions(root: Path, ignored: Sequence[str] | None = None) -> Mapping[str, Path]:
     """The tree's image definitions: one path per name, ordered by name.
 
     This is the boundary where an untrusted directory tree becomes a trusted
@@ -76,11 +133,15 @@ def definitions(root: Path) -> Mapping[str, Path]:
 
     Sorting is not cosmetic. It is what makes `deal` reproducible from its seed,
     and it is also what lets `groupby` see each name's claimants together -- one
-    ordering serving both.
+    ordering serving both. It is also what makes the walk's own order, which is
+    the filesystem's, irrelevant.
+
+    `ignored` defaults to `ignored_patterns(root)`.
     """
+    patterns = ignored_patterns(root) if ignored is None else ignored
     grouped = {
         image: tuple(path for _, path in claims)
-        for image, claims in groupby(sorted(_claims(root)), key=itemgetter(0))
+        for image, claims in groupby(sorted(_claims(root, patterns)), key=itemgetter(0))
     }
     conflicts = {image: paths for image, paths in grouped.items() if len(paths) > 1}
     if conflicts:
@@ -103,7 +164,13 @@ class Discovery:
     graph: Graph
 
 
-def discover(root: Path, platforms: Iterable[Platform], max_retries: int) -> Discovery:
+def discover(
+    root: Path,
+    platforms: Iterable[Platform],
+    max_retries: int,
+    cache: ParseCache | None = None,
+    workers: int | None = None,
+) -> Discovery:
     """Builds one task per (image, platform), ordered deterministically.
 
     Each task carries both directions of its place in the repository's own
@@ -115,9 +182,12 @@ def discover(root: Path, platforms: Iterable[Platform], max_retries: int) -> Dis
     `DanglingReference` if one consumes an image nothing here builds,
     `MisdeclaredReference` if a reference is written in a form the build cannot
     use, and `CyclicGraph` if the images depend on each other in a loop.
+
+    `cache` carries Dockerfile parses between jobs; see `ParseCache`. `workers`
+    bounds how wide reading and parsing fan out; see `graph`.
     """
     found = definitions(root)
-    edges = graph(found, root)
+    edges = graph(found, root, cache, workers)
     return Discovery(
         tasks=tuple(
             Task(
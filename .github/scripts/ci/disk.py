@@ -0,0 +1,314 @@
+"""Keeping a worker's disk from filling while its slots are still building.
+
+`free_disk_space` runs once, before the first build, and nothing afterwards
+gave any space back. A worker runs several builds at once and each one owns a
+BuildKit builder whose state grows with every layer it writes, so on a long
+share the disk fills part-way through and the build that hits it fails with an
+error that names a layer rather than the disk. Retrying it only writes the same
+layers again.
+
+This module is the governor that sits between the slots and the disk. Below a
+low watermark it prunes what nobody is using, and it stops admitting new builds
+until free space is back above a high watermark. Two watermarks rather than
+one, because a single threshold would admit a build the moment a prune clawed
+back a byte, and that build would push the disk straight back under.
+
+*What there is to prune.* Every build creates its builder and removes it when it
+ends, so an idle builder is rare -- one whose `buildx rm` failed -- and pruning
+idle builders alone would reclaim almost nothing. The space is inside the
+builders that are busy: a build retries in the builder it started in, and with
+`--no-cache` every failed attempt leaves its layers behind, unreferenced, for
+as long as the build goes on. So a prune also reaches into each busy builder,
+but only for cache records no build has used for `STALE_CACHE_MINUTES`.
+BuildKit never prunes a record a build in flight still references, and the age
+filter keeps even a running attempt's finished steps out of reach. The daemon's
+dangling images and its default builder's cache are pruned as well.
+
+*Never a running build's layers.* A builder is registered as busy before it is
+created and released only after it is removed, so a whole-builder prune can
+never reach into a build that is in flight. Holding is bounded by the same
+fact: with nothing building, nothing can give space back, so admission resumes
+rather than waiting forever. A build that then fails on a full disk costs its
+retry budget; a slot that waits on an event that cannot happen costs the run.
+
+The decisions are pure functions and the governor is their interpreter, the
+same split `ci.scheduling` uses, so the policy is testable without a disk.
+"""
+
+from __future__ import annotations
+
+import logging
+import shutil
+import subprocess
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import assert_never
+
+logger = logging.getLogger("ci.disk")
+
+GIB = 1 << 30
+
+# Every builder a build owns is named with this prefix (see `ci.docker`). A
+# builder outside it belongs to something other than this worker, and is never
+# this module's to prune.
+BUILDER_PREFIX = "builder_"
+
+# How long a busy builder's cache record must have gone unused before a prune
+# may take it. Long past any step of the attempt in flight, which holds its own
+# records anyway; what is older is a failed attempt's.
+STALE_CACHE_MINUTES = 10
+
+# Bounded because a prune runs while every slot that wants to start is waiting
+# on it. A daemon that has stopped answering must cost minutes, not the run.
+_PRUNE_TIMEOUT_SECONDS = 600
+
+
+@dataclass(frozen=True, slots=True)
+class Watermarks:
+    """Free-space thresholds, in bytes: prune below `low`, resume at `high`."""
+
+    low_bytes: int
+    high_bytes: int
+
+    def __post_init__(self) -> None:
+        # An inverted pair would clear pressure before it was ever raised, so
+        # the governor would prune on every admission and never hold at all.
+        if not 0 <= self.low_bytes <= self.high_bytes:
+            raise ValueError(
+                f"watermarks must satisfy 0 <= low <= high, not {self.low_bytes} and "
+                f"{self.high_bytes}"
+            )
+
+    @classmethod
+    def gibibytes(cls, low: int, high: int) -> Watermarks:
+        return cls(low_bytes=low * GIB, high_bytes=high * GIB)
+
+
+# --- decisions --------------------------------------------------------------
+
+
+@dataclass(frozen=True, slots=True)
+class Admit:
+    """Start the next build."""
+
+
+@dataclass(frozen=True, slots=True)
+class Reclaim:
+    """Prune what nobody is using, then ask again."""
+
+
+@dataclass(frozen=True, slots=True)
+class Hold:
+    """Wait for a running build to finish and give its space back."""
+
+
+Admission = Admit | Reclaim | Hold
+
+
+def pressured(free_bytes: int, watermarks: Watermarks, was_pressured: bool) -> bool:
+    """Whether the disk is under pressure, with hysteresis between the marks.
+
+    Entered below the low mark and left only at the high one. Between the two
+    the answer is whatever it was, which is the whole point of having two.
+    """
+    if free_bytes < watermarks.low_bytes:
+        return True
+    if free_bytes >= watermarks.high_bytes:
+        return False
+    return was_pressured
+
+
+def decide_admission(under_pressure: bool, building: int, pruned: bool) -> Admission:
+    """What a slot asking to start a build should do. Pure and total.
+
+    1. No pressure, no question.
+    2. Under pressure, reclaim first -- once per change in what is idle. A
+       prune that found nothing will find nothing again until a build ends.
+    3. Then hold, but only while something is building. A finished build is
+       the only thing left that can give space back, and waiting with none in
+       flight would wait forever.
+    """
+    if not under_pressure:
+        return Admit()
+    if not pruned:
+        return Reclaim()
+    if building == 0:
+        return Admit()
+    return Hold()
+
+
+def idle_builders(listed: Iterable[str], busy: frozenset[str]) -> tuple[str, ...]:
+    """Builders this worker created that no build currently holds."""
+    return tuple(
+        sorted(name for name in listed if name.startswith(BUILDER_PREFIX) and name not in busy)
+    )
+
+
+def prune_commands(listed: Iterable[str], busy: frozenset[str]) -> tuple[tuple[str, ...], ...]:
+    """Every prune one reclaim runs, in order. Pure.
+
+    An idle builder is pruned whole; a busy one only of records that have gone
+    unused for `STALE_CACHE_MINUTES`, which is what its failed attempts left.
+    """
+    names = tuple(listed)
+    held = tuple(sorted(name for name in names if name.startswith(BUILDER_PREFIX) and name in busy))
+    return (
+        *(
+            ("docker", "buildx", "prune", "--builder", name, "--all", "--force")
+            for name in idle_builders(names, busy)
+        ),
+        *(
+            (
+                "docker",
+                "buildx",
+                "prune",
+                "--builder",
+                name,
+                "--force",
+                "--filter",
+                f"until={STALE_CACHE_MINUTES}m",
+            )
+            for name in held
+        ),
+        ("docker", "image", "prune", "--force"),
+        ("docker", "builder", "prune", "--force"),
+    )
+
+
+# --- effects ----------------------------------------------------------------
+
+
+def free_bytes(path: str = "/") -> int:
+    """Bytes available on the filesystem holding `path`."""
+    return shutil.disk_usage(path).free
+
+
+def _run(command: tuple[str, ...]) -> subprocess.CompletedProcess[str]:
+    return subprocess.run(
+        command, capture_output=True, text=True, check=False, timeout=_PRUNE_TIMEOUT_SECONDS
+    )
+
+
+def prune_unused(busy: frozenset[str]) -> None:
+    """Prunes what no build in flight is using; see `prune_commands`.
+
+    Best-effort throughout: a prune that fails leaves the disk as it was, and
+    the governor's bound on holding still applies. The daemon-level prunes are
+    safe alongside running builds because no build here uses the daemon's own
+    builder -- every one runs on a named builder of its own.
+    """
+    try:
+        listed = _run(("docker", "buildx", "ls", "--format", "{{.Name}}"))
+        for command in prune_commands(listed.stdout.split(), busy):
+            logger.info("Pruning: %s", " ".join(command[1:]))
+            _run(command)
+    except (OSError, subprocess.SubprocessError) as error:
+        logger.warning("Prune did not complete: %s", error)
+
+
+class DiskGovernor:
+    """Gates slot admission on free disk, pruning when it runs low.
+
+    Shared by every slot in a worker and by every build those slots run: the
+    slots ask `admit` before taking work, and each build holds `building` for
+    as long as its builder exists.
+    """
+
+    def __init__(
+        self,
+        watermarks: Watermarks,
+        path: str = "/",
+        measure: Callable[[str], int] = free_bytes,
+        prune: Callable[[frozenset[str]], None] = prune_unused,
+        poll_seconds: float = 30.0,
+    ) -> None:
+        self._watermarks = watermarks
+        self._path = path
+        self._measure = measure
+        self._prune = prune
+        self._poll_seconds = poll_seconds
+        self._busy: set[str] = set()
+        self._pressured = False
+        self._pruned = False
+        # One condition for the whole governor: a finished build is what a
+        # holding slot waits for, and the lock under it is what makes a prune
+        # single-flight -- every other slot asking meanwhile waits on its result
+        # rather than starting a second one.
+        self._changed = threading.Condition()
+
+    @contextmanager
+    def building(self, builder: str) -> Iterator[None]:
+        """Marks a builder busy for the block, so no prune can touch it.
+
+        Entered before the builder is created, so the window between `create`
+        and the first layer is covered too.
+        """
+        with self._changed:
+            self._busy.add(builder)
+        try:
+            yield
+        finally:
+            with self._changed:
+                self._busy.discard(builder)
+                # Something is newly idle, so a prune may find something again.
+                self._pruned = False
+                self._changed.notify_all()
+
+    def admit(self) -> None:
+        """Blocks until a new build may start."""
+        with self._changed:
+            while True:
+                free = self._measure(self._path)
+                was = self._pressured
+                self._pressured = pressured(free, self._watermarks, was)
+                if self._pressured != was:
+                    self._log_transition(free)
+
+                decision = decide_admission(self._pressured, len(self._busy), self._pruned)
+                match decision:
+                    case Admit():
+                        if self._pressured:
+                            logger.warning(
+                                "Disk still below its high watermark (%s free) with no build "
+                                "running to free more; admitting anyway",
+                                _gib(free),
+                            )
+                        return
+                    case Reclaim():
+                        self._reclaim(free)
+                    case Hold():
+                        self._changed.wait(timeout=self._poll_seconds)
+                    case _:
+                        assert_never(decision)
+
+    def _reclaim(self, before: int) -> None:
+        """Prunes under the lock, so concurrent slots share one prune."""
+        started = time.monotonic()
+        self._prune(frozenset(self._busy))
+        self._pruned = True
+        after = self._measure(self._path)
+        logger.info(
+            "Pruned in %.0fs: reclaimed %s (%s -> %s free)",
+            time.monotonic() - started,
+            _gib(max(0, after - before)),
+            _gib(before),
+            _gib(after),
+        )
+
+    def _log_transition(self, free: int) -> None:
+        if self._pressured:
+            logger.warning(
+                "Disk below its low watermark (%s free, low %s); pausing admission until %s",
+                _gib(free),
+                _gib(self._watermarks.low_bytes),
+                _gib(self._watermarks.high_bytes),
+            )
+        else:
+            logger.info("Disk back above its high watermark (%s free); admitting", _gib(free))
+
+
+def _gib(count: int) -> str:
+    return f"{count / GIB:.1f} GiB"
@@ -13,13 +13,18 @@ import os
 import subprocess
 import time
 from collections.abc import Iterator, Mapping
-from contextlib import contextmanager
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from pathlib import Path
 from typing import assert_never
 
+from ci import ratelimit
+from ci.bases import CONFIG_VARIABLE
+from ci.disk import DiskGovernor
 from ci.domain import BuildFailed, BuildOutcome, BuildSucceeded, Task
 from ci.env import BuildIdentity, generation_table
-from ci.provenance import label_arguments, resolve_all, selector_arguments
+from ci.provenance import Lookup, label_arguments, resolve_all, selector_arguments
 from ci.retry import Exhausted, Succeeded, with_retries
+from ci.watchdog import describe, read_state
 
 logger = logging.getLogger("ci.docker")
 
@@ -42,6 +47,12 @@ _CLEANUP_PACKAGE_PATTERNS = (
 
 _CLEANUP_DIRECTORIES = ("/opt/ghc", "/usr/local/lib/android", "/usr/share/dotnet")
 
+# The image `docker buildx create` boots each builder from: the docker-container
+# driver's default, since `_builder` names no other.
+_BUILDKIT_IMAGE = "moby/buildkit:buildx-stable-1"
+
+_WARM_UP_TIMEOUT_SECONDS = 300
+
 
 _PROXY_BYPASS = "localhost,127.0.0.1,::1"
 
@@ -137,7 +148,13 @@ def collect_metrics() -> dict[str, str]:
         except (subprocess.SubprocessError, OSError) as error:
             return f"unavailable: {error}"
 
-    return {name: sample(command) for name, command in _METRIC_COMMANDS.items()}
+    metrics = {name: sample(command) for name, command in _METRIC_COMMANDS.items()}
+    # Which way the egress proxy was routing, when a watchdog is keeping it: a
+    # fetch that failed while failed over to DIRECT is a different diagnosis
+    # from one that failed through a live tunnel.
+    if state := os.environ.get("EGRESS_STATE_FILE"):
+        metrics["Egress route"] = describe(read_state(Path(state)))
+    return metrics
 
 
 def free_disk_space() -> None:
@@ -182,34 +199,86 @@ def free_disk_space() -> None:
     subprocess.run(("df", "-h"), check=False)
 
 
+def warm_builder() -> None:
+    """Pulls BuildKit's image before the first builder boots from it.
+
+    Every builder `build_and_push` creates starts a BuildKit container, and the
+    first to start pulls the image while its build waits on it. Pulled here,
+    beside the rest of provisioning, the first build boots from an image already
+    present. A failed pull changes nothing: that first builder pulls it itself,
+    as it always has.
+    """
+    result = subprocess.run(
+        ("docker", "pull", "--quiet", _BUILDKIT_IMAGE),
+        capture_output=True,
+        text=True,
+        check=False,
+        timeout=_WARM_UP_TIMEOUT_SECONDS,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"docker pull exited {result.returncode}")
+
+
 def tag_exists(tag: str) -> bool:
     """Asks the registry whether a tag resolves, treating errors as absent.
 
     Erring towards absent is the safe direction: a needless rebuild republishes
-    identical content, whereas wrongly assuming presence would leave a hole.
+    identical content, whereas wrongly assuming presence would leave a hole. A
+    refusal for rate is not an error in that sense, and the shared registry
+    window retries it before it can be read as absence.
     """
-    result = subprocess.run(
-        ("docker", "buildx", "imagetools", "inspect", tag), capture_output=True, check=False
-    )
+    result = ratelimit.REGISTRY.run(("docker", "buildx", "imagetools", "inspect", tag))
     return result.returncode == 0
 
 
+def builder_config_args(config: str | None) -> tuple[str, ...]:
+    """`buildx create` arguments that boot a builder with a buildkitd config.
+
+    Pure, like `proxy_build_args`, and empty for the same reason: a runner with
+    no mirror creates its builders with exactly the command it always has.
+    """
+    return ("--config", config) if config else ()
+
+
 @contextmanager
-def _builder(name: str) -> Iterator[None]:
-    """Owns a buildx builder for the block, removing it on every exit path."""
-    subprocess.run(("docker", "buildx", "create", "--name", name), check=True)
-    try:
-        yield
-    finally:
-        subprocess.run(("docker", "buildx", "rm", name), check=False)
+def _builder(
+    name: str, governor: DiskGovernor | None = None, config: str | None = None
+) -> Iterator[None]:
+    """Owns a buildx builder for the block, removing it on every exit path.
+
+    Registered with the governor for its whole life -- from before `create` to
+    after `rm` -- so a prune between builds can never touch this one's cache.
+    """
+    held: AbstractContextManager[None] = (
+        governor.building(name) if governor is not None else nullcontext()
+    )
+    with held:
+        subprocess.run(
+            ("docker", "buildx", "create", "--name", name, *builder_config_args(config)),
+            check=True,
+        )
+        try:
+            yield
+        finally:
+            subprocess.run(("docker", "buildx", "rm", name), check=False)
 
 
-def build_and_push(task: Task, identity: BuildIdentity) -> BuildOutcome:
+def build_and_push(
+    task: Task,
+    identity: BuildIdentity,
+    governor: DiskGovernor | None = None,
+    lookup: Lookup | None = None,
+) -> BuildOutcome:
     """Builds one image, retrying to the task's own budget.
 
     Retrying is safe because the effect is idempotent: every attempt pushes the
     same content under the same tags, so a duplicate costs minutes and changes
     nothing observable.
+
+    `governor` is the worker's disk governor, when it has one; the builder is
+    held busy with it so no prune reaches a build in flight. `lookup` is the
+    process's shared provenance cache, so sibling tasks resolve a dependency
+    they share once between them.
     """
     tags = tags_for(task, identity)
 
@@ -217,7 +286,7 @@ def build_and_push(task: Task, identity: BuildIdentity) -> BuildOutcome:
     # consuming, and re-asking on each of up to fifty attempts would let the
     # description drift between attempts of a single build.
     resolved = resolve_all(
-        task.dependencies, identity.base_image, task.platform, generation_table()
+        task.dependencies, identity.base_image, task.platform, generation_table(), lookup
     )
     labels = label_arguments(task, identity.batch, resolved)
     selectors = selector_arguments(resolved)
@@ -262,7 +331,13 @@ def build_and_push(task: Task, identity: BuildIdentity) -> BuildOutcome:
     def run_build() -> None:
         subprocess.run(command, check=True)
 
-    with _builder(builder_name):
+    # Like the proxy, a property of the runner: set when this worker mirrors
+    # Docker Hub, so the builder resolves its bases locally. See `ci.bases`.
+    with _builder(builder_name, governor, os.environ.get(CONFIG_VARIABLE)):
+        # On its own backoff, not under `retry.REGISTRY`. A build fails for
+        # reasons of its own far more often than for the registry's, and the
+        # push is one step of it; four ordinary failures would open the breaker
+        # and queue every slot's next build behind a probe minutes long.
         outcome = with_retries(
             operation=run_build,
             max_retries=task.max_retries,
@@ -50,10 +50,12 @@ import re
 import socket
 import subprocess
 import time
+from collections.abc import Callable, Iterable, Sequence
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 from platform import machine
-from typing import Annotated
+from typing import Annotated, BinaryIO
 
 import httpx
 from cryptography.hazmat.primitives import serialization
@@ -362,13 +364,90 @@ def register(timeout_seconds: float = 15.0) -> RegistrationOutcome:
     )
 
 
+# One device per node: a MASQUE session is bound to the key it was enrolled
+# with, so several sessions need several registrations.
+Fleet = tuple[MasqueNode, ...]
+
+
+def register_fleet(
+    count: int, enrol: Callable[[], RegistrationOutcome] = register
+) -> Fleet | RegistrationFailed:
+    """Enrols up to `count` devices concurrently; failed only if none enrolled.
+
+    A partial fleet is a smaller fleet, not a failure. Each node is only extra
+    capacity, and the group spreads load over however many there are.
+    """
+    with ThreadPoolExecutor(max_workers=count, thread_name_prefix="register") as pool:
+        outcomes = tuple(pool.map(lambda _: enrol(), range(count)))
+    fleet = tuple(outcome for outcome in outcomes if isinstance(outcome, MasqueNode))
+    refusals = tuple(o.reason for o in outcomes if isinstance(o, RegistrationFailed))
+    if not fleet:
+        return RegistrationFailed("; ".join(sorted(set(refusals))))
+    if refusals:
+        logger.warning(
+            "Registered %d of %d WARP device(s); first refusal: %s",
+            len(fleet),
+            count,
+            refusals[0],
+        )
+    return fleet
+
+
 # --- configuration ---------------------------------------------------------
 
 
+@dataclass(frozen=True, slots=True)
+class Controller:
+    """mihomo's REST controller, which is how a running proxy is reconfigured.
+
+    Loopback only, and behind a secret. The mixed port listens off loopback for
+    the builds' sake, but nothing inside a build has any business rewriting the
+    rules it is routed by.
+    """
+
+    port: int
+    secret: str
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+
+DEFAULT_CONTROLLER_PORT = 29278
+
+
+# How often mihomo checks each node, and how many failed checks drop one out of
+# the group until a later check passes. Checked through the probe URL, so a
+# node is judged by the same request `warp_egress` makes.
+_HEALTH_INTERVAL_SECONDS = 60
+_HEALTH_TIMEOUT_MILLISECONDS = 5000
+_HEALTH_FAILURES = 2
+
+
+def _masque_proxy(name: str, node: MasqueNode) -> str:
+    return f"""  - name: "{name}"
+    type: masque
+    server: {_MASQUE_ENDPOINT_V4}
+    port: {_MASQUE_PORT}
+    sni: {_MASQUE_SNI}
+    private-key: "{node.private_key}"
+    public-key: "{_CLOUDFLARE_MASQUE_PUBKEY}"
+    ip: {node.address_v4}/32
+    ipv6: {node.address_v6}/128
+    mtu: 1280
+    udp: true
+    network: quic
+    remote-dns-resolve: true
+    dns: [ 1.1.1.1, 1.0.0.1 ]
+    handshake-timeout: 30
+    congestion-controller: bbr"""
+
+
 def render_config(
-    node: MasqueNode,
+    nodes: Sequence[MasqueNode],
     port: int = DEFAULT_PROXY_PORT,
     proxied_domains: tuple[str, ...] = _PROXIED_DOMAINS,
+    controller: Controller | None = None,
 ) -> str:
     """Renders the mihomo configuration. Pure, so the policy is testable.
 
@@ -376,38 +455,108 @@ def render_config(
     WARP, and every other fetch takes the path it would have taken with this
     module absent. Private space needs no rule of its own, because the
     catch-all already sends it direct.
+
+    The rules name a `load-balance` group rather than a proxy, with one MASQUE
+    session per node behind it. One QUIC session at MTU 1280 was the ceiling on
+    proxied throughput however many builds shared it. Round-robin spreads new
+    connections across the sessions, including connections to one host, which
+    is the case that matters: eight builds pulling from the same PPA. The group
+    health-checks every node, and a node that fails its checks stops receiving
+    connections until it passes again.
+
+    With no nodes the named domains are routed DIRECT as well: the failover
+    configuration, for when no tunnel can be brought back. The listener stays
+    where the builds were told it is, and forwards everything as though it
+    were not there.
     """
-    rules = "\n".join(f"  - DOMAIN-SUFFIX,{domain},{_PROXY_NAME}" for domain in proxied_domains)
+    via = _PROXY_NAME if nodes else "DIRECT"
+    rules = "\n".join(f"  - DOMAIN-SUFFIX,{domain},{via}" for domain in proxied_domains)
+    if controller is None:
+        control = "external-controller: ''"
+    else:
+        control = (
+            f"external-controller: '127.0.0.1:{controller.port}'\n"
+            f"secret: '{controller.secret}'"
+        )
+    if not nodes:
+        proxies = "proxies: []"
+    else:
+        names = tuple(f"{_PROXY_NAME}-{index}" for index in range(1, len(nodes) + 1))
+        members = "\n".join(map(_masque_proxy, names, nodes))
+        proxies = f"""proxies:
+{members}
+proxy-groups:
+  - name: "{_PROXY_NAME}"
+    type: load-balance
+    strategy: round-robin
+    proxies: [ {", ".join(names)} ]
+    url: {_WARP_PROBE_URL}
+    interval: {_HEALTH_INTERVAL_SECONDS}
+    timeout: {_HEALTH_TIMEOUT_MILLISECONDS}
+    max-failed-times: {_HEALTH_FAILURES}
+    lazy: false"""
     return f"""mixed-port: {port}
 allow-lan: true
 bind-address: '*'
 mode: rule
 log-level: warning
-external-controller: ''
+{control}
 geo-auto-update: false
-proxies:
-  - name: "{_PROXY_NAME}"
-    type: masque
-    server: {_MASQUE_ENDPOINT_V4}
-    port: {_MASQUE_PORT}
-    sni: {_MASQUE_SNI}
-    private-key: "{node.private_key}"
-    public-key: "{_CLOUDFLARE_MASQUE_PUBKEY}"
-    ip: {node.address_v4}/32
-    ipv6: {node.address_v6}/128
-    mtu: 1280
-    udp: true
-    network: quic
-    remote-dns-resolve: true
-    dns: [ 1.1.1.1, 1.0.0.1 ]
-    handshake-timeout: 30
-    congestion-controller: bbr
+{proxies}
 rules:
 {rules}
   - MATCH,DIRECT
 """
 
 
+def write_config(config: Path, rendered: str) -> None:
+    """Writes a configuration 0600: it holds a private key and a controller secret.
+
+    Created with the mode rather than chmodded after, so there is no moment at
+    which the key sits in a world-readable file.
+    """
+    config.touch(mode=0o600, exist_ok=True)
+    config.chmod(0o600)
+    config.write_text(rendered, encoding="utf-8")
+
+
+def private_log(path: Path) -> BinaryIO:
+    """A log file for a detached child, appended to and readable by this user only."""
+    return os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600), "ab")
+
+
+def proxied_domains(learned: Iterable[str]) -> tuple[str, ...]:
+    """The hand-written allowlist plus learned hosts it does not already cover."""
+    covered = _PROXIED_DOMAINS
+    extra = sorted(
+        host
+        for host in set(learned)
+        if not any(host == domain or host.endswith(f".{domain}") for domain in covered)
+    )
+    return (*covered, *extra)
+
+
+def reload(controller: Controller, config: Path, timeout_seconds: float = 10.0) -> bool:
+    """Has the running mihomo re-read `config` in place. False if it did not.
+
+    A hot reload rather than a restart: the listener the builds were pointed at
+    stays up throughout, so a build mid-fetch loses at most its one connection.
+    """
+    try:
+        response = httpx.put(
+            f"{controller.url}/configs",
+            params={"force": "true"},
+            json={"path": str(config)},
+            headers={"Authorization": f"Bearer {controller.secret}"},
+            timeout=timeout_seconds,
+        )
+        response.raise_for_status()
+    except httpx.HTTPError as error:
+        logger.warning("mihomo did not take the new configuration: %s", error)
+        return False
+    return True
+
+
 def bridge_address(default: str = _DEFAULT_BRIDGE_ADDRESS) -> str:
     """The runner's address on the docker bridge, as seen from inside a build.
 
@@ -485,10 +634,12 @@ def warp_egress(proxy_url: str, timeout_seconds: float = 15.0) -> bool:
 
 def start_proxy(
     binary: Path,
-    node: MasqueNode,
+    nodes: Sequence[MasqueNode],
     working_dir: Path,
     port: int = DEFAULT_PROXY_PORT,
     startup_timeout_seconds: float = 30.0,
+    controller: Controller | None = None,
+    proxied_domains: tuple[str, ...] = _PROXIED_DOMAINS,
 ) -> EgressStatus:
     """Starts mihomo detached, to live as long as the job does.
 
@@ -500,9 +651,13 @@ def start_proxy(
     teardown -- which is sound precisely because these runners are ephemeral
     and single-tenant.
 
-    Output goes to the void rather than the log. The configuration holds a
-    private key, and on a public repository the job log is world-readable as it
-    is being written.
+    Output goes to `mihomo.log` beside the configuration, created 0600, rather
+    than to the job log. The configuration holds a private key, and on a public
+    repository the job log is world-readable as it is being written. The file
+    is what `ci.allowlist` learns from: every DIRECT dial that timed out.
+
+    With a `controller`, mihomo also serves its REST controller on loopback,
+    which is what lets `ci.watchdog` fail the tunnel over without a restart.
     """
     working_dir.mkdir(parents=True, exist_ok=True)
     config = working_dir / "config.yaml"
@@ -510,29 +665,29 @@ def start_proxy(
     # Written 0600 and left in place: mihomo re-reads it, and the file lives on
     # a single-tenant VM that is destroyed with the job. Deleting it post-start
     # would buy nothing and break a reload.
-    config.touch(mode=0o600, exist_ok=True)
-    config.write_text(render_config(node, port), encoding="utf-8")
+    write_config(config, render_config(nodes, port, proxied_domains, controller))
 
     try:
-        subprocess.Popen(
-            [str(binary), "-f", str(config), "-d", str(working_dir)],
-            # All three streams are detached, and not only to keep the private
-            # key out of a world-readable log. The Actions runner collects a
-            # step's output through pipes and waits for EOF on them; a
-            # background child that inherits those descriptors holds them open
-            # after the step's own command returns, and the step then hangs
-            # until it is killed. Inheriting stdin risks the same stall against
-            # a prompt nobody can answer.
-            stdin=subprocess.DEVNULL,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-            # Its own session, so the runner tearing down this step's process
-            # group does not take the proxy with it -- the whole point is to
-            # outlive the step that starts it. The runner still reaps orphans
-            # during "Complete job", which is exactly the lifetime wanted: one
-            # job, then gone.
-            start_new_session=True,
-        )
+        with private_log(working_dir / "mihomo.log") as log:
+            subprocess.Popen(
+                [str(binary), "-f", str(config), "-d", str(working_dir)],
+                # No stream is inherited, and not only to keep the private key
+                # out of a world-readable log. The Actions runner collects a
+                # step's output through pipes and waits for EOF on them; a
+                # background child that inherits those descriptors holds them
+                # open after the step's own command returns, and the step then
+                # hangs until it is killed. Inheriting stdin risks the same
+                # stall against a prompt nobody can answer.
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                # Its own session, so the runner tearing down this step's
+                # process group does not take the proxy with it -- the whole
+                # point is to outlive the step that starts it. The runner still
+                # reaps orphans during "Complete job", which is exactly the
+                # lifetime wanted: one job, then gone.
+                start_new_session=True,
+            )
     except OSError as error:
         return ProxyUnavailable(f"could not start mihomo: {error}")
 
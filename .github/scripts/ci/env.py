@@ -47,6 +47,14 @@ COUNT: TypeAdapter[int] = TypeAdapter(Annotated[int, Field(ge=1)])
 
 PORT: TypeAdapter[int] = TypeAdapter(Annotated[int, Field(ge=1, le=65535)])
 
+# A quantity of disk in whole GiB. Zero is allowed: a low watermark of zero is
+# how pruning is switched off without a second variable to say so.
+GIBIBYTES: TypeAdapter[int] = TypeAdapter(Annotated[int, Field(ge=0)])
+
+# An opt-in switch. Pydantic's lax booleans, so "true", "1", "yes" and "on" all
+# read as set, and anything it cannot read is an explained error, not a silent off.
+FLAG: TypeAdapter[bool] = TypeAdapter(bool)
+
 # Unbounded on purpose: the workflow's convention is that a non-positive retry
 # budget means unlimited, so `ge` would reject the very value that expresses it.
 RETRIES: TypeAdapter[int] = TypeAdapter(int)
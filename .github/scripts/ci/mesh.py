@@ -14,6 +14,7 @@ Reconciliation against the registry is what turns that into a guarantee.
 
 from __future__ import annotations
 
+import functools
 import hmac
 import json
 import logging
@@ -30,7 +31,7 @@ from typing import Annotated, Any, assert_never
 import httpx
 from pydantic import BaseModel, Field, ValidationError
 
-from ci.derive import Derivation, Scope, material
+from ci.derive import Derivation, Prepared, Scope, material
 from ci.domain import (
     Authenticated,
     AuthOutcome,
@@ -130,6 +131,22 @@ RUN_KEY = Derivation(scope=Scope(b"mesh-key-v1"), width=32)
 REQUEST = Derivation(scope=Scope(b"mesh-req-v1"), width=32)
 BODY = Derivation(scope=Scope(b"mesh-body-v1"), width=32)
 
+# Every request is signed or verified, and every body digested, under state set
+# up once rather than per message; see `Derivation.prepared`. The body digest is
+# unkeyed, so one state serves the process.
+_BODY = BODY.prepared()
+
+
+@functools.lru_cache(maxsize=8)
+def _signer(key: bytes) -> Prepared:
+    """REQUEST under `key`, prepared on first use.
+
+    Cached by key so the signing functions keep taking the key itself. A run
+    has one mesh key, and a test a handful; the bound is only so a caller that
+    cycled keys could not grow this without limit.
+    """
+    return REQUEST.prepared(key)
+
 
 def derive_run_key(repository_secret: str, run_id: str, run_attempt: str = "1") -> bytes:
     """Derives this execution's mesh key from the long-lived repository secret.
@@ -152,7 +169,7 @@ def derive_run_key(repository_secret: str, run_id: str, run_attempt: str = "1")
 
 def body_digest(body: bytes) -> str:
     """Digests a body so a signature can commit to it without it being read."""
-    return BODY.over(body).hex()
+    return _BODY.over(body).hex()
 
 
 def canonical_request(
@@ -180,8 +197,8 @@ def sign_request(
     key: bytes, method: str, path: str, timestamp: str, content_length: int, digest: str
 ) -> str:
     """Tags a request. Keyed BLAKE2b is a MAC by construction; no HMAC wrapper."""
-    return REQUEST.over(
-        canonical_request(method, path, timestamp, content_length, digest), key=key
+    return _signer(key).over(
+        canonical_request(method, path, timestamp, content_length, digest)
     ).hex()
 
 
@@ -0,0 +1,81 @@
+"""Small JSON documents carried between runs, read as untrusted input.
+
+Some facts outlive a run: a registry answer about an immutable tag, a parse of a
+file whose bytes have not changed. The workflow carries them between runs
+through the Actions cache, and this module is the one place they cross back into
+the process.
+
+Two rules, both inherited from how the rest of `ci` treats its inputs.
+
+*A document is parsed, never believed.* It was written by an earlier run of
+unknown vintage -- possibly by a version of this code with a different schema --
+so it passes through a `TypeAdapter` on the way in, exactly as the environment
+does in `ci.env`.
+
+*A missing or broken document is a cold start, not a failure.* Everything kept
+here can be recomputed; keeping it only saves the recomputation. So a document
+that is absent, unreadable, or in a shape this version does not recognise
+yields the caller's default and a log line, and the run proceeds as it did
+before the document existed.
+
+Writes are atomic for the same reason `ci.assets` installs atomically: a run
+cancelled mid-write must leave the previous document or the new one, never a
+prefix that the next run has to recognise as incomplete.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from contextlib import suppress
+from pathlib import Path
+
+from pydantic import TypeAdapter, ValidationError
+
+logger = logging.getLogger("ci.persisted")
+
+
+def load[T](path: Path, schema: TypeAdapter[T], default: T) -> T:
+    """The document at `path`, or `default` if there is none worth reading."""
+    try:
+        raw = path.read_bytes()
+    except FileNotFoundError:
+        logger.info("No %s carried over; starting cold.", path.name)
+        return default
+    except OSError as error:
+        logger.warning("Could not read %s (%s); starting cold.", path, error)
+        return default
+    try:
+        return schema.validate_json(raw)
+    except ValidationError as error:
+        logger.warning(
+            "Discarding %s: not in the expected shape (%d problem(s)).", path, error.error_count()
+        )
+        return default
+
+
+def save[T](path: Path, schema: TypeAdapter[T], value: T) -> None:
+    """Writes `value` to `path` atomically. Best-effort: a failure is logged.
+
+    Nothing downstream depends on the write landing -- the next run simply starts
+    colder -- so an unwritable cache directory must not fail the job that was
+    only trying to be helpful to its successor.
+    """
+    staged = path.with_name(f".{path.name}.partial")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        staged.write_bytes(schema.dump_json(value))
+        staged.replace(path)
+    except OSError as error:
+        logger.warning("Could not write %s (%s); the next run starts cold.", path, error)
+        with suppress(OSError):
+            staged.unlink(missing_ok=True)
+
+
+def configured_path(raw: str) -> Path | None:
+    """A path named by an environment variable, where empty means "not kept".
+
+    Kept optional throughout: a fork, or a local run, that configures no cache
+    loses the saving and nothing else.
+    """
+    return Path(os.path.expanduser(raw)) if raw.strip() else None
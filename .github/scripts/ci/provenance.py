@@ -25,9 +25,17 @@ from __future__ import annotations
 import json
 import logging
 import subprocess
-from collections.abc import Mapping, Sequence
+import threading
+import time
+from collections.abc import Callable, Mapping, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
 from typing import Any, assert_never
 
+from pydantic import TypeAdapter
+
+from ci import persisted, ratelimit
 from ci.domain import (
     BatchId,
     Dependency,
@@ -64,6 +72,21 @@ CONSUMES_LABEL = f"{_PREFIX}.consumes"
 # must cost one edge's worth of waiting, not the job's remaining hours.
 _INSPECT_TIMEOUT_SECONDS = 60
 
+# How long a floating tag's answer is believed. Long enough that every sibling
+# building in the same stretch of a run shares one inspection, short enough that
+# a tag moved mid-run is noticed by the builds that start after it. Pinned
+# references never expire: see `ResolutionCache`.
+_FLOATING_TTL_SECONDS = 600.0
+
+# Edges of one task resolved at once. Every slot in a worker resolves its own
+# task's edges concurrently with the others, so this multiplies with
+# BUILD_SLOTS; kept small for the registry's sake rather than the runner's.
+_EDGE_CONCURRENCY = 4
+
+# The shape of `resolve`, for whatever stands in for it: a cache in a worker, a
+# table in a test.
+Lookup = Callable[[str, Platform], Provenance]
+
 
 def rendered(provenance: Provenance) -> dict[str, str]:
     """The JSON shape of one resolution, tag included.
@@ -97,6 +120,10 @@ def _configuration_for(payload: Any, platform: Platform) -> Mapping[str, Any] |
     directly. Asking per platform rather than merging them is deliberate -- the
     build consuming this dependency runs on one architecture, and that
     architecture's answer is the only one that bears on it.
+
+    `resolve` now asks for one platform's manifest by digest, so the keyed shape
+    is the one it should no longer see; it is still read rather than rejected,
+    since an index nested inside an index would report it.
     """
     if not isinstance(payload, Mapping):
         return None
@@ -165,6 +192,64 @@ def _built_on(configuration: Mapping[str, Any]) -> Mapping[str, BatchId]:
     return dict(filter(None, map(_minted_entry, entries)))
 
 
+def _inspect(reference: str, template: str) -> Any:
+    """One `imagetools inspect`, its JSON decoded; `Unreadable` on any failure.
+
+    Total for the reason `resolve` is. The template decides what buildx fetches,
+    not just what it prints: it loads image configurations only when the
+    template reads `.Image`, so `.Manifest` costs the index alone. Run inside
+    the process's registry window, shared with every other registry call.
+    """
+    try:
+        completed = ratelimit.REGISTRY.run(
+            ("docker", "buildx", "imagetools", "inspect", "--format", template, reference),
+            timeout=_INSPECT_TIMEOUT_SECONDS,
+        )
+        if completed.returncode != 0:
+            return Unreadable(f"inspect exited {completed.returncode}")
+        return json.loads(completed.stdout)
+    except (OSError, subprocess.SubprocessError, json.JSONDecodeError) as error:
+        return Unreadable(f"{type(error).__name__}: {error}")
+
+
+def _repository_of(reference: str) -> str:
+    """`reference` without its tag or digest, so a digest can be put in their place.
+
+    The last colon is a tag separator only when no slash follows it; otherwise
+    it is a registry's port and the reference had no tag at all.
+    """
+    if "@" in reference:
+        return reference.partition("@")[0]
+    name, colon, tag = reference.rpartition(":")
+    return name if colon and "/" not in tag else reference
+
+
+def _platform_manifest(index: Mapping[str, Any], platform: Platform) -> str | None:
+    """The digest of this platform's manifest within an image index.
+
+    Matched on OS and architecture only. A variant (`arm64/v8`) narrows nothing
+    here, since this repository publishes one manifest per architecture, and the
+    attestation manifests buildx adds alongside are `unknown/unknown` and so
+    never match.
+    """
+    manifests = index.get("manifests")
+    if not isinstance(manifests, list):
+        return None
+    for descriptor in manifests:
+        if not isinstance(descriptor, Mapping):
+            continue
+        described = descriptor.get("platform")
+        digest = descriptor.get("digest")
+        if (
+            isinstance(described, Mapping)
+            and described.get("os") == "linux"
+            and described.get("architecture") == str(platform)
+            and isinstance(digest, str)
+        ):
+            return digest
+    return None
+
+
 def resolve(reference: str, platform: Platform) -> Provenance:
     """Asks the registry what `reference` currently is, for one platform.
 
@@ -177,29 +262,40 @@ def resolve(reference: str, platform: Platform) -> Provenance:
     what makes the answer a statement about the image rather than about the
     registry at an earlier instant. Asking about a floating tag and building
     against a pinned one would describe a different image than the one consumed.
-    """
-    try:
-        completed = subprocess.run(
-            ("docker", "buildx", "imagetools", "inspect", "--format", "{{json .}}", reference),
-            capture_output=True,
-            check=False,
-            timeout=_INSPECT_TIMEOUT_SECONDS,
-        )
-        if completed.returncode != 0:
-            return Unreadable(f"inspect exited {completed.returncode}")
-        payload = json.loads(completed.stdout)
-    except (OSError, subprocess.SubprocessError, json.JSONDecodeError) as error:
-        return Unreadable(f"{type(error).__name__}: {error}")
 
-    if not isinstance(payload, Mapping):
+    Two inspections, and the second is scoped to one platform. Inspecting the
+    tag with `{{json .}}` made buildx fetch the configuration of every platform
+    in the index so that `_configuration_for` could discard all but one; the
+    registry traffic per edge grew with every architecture published. Now the
+    index is fetched alone, this platform's manifest is picked out of it, and
+    only that manifest's configuration is fetched -- by digest, so the two
+    requests cannot straddle a tag that moved between them. The digest reported
+    is still the index's, which is what a consumer pulling the tag receives.
+    """
+    index = _inspect(reference, "{{json .Manifest}}")
+    if isinstance(index, Unreadable):
+        return index
+    if not isinstance(index, Mapping):
         return Unreadable("inspect returned a non-object payload")
 
-    manifest = payload.get("manifest")
-    digest = manifest.get("digest") if isinstance(manifest, Mapping) else None
+    digest = index.get("digest")
     if not isinstance(digest, str):
         return Unreadable("inspect returned no manifest digest")
 
-    configuration = _configuration_for(payload.get("image"), platform)
+    # A single-platform tag is its own manifest, and its configuration is the
+    # only one there is to fetch.
+    scoped = reference
+    if "manifests" in index:
+        chosen = _platform_manifest(index, platform)
+        if chosen is None:
+            return Unreadable(f"no image configuration for linux/{platform}")
+        scoped = f"{_repository_of(reference)}@{chosen}"
+
+    image = _inspect(scoped, "{{json .Image}}")
+    if isinstance(image, Unreadable):
+        return image
+
+    configuration = _configuration_for(image, platform)
     if configuration is None:
         return Unreadable(f"no image configuration for linux/{platform}")
 
@@ -209,6 +305,216 @@ def resolve(reference: str, platform: Platform) -> Provenance:
     return Minted(batch=batch, digest=digest, built_on=_built_on(configuration))
 
 
+def _immutable(reference: str) -> bool:
+    """Whether `reference` can never come to name different content.
+
+    A digest reference is content-addressed. A pinned `{image}.{batch}` tag is
+    immutable by convention rather than by the registry: every run publishes
+    under a batch of its own, so nothing ever writes the same one twice. Both
+    may be believed for as long as the process lives.
+    """
+    if "@" in reference:
+        return True
+    tag = reference.rpartition(":")[2]
+    name, dot, suffix = tag.rpartition(".")
+    return bool(name and dot) and BatchId.parse(suffix) is not None
+
+
+@dataclass(frozen=True, slots=True)
+class _Cached:
+    provenance: Provenance
+    # Monotonic seconds after which the answer is asked again; None for never.
+    expires_at: float | None
+
+
+@dataclass(slots=True)
+class _Flight:
+    """One lookup in progress, which every concurrent asker waits on."""
+
+    done: threading.Event = field(default_factory=threading.Event)
+    result: Provenance = Unreadable("resolution did not complete")
+
+
+class ResolutionCache:
+    """A shared, single-flight memo of `resolve`, for every slot in a process.
+
+    Each task resolves its own edges, and siblings share them: every image built
+    on `code-server-base` asks the registry about the same pinned reference, one
+    `imagetools inspect` subprocess each. One instance per worker (and one per
+    reconcile) collapses those to a single inspection per reference.
+
+    Single-flight, because the siblings are usually dealt together and start
+    together: a plain memo would let four slots miss at once and run four
+    inspections anyway. The first asker resolves; the rest wait on its answer.
+
+    `Unreadable` is never stored. It is an answer about the registry at one
+    instant -- a timeout, a rate limit -- and caching it would turn a transient
+    failure into the answer for every later build in the run. Pinned references
+    are kept for the whole run, floating ones for `ttl_seconds`.
+
+    Callable with `resolve`'s signature, so it is passed wherever a `Lookup` is.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = _FLOATING_TTL_SECONDS,
+        resolver: Lookup | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._ttl_seconds = ttl_seconds
+        self._resolver = resolver
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: dict[tuple[str, Platform], _Cached] = {}
+        self._in_flight: dict[tuple[str, Platform], _Flight] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, reference: str, platform: Platform) -> Provenance:
+        key = (reference, platform)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and (
+                cached.expires_at is None or self._clock() < cached.expires_at
+            ):
+                self.hits += 1
+                return cached.provenance
+            flight = self._in_flight.get(key)
+            leading = flight is None
+            if flight is None:
+                flight = self._in_flight[key] = _Flight()
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if not leading:
+            flight.done.wait()
+            return flight.result
+
+        # Looked up at call time rather than bound at construction, so a
+        # replaced `resolve` is the one a default cache consults.
+        resolver = self._resolver if self._resolver is not None else resolve
+        try:
+            flight.result = resolver(reference, platform)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+                if not isinstance(flight.result, Unreadable):
+                    self._entries[key] = _Cached(
+                        provenance=flight.result,
+                        expires_at=None
+                        if _immutable(reference)
+                        else self._clock() + self._ttl_seconds,
+                    )
+            # Set even when the resolver raised, so no waiter is left hanging;
+            # they see the flight's default `Unreadable` and the leader re-raises.
+            flight.done.set()
+        return flight.result
+
+
+@dataclass(frozen=True, slots=True)
+class _Remembered:
+    """One `Minted` answer as it is carried between runs: plain strings only.
+
+    Strings rather than `BatchId`s because this is what an earlier run wrote,
+    and it crosses back into the domain through `BatchId.parse` like every
+    other batch read from outside the process.
+    """
+
+    reference: str
+    platform: str
+    batch: str
+    digest: str
+    built_on: Mapping[str, str]
+
+
+_REMEMBERED: TypeAdapter[tuple[_Remembered, ...]] = TypeAdapter(tuple[_Remembered, ...])
+
+
+def _admitted(entry: _Remembered) -> tuple[tuple[str, Platform], Minted] | None:
+    """A remembered answer back in the domain, or absence if any part is not."""
+    platform = Platform.parse(entry.platform)
+    batch = BatchId.parse(entry.batch)
+    built_on = {image: BatchId.parse(raw) for image, raw in entry.built_on.items()}
+    if platform is None or batch is None or not _immutable(entry.reference):
+        return None
+    return (entry.reference, platform), Minted(
+        batch=batch,
+        digest=entry.digest,
+        built_on={image: parsed for image, parsed in built_on.items() if parsed is not None},
+    )
+
+
+class ProvenanceIndex:
+    """What immutable references resolved to on earlier runs, carried forward.
+
+    The generation walk asks about the probe at each older batch in turn, and
+    every one of those references is pinned: the answer for `probe.{batch}` can
+    never change once that batch was published. Each plan job still repeated the
+    whole walk against the registry, so planning grew with the table's depth.
+
+    Only the newest hop -- the floating probe -- is now asked of the registry on
+    every run. Its answer is also remembered under the pinned reference it is
+    equal to, `probe.{batch}`, because the manifest stage publishes the floating
+    and pinned tags of one build together. That is exactly the reference the
+    next run's walk asks for second, so a warm index turns the walk into one
+    inspection however deep it goes.
+
+    Callable with `resolve`'s signature, so `generations` takes it as its
+    `lookup`. Only what this run touched is saved, which bounds the document by
+    the table's depth rather than by how many runs have come before.
+    """
+
+    def __init__(
+        self,
+        remembered: Mapping[tuple[str, Platform], Minted] | None = None,
+        resolver: Lookup | None = None,
+    ) -> None:
+        self._remembered = dict(remembered or {})
+        self._resolver = resolver
+        self._touched: dict[tuple[str, Platform], Minted] = {}
+        self.reused = 0
+        self.asked = 0
+
+    @classmethod
+    def load(cls, path: Path, resolver: Lookup | None = None) -> ProvenanceIndex:
+        entries = persisted.load(path, _REMEMBERED, ())
+        return cls(dict(filter(None, map(_admitted, entries))), resolver)
+
+    def save(self, path: Path) -> None:
+        persisted.save(
+            path,
+            _REMEMBERED,
+            tuple(
+                _Remembered(
+                    reference=reference,
+                    platform=str(platform),
+                    batch=str(minted.batch),
+                    digest=minted.digest,
+                    built_on={image: str(batch) for image, batch in minted.built_on.items()},
+                )
+                for (reference, platform), minted in sorted(self._touched.items())
+            ),
+        )
+
+    def __call__(self, reference: str, platform: Platform) -> Provenance:
+        key = (reference, platform)
+        known = self._remembered.get(key)
+        if known is not None:
+            self.reused += 1
+            self._touched[key] = known
+            return known
+
+        self.asked += 1
+        resolver = self._resolver if self._resolver is not None else resolve
+        found = resolver(reference, platform)
+        if isinstance(found, Minted):
+            pinned = reference if _immutable(reference) else f"{reference}{selector(found.batch)}"
+            self._remembered[(pinned, platform)] = found
+            self._touched[(pinned, platform)] = found
+        return found
+
+
 def _chosen(dependency: Dependency, generations: Sequence[BatchId]) -> BatchId | None:
     """The generation this edge must reach, or absence to leave it floating.
 
@@ -230,7 +536,8 @@ def _edge_from(
     registry_repository: str,
     platform: Platform,
     generations: Sequence[BatchId],
-) -> ResolvedEdge:
+    lookup: Lookup,
+) -> tuple[ResolvedEdge, str | None]:
     """One edge: the reference the build will be given, and what it resolves to.
 
     The pinned reference is tried first and the floating tag is the fallback,
@@ -244,23 +551,29 @@ def _edge_from(
     is what this did before, published a `consumes` record naming a generation
     the image was not assembled from -- and since the skew check reads exactly
     that record, it reported the skew that pinning had just prevented.
+
+    Returns why the pinned reference was abandoned, when it was, rather than
+    logging it: edges resolve concurrently, and the caller is what puts their
+    lines back in order.
     """
+    fell_back: str | None = None
     chosen = _chosen(dependency, generations)
     if chosen is not None:
         pinned = f"{registry_repository}:{dependency.image}{selector(chosen)}"
-        found = resolve(pinned, platform)
+        found = lookup(pinned, platform)
         if not isinstance(found, Unreadable):
-            return ResolvedEdge(dependency=dependency, provenance=found, reference=pinned)
-        logger.warning(
-            "  %s: generation %s did not resolve (%s); falling back to the floating tag",
-            dependency.image,
-            chosen,
-            found.reason,
+            return ResolvedEdge(dependency=dependency, provenance=found, reference=pinned), None
+        fell_back = (
+            f"generation {chosen} did not resolve ({found.reason}); "
+            "falling back to the floating tag"
         )
 
     floating = f"{registry_repository}:{dependency.image}"
-    return ResolvedEdge(
-        dependency=dependency, provenance=resolve(floating, platform), reference=floating
+    return (
+        ResolvedEdge(
+            dependency=dependency, provenance=lookup(floating, platform), reference=floating
+        ),
+        fell_back,
     )
 
 
@@ -269,29 +582,52 @@ def resolve_all(
     registry_repository: str,
     platform: Platform,
     generations: Sequence[BatchId] = (),
+    lookup: Lookup | None = None,
 ) -> tuple[ResolvedEdge, ...]:
     """Every edge of one task, pinned and resolved.
 
-    Sequential, and the boundedness argument is the graph's: an image has a
-    handful of edges, so the concurrency that matters is already the one between
-    tasks. Logged per edge because this is the observable boundary -- a build log
-    that says which reference each input came from is the whole point of the
-    exercise.
+    Concurrent, because this stands between a slot and the start of its build:
+    sequentially, the delay was the sum of every edge's round trips -- two each
+    when a pinned reference falls back -- and `code-server-full` alone consumes
+    several toolchains. At once, it is the slowest edge's. Bounded by
+    `_EDGE_CONCURRENCY`, since every slot in the worker is doing the same.
+
+    The result and the log both keep the order of `dependencies`. The labels are
+    rendered from this tuple, so an order that varied with registry latency
+    would vary the image's digest; and a build log that says which reference
+    each input came from is the whole point of the exercise, so its lines are
+    written after the fact, in order, rather than as answers happen to arrive.
+
+    `lookup` is how the registry is asked, `resolve` when not given. A worker
+    passes its `ResolutionCache`, so the edges its tasks share are inspected
+    once rather than once per task.
     """
-    resolved = tuple(
-        _edge_from(dependency, registry_repository, platform, generations)
-        for dependency in dependencies
-    )
-    for edge in resolved:
+    if not dependencies:
+        return ()
+
+    ask = lookup if lookup is not None else resolve
+
+    def edge(dependency: Dependency) -> tuple[ResolvedEdge, str | None]:
+        return _edge_from(dependency, registry_repository, platform, generations, ask)
+
+    with ThreadPoolExecutor(
+        max_workers=min(len(dependencies), _EDGE_CONCURRENCY),
+        thread_name_prefix="edge",
+    ) as pool:
+        outcomes = tuple(pool.map(edge, dependencies))
+
+    for resolved_edge, fell_back in outcomes:
+        if fell_back is not None:
+            logger.warning("  %s: %s", resolved_edge.dependency.image, fell_back)
         logger.info(
             "  consumes %s (%s, %d back) as %s: %s",
-            edge.dependency.image,
-            edge.dependency.usage,
-            edge.dependency.generations_back,
-            edge.reference,
-            json.dumps(rendered(edge.provenance), sort_keys=True),
+            resolved_edge.dependency.image,
+            resolved_edge.dependency.usage,
+            resolved_edge.dependency.generations_back,
+            resolved_edge.reference,
+            json.dumps(rendered(resolved_edge.provenance), sort_keys=True),
         )
-    return resolved
+    return tuple(resolved_edge for resolved_edge, _ in outcomes)
 
 
 # --- rendering to labels ----------------------------------------------------
@@ -371,7 +707,12 @@ def label_arguments(
 
 
 def generations(
-    probe: str, base: str, registry_repository: str, platform: Platform, depth: int
+    probe: str,
+    base: str,
+    registry_repository: str,
+    platform: Platform,
+    depth: int,
+    lookup: Lookup | None = None,
 ) -> tuple[BatchId, ...]:
     """The batches of the last `depth` complete runs, newest first.
 
@@ -392,8 +733,13 @@ def generations(
     reaching past its end. That is also the bootstrap: on a registry with no
     labels at all this returns nothing and every reference behaves as it did
     before the mechanism existed.
+
+    Every hop after the first names a pinned reference, so passing a
+    `ProvenanceIndex` as `lookup` answers those from what earlier runs learned
+    and leaves the registry only the newest hop to verify.
     """
-    found = resolve(f"{registry_repository}:{probe}", platform)
+    ask = lookup if lookup is not None else resolve
+    found = ask(f"{registry_repository}:{probe}", platform)
     if not isinstance(found, Minted):
         logger.warning("No generation table: %s did not resolve to a labelled build", probe)
         return ()
@@ -404,7 +750,7 @@ def generations(
         if older is None:
             break
         table.append(older)
-        found = resolve(f"{registry_repository}:{probe}.{older}", platform)
+        found = ask(f"{registry_repository}:{probe}.{older}", platform)
         if not isinstance(found, Minted):
             break
 
@@ -0,0 +1,197 @@
+"""Provisioning a worker's runner concurrently rather than one wait at a time.
+
+Before its first build a worker frees disk, sets up clean egress, fetches and
+verifies cloudflared, and its first builder pulls BuildKit. Each of those is a
+wait -- on apt and rm, on Cloudflare's API and MASQUE edge, on GitHub's release
+CDN, on Docker Hub -- and none of them waits on another. Run in sequence their
+times add up before anything is built; run together the worker pays roughly the
+longest of them.
+
+What depends on what is stated rather than implied by the order of lines:
+builds need egress published and the disk freed, and the mesh needs
+cloudflared. Each consumer waits on exactly the stages it names, so a worker
+joining the mesh does not wait for apt, and a slow cleanup never holds back the
+tunnel. A stage can name others it needs in the same way.
+
+Every stage has a fallback, and it is what the worker had before this module
+whenever that stage failed: no proxy, no cloudflared, a builder that pulls
+BuildKit itself. A stage that raises yields its fallback, and so does one still
+running at its deadline -- the bound `timeout-minutes` gave egress when it was
+a step of its own. An overrunning stage is abandoned rather than cancelled,
+since nothing here can be interrupted safely halfway through apt; a result that
+arrives late is discarded.
+
+Stages run on daemon threads rather than an executor. An executor joins its
+threads at interpreter exit, which would hold the worker's exit hostage to the
+very wait a deadline had already given up on.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass
+from typing import Any, assert_never
+
+logger = logging.getLogger("ci.provisioning")
+
+
+@dataclass(frozen=True, slots=True)
+class Finished:
+    seconds: float
+
+
+@dataclass(frozen=True, slots=True)
+class Raised:
+    seconds: float
+    error: str
+
+
+@dataclass(frozen=True, slots=True)
+class Overran:
+    """Still running at its deadline; the fallback stood in for it."""
+
+    deadline_seconds: float
+
+
+Settled = Finished | Raised | Overran
+
+
+def _daemon(target: Callable[[], None], name: str) -> None:
+    threading.Thread(target=target, name=f"provision-{name}", daemon=True).start()
+
+
+class Stage[T]:
+    """One provisioning step under way. `wait` yields its result, or its fallback."""
+
+    def __init__(
+        self,
+        name: str,
+        fallback: T,
+        deadline_seconds: float | None,
+        clock: Callable[[], float],
+    ) -> None:
+        self.name = name
+        self._fallback = fallback
+        self._deadline_seconds = deadline_seconds
+        self._deadline = None if deadline_seconds is None else clock() + deadline_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._result = fallback
+        self._settled: Settled | None = None
+
+    @property
+    def settled(self) -> Settled | None:
+        """How the stage ended, or None while it is still running unawaited."""
+        with self._lock:
+            return self._settled
+
+    def wait(self) -> T:
+        """Blocks until the stage settles or its deadline passes, whichever is first."""
+        remaining = None if self._deadline is None else max(0.0, self._deadline - self._clock())
+        if not self._done.wait(remaining):
+            assert self._deadline_seconds is not None
+            self._settle(Overran(self._deadline_seconds), self._fallback)
+        with self._lock:
+            return self._result
+
+    def _run(self, run: Callable[[], T], needs: Sequence[Stage[Any]]) -> None:
+        for need in needs:
+            need.wait()
+        began = self._clock()
+        try:
+            value = run()
+        except Exception as error:
+            logger.warning("Provisioning %s raised; using its fallback.", self.name, exc_info=True)
+            self._settle(Raised(self._clock() - began, str(error)), self._fallback)
+        else:
+            self._settle(Finished(self._clock() - began), value)
+
+    def _settle(self, settled: Settled, value: T) -> None:
+        with self._lock:
+            if self._settled is not None:
+                # Declared overrun already, and a consumer has its fallback.
+                logger.info("Provisioning %s finished after its deadline; unused.", self.name)
+                return
+            self._settled = settled
+            self._result = value
+        if isinstance(settled, Overran):
+            logger.warning(
+                "Provisioning %s still running after %.0fs; continuing with its fallback.",
+                self.name,
+                settled.deadline_seconds,
+            )
+        self._done.set()
+
+
+class Provisioning:
+    """Starts stages at once and reports how long the runner took to provision.
+
+    `spawn` runs a stage's body somewhere other than the caller's thread; tests
+    inject one to drive the stages deterministically.
+    """
+
+    def __init__(
+        self,
+        clock: Callable[[], float] = time.monotonic,
+        spawn: Callable[[Callable[[], None], str], None] = _daemon,
+    ) -> None:
+        self._clock = clock
+        self._spawn = spawn
+        self._began = clock()
+        self._stages: list[Stage[Any]] = []
+
+    def start[T](
+        self,
+        name: str,
+        run: Callable[[], T],
+        fallback: T,
+        needs: Sequence[Stage[Any]] = (),
+        deadline_seconds: float | None = None,
+    ) -> Stage[T]:
+        """Starts `run` once every stage in `needs` has settled.
+
+        The deadline counts from here, not from when `needs` settle: it bounds
+        how long a consumer waits, and a consumer's wait starts now.
+        """
+        stage = Stage(name, fallback, deadline_seconds, self._clock)
+        self._stages.append(stage)
+        self._spawn(lambda: stage._run(run, needs), name)
+        return stage
+
+    def summary(self) -> list[str]:
+        """Markdown: each stage's outcome, and the wall time against the serial sum."""
+        elapsed = self._clock() - self._began
+        serial = sum(
+            settled.seconds
+            for stage in self._stages
+            if isinstance(settled := stage.settled, Finished | Raised)
+        )
+        logger.info(
+            "Provisioned in %.0fs; the same stages one after another took %.0fs.", elapsed, serial
+        )
+        return [
+            f"- provisioned in **{elapsed:.0f}s** (stages sum to {serial:.0f}s)",
+            "",
+            "| Stage | Outcome | Took |",
+            "| --- | --- | --- |",
+            *(_row(stage.name, stage.settled) for stage in self._stages),
+            "",
+        ]
+
+
+def _row(name: str, settled: Settled | None) -> str:
+    match settled:
+        case None:
+            return f"| {name} | still running | |"
+        case Finished(seconds):
+            return f"| {name} | ready | {seconds:.0f}s |"
+        case Raised(seconds, error):
+            return f"| {name} | fell back: {error} | {seconds:.0f}s |"
+        case Overran(deadline_seconds):
+            return f"| {name} | fell back: not ready in {deadline_seconds:.0f}s | |"
+        case other:
+            assert_never(other)
@@ -0,0 +1,173 @@
+"""One concurrency window for everything this process asks of the registry.
+
+The manifest stage fused every image at once, a thread each, and reconcile and
+the provenance lookups each ran their own pool on top. When the registry
+answered 429, every thread backed off on its own schedule and retried into the
+same limit. The window never shrank, because no one thread could see that the
+others were being refused too.
+
+This module is the shared window. Every registry-side subprocess in `ci` runs
+through one `AdaptiveLimiter`, which admits at most `window` of them at a time.
+It adjusts that window the way TCP adjusts its congestion window: additive
+increase, multiplicative decrease. Each answer that was not a refusal grows the
+window by one over its width, so a full window of successes widens it by one.
+Each refusal halves it -- once per window, since the refusals that arrive
+together are one signal, not several -- and pauses every admission briefly, not
+only the refused caller's.
+
+No `Retry-After` is read. Every call here is a buildx subprocess, and buildx
+reports the registry's error text, never the response headers, so there is no
+stated delay to honour; the refusal is recognised from the 429 or the
+`toomanyrequests` code in that text, and the window does the rest.
+
+*A refusal is not an answer.* `tag_exists` reads any failure as absent, and a
+429 read that way is a needless rebuild. So a throttled call is retried here,
+behind the pause, a bounded number of times before it is handed back as-is.
+
+The window arithmetic is a pure function, so the policy is testable without a
+registry; the limiter is its interpreter, with an injectable clock.
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+import subprocess
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+
+logger = logging.getLogger("ci.ratelimit")
+
+# Refusals as buildx reports them. It prints the registry's error rather than
+# the response, so the status code appears in prose or as the OCI error code.
+_THROTTLED = re.compile(r"\b429\b|too many requests|toomanyrequests", re.IGNORECASE)
+
+# The pause a refusal earns. Short, because the halved window is the main
+# response; this only keeps the retry from landing in the same instant as the
+# refusal.
+_PAUSE_SECONDS = 1.0
+
+# How many times a refused call is retried here before being returned refused.
+_THROTTLE_RETRIES = 5
+
+
+@dataclass(frozen=True, slots=True)
+class Window:
+    """How many registry calls may be in flight, and its bounds."""
+
+    size: float
+    floor: float = 1.0
+    ceiling: float = 16.0
+
+    def __post_init__(self) -> None:
+        if not 1 <= self.floor <= self.size <= self.ceiling:
+            raise ValueError(
+                f"window must satisfy 1 <= floor <= size <= ceiling, not "
+                f"{self.floor}, {self.size}, {self.ceiling}"
+            )
+
+    @property
+    def admits(self) -> int:
+        return int(self.size)
+
+    def grown(self) -> Window:
+        """One answer was not a refusal: one more per window's worth of answers."""
+        return Window(min(self.ceiling, self.size + 1 / self.size), self.floor, self.ceiling)
+
+    def halved(self) -> Window:
+        return Window(max(self.floor, self.size / 2), self.floor, self.ceiling)
+
+
+def throttled(stderr: str) -> bool:
+    """Whether a failed registry call was refused for rate, not for cause."""
+    return _THROTTLED.search(stderr) is not None
+
+
+class AdaptiveLimiter:
+    """Admits registry calls through a shared AIMD window.
+
+    Thread-safe; meant to be shared by every thread in a process, which is what
+    lets one thread's refusal slow the others down.
+    """
+
+    def __init__(
+        self,
+        window: Window | None = None,
+        clock: Callable[[], float] = time.monotonic,
+        runner: Callable[..., subprocess.CompletedProcess[str]] = subprocess.run,
+    ) -> None:
+        self._window = window if window is not None else Window(size=4.0)
+        self._clock = clock
+        self._runner = runner
+        self._in_flight = 0
+        self._paused_until = 0.0
+        # Bumped on every cut. A call admitted before the latest cut reports a
+        # refusal the cut already answered, so it does not halve the window again.
+        self._epoch = 0
+        self._changed = threading.Condition()
+        self.refusals = 0
+
+    @property
+    def window(self) -> Window:
+        with self._changed:
+            return self._window
+
+    def _admit(self) -> int:
+        with self._changed:
+            while True:
+                wait = self._paused_until - self._clock()
+                if wait <= 0 and self._in_flight < self._window.admits:
+                    self._in_flight += 1
+                    return self._epoch
+                self._changed.wait(timeout=wait if wait > 0 else None)
+
+    def _release(self, epoch: int, refused: bool) -> None:
+        with self._changed:
+            self._in_flight -= 1
+            if not refused:
+                self._window = self._window.grown()
+            else:
+                self.refusals += 1
+                self._paused_until = max(self._paused_until, self._clock() + _PAUSE_SECONDS)
+                if epoch == self._epoch:
+                    self._epoch += 1
+                    self._window = self._window.halved()
+                    logger.warning(
+                        "Registry refused a call for rate; window now %d.", self._window.admits
+                    )
+            self._changed.notify_all()
+
+    def run(
+        self, command: tuple[str, ...], timeout: float | None = None
+    ) -> subprocess.CompletedProcess[str]:
+        """Runs `command` inside the window, retrying refusals behind the pause.
+
+        Output is captured as text, since a refusal can only be recognised from
+        it. Any other failure is returned to the caller untouched, and a timeout
+        is raised as `subprocess.run` raises it, neither counting for or against
+        the window.
+        """
+        for _ in range(_THROTTLE_RETRIES):
+            epoch = self._admit()
+            try:
+                completed = self._runner(
+                    command, capture_output=True, text=True, check=False, timeout=timeout
+                )
+            except BaseException:
+                with self._changed:
+                    self._in_flight -= 1
+                    self._changed.notify_all()
+                raise
+            refused = completed.returncode != 0 and throttled(completed.stderr or "")
+            self._release(epoch, refused)
+            if not refused:
+                return completed
+        return completed
+
+
+# The process's one window. A module-level instance rather than one threaded
+# through every signature, because the call sites are three layers apart and the
+# point is that they share it.
+REGISTRY = AdaptiveLimiter()
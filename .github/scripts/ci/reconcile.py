@@ -0,0 +1,285 @@
+"""Verifying what landed and rebuilding what did not, as one pipeline.
+
+Reconcile used to run in three strict phases: inspect every expected image, then
+clean the runner's disk, then rebuild what was missing. The first rebuild waited
+on the slowest inspection and on a cleanup measured in minutes, even when the
+first image checked was already known to be missing. After a mass failure that
+wait is all time the run spends doing nothing.
+
+Here each inspection hands a missing image straight to the rebuild scheduler, so
+the first rebuild starts one inspection in. Disk cleanup starts beside it, once,
+when the first missing image is found. It never starts if nothing is missing,
+which is also when the old sequence skipped it. Starting builds before cleanup
+finishes is safe: cleanup only removes toolchains no build uses, and a fresh
+runner has room for the first few builds without it.
+
+*A rebuild waits for what it is built from.* If `code-server-base` and
+`code-server` are both missing, rebuilding them side by side lets the consumer
+resolve its base before this run's base exists, and pin the one from the last
+run. So a missing image is started only once every image of this tree it
+depends on is settled: found present, rebuilt, or -- when another reconcile
+worker owns it -- seen to land in the registry. Another worker's missing image
+is watched for only while a blocked rebuild of this worker's needs it, so a
+peer's failed rebuild that nothing here consumes holds no one. Among images ready together, the
+shallower goes first, and within a level the one with the longest chain of
+consumers behind it, since that chain is what the recovery's length is made of.
+
+The effects -- the registry check, the build, the cleanup -- are passed in, the
+way `ci.scheduling` takes its `execute`, so the pipeline's ordering can be tested
+without Docker.
+"""
+
+from __future__ import annotations
+
+import heapq
+import logging
+import queue
+import threading
+import time
+from collections.abc import Callable, Mapping, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from typing import assert_never
+
+from ci.domain import BuildOutcome, Task
+
+logger = logging.getLogger("ci.reconcile")
+
+# Registry inspections are network-bound and independent, so they run wide; the
+# bound exists to stay well inside registry rate limits, not to save CPU.
+INSPECT_CONCURRENCY = 8
+
+# How often, and for how long, to look for a dependency another worker is
+# rebuilding. The bound is what keeps a worker whose peer died from waiting out
+# the job's timeout: past it, the consumer is built anyway, and pins whatever
+# the registry holds -- which is what every rebuild did before there was an order.
+BARRIER_POLL_SECONDS = 30.0
+BARRIER_TIMEOUT_SECONDS = 3600.0
+
+
+@dataclass(frozen=True, slots=True)
+class Share:
+    """Which of the expected images one reconcile worker rebuilds if missing.
+
+    Assigned by position in the expected list rather than among the missing,
+    because two workers can disagree about what is missing -- a late build may
+    land between their checks -- and ownership must not depend on that. Every
+    image has exactly one owner either way.
+    """
+
+    worker_id: int = 0
+    workers: int = 1
+
+    def __post_init__(self) -> None:
+        if not 0 <= self.worker_id < self.workers:
+            raise ValueError(f"worker {self.worker_id} is not one of {self.workers}")
+
+    def owns(self, index: int) -> bool:
+        return index % self.workers == self.worker_id
+
+
+@dataclass(frozen=True, slots=True)
+class Recovery:
+    """What this worker found missing and rebuilt, and what that produced.
+
+    Both in the order the tasks were expected in, not the order checks or
+    rebuilds happened to finish, so the summary reads the same on every run.
+    """
+
+    missing: tuple[Task, ...]
+    outcomes: tuple[BuildOutcome, ...]
+
+
+# --- what the pipeline hears back -------------------------------------------
+
+
+@dataclass(frozen=True, slots=True)
+class _Checked:
+    index: int
+    present: Future[bool]
+
+
+@dataclass(frozen=True, slots=True)
+class _Arrived:
+    """Another worker's image landed, or this worker stopped waiting for it.
+
+    `released` when the watch was called off because nothing blocked still
+    needed the image: it has not landed, and is watched again if that changes.
+    """
+
+    index: int
+    released: bool = False
+
+
+@dataclass(frozen=True, slots=True)
+class _Rebuilt:
+    index: int
+    outcome: Future[BuildOutcome]
+
+
+_Event = _Checked | _Arrived | _Rebuilt
+
+
+def priorities(expected: Sequence[Task], levels: Mapping[str, int]) -> dict[str, tuple[int, int]]:
+    """Each image's place in the rebuild order: level, then longest chain behind it.
+
+    The chain is counted through consumers this reconcile expects, from the top
+    level down, so each image's consumers are counted before the image itself.
+    Negated so that a smaller key is the sooner start, which is what a heap pops.
+    """
+    tasks = {task.image: task for task in expected}
+    behind: dict[str, int] = {}
+    for image in sorted(tasks, key=lambda image: levels.get(image, 0), reverse=True):
+        behind[image] = 1 + max(
+            (behind.get(consumer, 0) for consumer in tasks[image].dependents if consumer in tasks),
+            default=0,
+        )
+    return {image: (levels.get(image, 0), -behind[image]) for image in tasks}
+
+
+def stream(
+    expected: Sequence[Task],
+    landed: Callable[[Task], bool],
+    rebuild: Callable[[Task], BuildOutcome],
+    slots: int,
+    cleanup: Callable[[], None] = lambda: None,
+    levels: Mapping[str, int] | None = None,
+    share: Share | None = None,
+    inspect_width: int = INSPECT_CONCURRENCY,
+    sleep: Callable[[float], None] = time.sleep,
+    clock: Callable[[], float] = time.monotonic,
+) -> Recovery:
+    """Checks every task and rebuilds each missing one this worker owns, in order.
+
+    `slots` bounds rebuilds in flight, as BUILD_SLOTS bounds a build worker's.
+    `levels` are the graph's, and order the rebuilds; `share` says which missing
+    images are this worker's to rebuild. Returns once every check, every
+    rebuild, every wait on a peer, and the cleanup have finished.
+
+    One thread makes every decision, reading what the pools report off a queue,
+    so the scheduling state below needs no lock.
+    """
+    owner = share if share is not None else Share()
+    order = priorities(expected, levels or {})
+    expected_images = {task.image: index for index, task in enumerate(expected)}
+    events: queue.SimpleQueue[_Event] = queue.SimpleQueue()
+
+    settled: set[str] = set()
+    blocked: dict[int, Task] = {}
+    ready: list[tuple[tuple[int, int], int]] = []
+    rebuilds: dict[int, BuildOutcome] = {}
+    cleaning: threading.Thread | None = None
+    running = 0
+    watching = 0
+    # Missing and another worker's, by image: not watched until something this
+    # worker must rebuild is blocked on it, and watched only while it is.
+    elsewhere: dict[str, int] = {}
+    watched: dict[str, threading.Event] = {}
+
+    def arrived(task: Task, index: int, release: threading.Event) -> None:
+        # Reported on every exit, a raising check included: the decision loop
+        # counts this wait as outstanding, and would otherwise wait on it forever.
+        try:
+            deadline = clock() + BARRIER_TIMEOUT_SECONDS
+            while not release.is_set() and not landed(task) and clock() < deadline:
+                sleep(BARRIER_POLL_SECONDS)
+        finally:
+            events.put(_Arrived(index, released=release.is_set()))
+
+    def on_checked(index: int, done: Future[bool]) -> None:
+        events.put(_Checked(index, done))
+
+    def on_rebuilt(index: int, done: Future[BuildOutcome]) -> None:
+        events.put(_Rebuilt(index, done))
+
+    def unblocked(task: Task) -> bool:
+        return all(
+            dependency.image in settled or dependency.image not in expected_images
+            for dependency in task.dependencies
+        )
+
+    with (
+        ThreadPoolExecutor(max_workers=slots, thread_name_prefix="rebuild") as builders,
+        ThreadPoolExecutor(max_workers=inspect_width, thread_name_prefix="inspect") as checks,
+        ThreadPoolExecutor(
+            max_workers=max(1, len(expected)), thread_name_prefix="barrier"
+        ) as barriers,
+    ):
+        for index, task in enumerate(expected):
+            check = checks.submit(landed, task)
+            check.add_done_callback(partial(on_checked, index))
+        unchecked = len(expected)
+
+        while unchecked or watching or running or blocked or ready:
+            event = events.get()
+            match event:
+                case _Checked(index, present):
+                    unchecked -= 1
+                    task = expected[index]
+                    if present.result():
+                        settled.add(task.image)
+                    elif owner.owns(index):
+                        if cleaning is None:
+                            cleaning = threading.Thread(target=cleanup, name="cleanup")
+                            cleaning.start()
+                        logger.warning("%s.%s is missing.", task.image, task.platform)
+                        blocked[index] = task
+                    else:
+                        logger.info(
+                            "%s.%s is missing and another worker's.", task.image, task.platform
+                        )
+                        elsewhere[task.image] = index
+                case _Arrived(index, released):
+                    watching -= 1
+                    image = expected[index].image
+                    del watched[image]
+                    if released:
+                        elsewhere[image] = index
+                    else:
+                        settled.add(image)
+                case _Rebuilt(index, outcome):
+                    running -= 1
+                    rebuilds[index] = outcome.result()
+                    settled.add(expected[index].image)
+                case _:
+                    assert_never(event)
+
+            needed = {
+                dependency.image for task in blocked.values() for dependency in task.dependencies
+            }
+            for image in sorted(needed & elsewhere.keys()):
+                index = elsewhere.pop(image)
+                logger.info(
+                    "Watching for %s.%s, which a rebuild here needs.",
+                    image,
+                    expected[index].platform,
+                )
+                watched[image] = threading.Event()
+                watching += 1
+                barriers.submit(arrived, expected[index], index, watched[image])
+            for image, release in watched.items():
+                if image not in needed:
+                    release.set()
+
+            for index, task in tuple(blocked.items()):
+                if unblocked(task):
+                    del blocked[index]
+                    heapq.heappush(ready, (order[task.image], index))
+
+            while ready and running < slots:
+                _, index = heapq.heappop(ready)
+                task = expected[index]
+                logger.info("Rebuilding %s.%s.", task.image, task.platform)
+                running += 1
+                build = builders.submit(rebuild, task)
+                build.add_done_callback(partial(on_rebuilt, index))
+
+    if cleaning is not None:
+        cleaning.join()
+
+    ordered = sorted(rebuilds)
+    return Recovery(
+        missing=tuple(expected[index] for index in ordered),
+        outcomes=tuple(rebuilds[index] for index in ordered),
+    )
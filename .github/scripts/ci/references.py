@@ -18,13 +18,21 @@ an edge into a batch live in `ci/provenance.py`, on the other side of that line.
 
 from __future__ import annotations
 
+import multiprocessing
+import os
 import re
+from collections import deque
 from collections.abc import Iterator, Mapping, Sequence
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass
 from itertools import dropwhile
 from pathlib import Path
 from typing import assert_never
 
+from pydantic import TypeAdapter
+
+from ci import persisted
+from ci.derive import Derivation, Scope
 from ci.domain import Dependency, Usage
 
 # A reference expressed through a build argument, in either spelling Dockerfile
@@ -339,8 +347,8 @@ class FileFacts:
     declarations: Mapping[str, str]
 
 
-def _read(text: str, known: frozenset[str]) -> FileFacts:
-    """One file's edges and its defects, from one parse.
+def _facts(parsed: _Parsed, known: frozenset[str]) -> FileFacts:
+    """One file's edges and its defects, from its parse.
 
     A loop rather than two comprehensions because both outputs come from one
     elimination: `match` over a closed sum with `assert_never` is what makes a
@@ -352,7 +360,6 @@ def _read(text: str, known: frozenset[str]) -> FileFacts:
     may legitimately appear twice with different usages, so the pair is the unit
     of identity, not the name.
     """
-    parsed = _parse(text)
     edges: list[Dependency] = []
     defects: list[str] = []
     for item in _classified_in(parsed, known):
@@ -372,6 +379,113 @@ def _read(text: str, known: frozenset[str]) -> FileFacts:
     )
 
 
+def _read(text: str, known: frozenset[str]) -> FileFacts:
+    """One file's edges and its defects, from one parse."""
+    return _facts(_parse(text), known)
+
+
+# --- parses carried between jobs --------------------------------------------
+
+# Names what a cached parse was produced *by* as well as from. The version is
+# part of the scope, so a change to what `_parse` records is a new scope, every
+# key changes with it, and no parse made by the old rules can be read back as
+# one made by the new. Bump it whenever `_Parsed` or `_parse` changes meaning.
+_CONTENT = Derivation(scope=Scope(b"df-parse-v1"), width=16)
+
+_PARSES: TypeAdapter[dict[str, _Parsed]] = TypeAdapter(dict[str, _Parsed])
+
+# Below this many files to parse, a pool costs more than it saves. A serial
+# parse runs at roughly 25,000 files a second, while starting the pool -- each
+# worker importing this package, pydantic included -- costs a second or two
+# before the first file is parsed. `python -m benchmarks.parse` measures both;
+# at four cores the pool starts winning in the tens of thousands of files. This
+# tree's thirty-odd files, and any warm cache's misses, stay on one core.
+_POOL_MINIMUM = 40_000
+
+# Files per task handed to a worker process. One file per task would make the
+# pickling round trip the dominant cost of each parse.
+_POOL_CHUNK = 64
+
+
+def _parse_bytes(content: bytes) -> _Parsed:
+    """`_parse` over a file's bytes, at module level so a worker process can run it."""
+    return _parse(content.decode("utf-8"))
+
+
+def _parse_all(contents: Sequence[bytes], workers: int) -> tuple[_Parsed, ...]:
+    """Parses every file, in order, across up to `workers` processes.
+
+    Processes rather than threads because parsing is pure Python and holds the
+    GIL throughout; threads would take turns on one core. `map` returns results
+    in submission order whatever order they finish in, and an error surfaces
+    from the first file that raised in *that* order, so the caller cannot tell
+    a pooled parse from a serial one. Spawned rather than forked: discovery can
+    run beside threads, and a fork copies their locks in whatever state they
+    happened to be in.
+    """
+    if workers <= 1 or len(contents) < _POOL_MINIMUM:
+        return tuple(map(_parse_bytes, contents))
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        return tuple(pool.map(_parse_bytes, contents, chunksize=_POOL_CHUNK))
+
+
+class ParseCache:
+    """Parses of Dockerfiles, addressed by their bytes and kept between jobs.
+
+    Discovery runs in the plan job and again in every reconcile job, and each
+    time it parsed every Dockerfile in the tree -- several hundred in a large
+    fork -- to find the handful that changed since the last run. Keyed by the
+    file's content rather than its path or mtime, so a hit is a parse of these
+    exact bytes, whichever job produced it and wherever the file now lives.
+
+    What is cached is `_Parsed`, not `FileFacts`. The facts depend on the set of
+    images the tree builds as well as on the file: adding one image can turn
+    another file's external reference into an edge, or into a dangling one. So
+    classification and every whole-tree check still run on every read, over
+    parses that are only as fresh as the bytes they came from.
+
+    Only what this read used is saved, which keeps the document the size of
+    the tree rather than of its history.
+    """
+
+    def __init__(self, remembered: Mapping[str, _Parsed] | None = None) -> None:
+        self._remembered = dict(remembered or {})
+        self._used: dict[str, _Parsed] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, path: Path) -> ParseCache:
+        return cls(persisted.load(path, _PARSES, {}))
+
+    def save(self, path: Path) -> None:
+        persisted.save(path, _PARSES, dict(sorted(self._used.items())))
+
+    def parsed_all(self, contents: Sequence[bytes], workers: int = 1) -> tuple[_Parsed, ...]:
+        """Parses of every file in `contents`, in order, parsing only the unseen.
+
+        Misses are collected first and parsed together, so they can share a pool;
+        two files with the same bytes are one miss, and the second a hit, exactly
+        as they would be read one at a time.
+        """
+        keys = tuple(_CONTENT.over(content).hex() for content in contents)
+        unseen = {
+            key: content
+            for key, content in zip(keys, contents, strict=True)
+            if key not in self._remembered
+        }
+        self._remembered.update(
+            zip(unseen, _parse_all(tuple(unseen.values()), workers), strict=True)
+        )
+        self.misses += len(unseen)
+        self.hits += len(keys) - len(unseen)
+        found = tuple(self._remembered[key] for key in keys)
+        self._used.update(zip(keys, found, strict=True))
+        return found
+
+
 def dependencies_in(text: str, known: frozenset[str] = frozenset()) -> tuple[Dependency, ...]:
     """The edges one Dockerfile declares, deduplicated and ordered.
 
@@ -381,6 +495,60 @@ def dependencies_in(text: str, known: frozenset[str] = frozenset()) -> tuple[Dep
     return _read(text, known).edges
 
 
+# Every argument a reference mentions, wherever it sits in the text. `_ARGUMENT`
+# is anchored because an internal reference must be exactly one argument; a base
+# is under no such rule, and `alpine:${ALPINE_VERSION}` is an ordinary one.
+_MENTION = re.compile(r"\$\{([A-Za-z_][A-Za-z0-9_]*)\}|\$([A-Za-z_][A-Za-z0-9_]*)")
+
+
+def _expanded(reference: str, bindings: Mapping[str, str]) -> str | None:
+    """A reference with its arguments replaced by their defaults, if all have one.
+
+    Absence rather than a partial expansion: `$BUILDPLATFORM` and an argument the
+    build sets without a default name nothing until the build runs, and a guess
+    at them would fetch an image the build never asks for.
+    """
+    expanded = _MENTION.sub(
+        lambda found: bindings.get(found.group(1) or found.group(2), found.group(0)), reference
+    )
+    return None if "$" in expanded else expanded
+
+
+def bases_in(text: str, known: frozenset[str] = frozenset()) -> tuple[str, ...]:
+    """The external images one Dockerfile pulls, as its build will name them.
+
+    The complement of `dependencies_in`, read from the same parse: every FROM
+    and `COPY --from` that `classify` calls external, less the stages it also
+    calls external -- by alias, or by index as `COPY --from=0` names them -- and
+    `scratch`, which is no image at all. Defaults are
+    substituted, since a build without overrides resolves exactly those; a
+    reference with an argument that has none is dropped rather than guessed.
+    Deduplicated and sorted, so a caller merging several files gets one answer.
+    """
+    parsed = _parse(text)
+    aliased = {stage.alias for stage in parsed.stages if stage.alias is not None}
+    named = (
+        *(stage.reference for stage in parsed.stages),
+        *(reference for reference in parsed.copied if not _ARGUMENT.match(reference)),
+    )
+    found: set[str] = set()
+    for reference in named:
+        if reference in aliased or reference.lower() == "scratch":
+            continue
+        if reference.isdigit() and int(reference) < len(parsed.stages):
+            continue
+        match classify(reference, Usage.BASE, parsed.bindings, known):
+            case External():
+                expanded = _expanded(reference, parsed.bindings)
+                if expanded is not None and expanded not in aliased:
+                    found.add(expanded)
+            case Internal() | Misdeclared():
+                pass
+            case unreachable:
+                assert_never(unreachable)
+    return tuple(sorted(found))
+
+
 # --- defects the whole tree defines -----------------------------------------
 
 
@@ -480,6 +648,41 @@ class Graph:
     depth: int
 
 
+def _consumers_of(edges: Mapping[str, tuple[Dependency, ...]]) -> Mapping[str, tuple[str, ...]]:
+    """For each image depended on, the images that depend on it, once each.
+
+    The adjacency index both graph walks below share, built in one pass over the
+    edges. An image consumed twice by one consumer -- as a base and as a source
+    of artifacts -- is one consumer, which is what both walks need: usage bears
+    on neither a level nor a membership.
+    """
+    consumers: dict[str, list[str]] = {}
+    for consumer, found in edges.items():
+        for image in dict.fromkeys(dependency.image for dependency in found):
+            consumers.setdefault(image, []).append(consumer)
+    return {image: tuple(found) for image, found in consumers.items()}
+
+
+def _cycle_among(
+    stuck: frozenset[str], edges: Mapping[str, tuple[Dependency, ...]]
+) -> tuple[str, ...]:
+    """One cycle through the images a topological sort could not place.
+
+    Every such image still waits on another such image -- that is why it could
+    not be placed -- so following any dependency that stays inside the set must
+    revisit an image, and the path from the first visit to the second is a
+    cycle. Smallest names first, so the one reported does not vary between runs.
+    """
+    path: list[str] = []
+    seen: dict[str, int] = {}
+    image = min(stuck)
+    while image not in seen:
+        seen[image] = len(path)
+        path.append(image)
+        image = min(dependency.image for dependency in edges[image] if dependency.image in stuck)
+    return (*path[seen[image] :], image)
+
+
 def _levels_of(edges: Mapping[str, tuple[Dependency, ...]]) -> Mapping[str, int]:
     """Each image's depth in the graph: one more than the deepest it depends on.
 
@@ -487,43 +690,49 @@ def _levels_of(edges: Mapping[str, tuple[Dependency, ...]]) -> Mapping[str, int]
     difference in level between two images *is* the number of generations between
     the builds that can coherently be combined.
 
-    Recursion is the honest shape here -- a level is defined in terms of the
-    levels below it -- and it is safe because the depth it recurses to is the
-    graph's, which is four in this repository and bounded by the number of images
-    in any repository. Memoised so that a diamond is not re-walked once per path,
-    and carrying the path it came by, which is what turns a cycle into a raised
-    defect rather than a hang.
+    Kahn's algorithm rather than the recursion a level's definition suggests:
+    each image is placed once every image it depends on has been, so its level
+    is final when it is placed and every edge is crossed exactly once. Linear in
+    the graph, and bounded by nothing but memory -- the recursive walk was
+    bounded by the interpreter's stack, and threaded its path through every call
+    to find cycles, quadratic in depth. A cycle is what is left unplaced when the
+    queue runs dry, which is where `CyclicGraph` finds one to report.
     """
-    level: dict[str, int] = {}
-
-    def resolve(image: str, visiting: tuple[str, ...]) -> int:
-        if image in level:
-            return level[image]
-        if image in visiting:
-            raise CyclicGraph(visiting[visiting.index(image) :] + (image,))
-        depth = 1 + max(
-            (resolve(edge.image, visiting + (image,)) for edge in edges.get(image, ())),
-            default=0,
-        )
-        level[image] = depth
-        return depth
-
-    return {image: resolve(image, ()) for image in edges}
+    waiting = {
+        image: len({dependency.image for dependency in edges.get(image, ())})
+        for image in {*edges, *(d.image for found in edges.values() for d in found)}
+    }
+    consumers = _consumers_of(edges)
+    level = dict.fromkeys((image for image, count in waiting.items() if count == 0), 1)
+    ready = deque(level)
+    # The deepest placed dependency seen so far, for images not yet placed. Kept
+    # apart from `level` so that an image is in `level` exactly when it has been
+    # placed: a cycle hanging off a root still has its members reached, and
+    # counting them as placed would hide the cycle.
+    pending: dict[str, int] = {}
+
+    while ready:
+        image = ready.popleft()
+        for consumer in consumers.get(image, ()):
+            pending[consumer] = max(pending.get(consumer, 0), level[image] + 1)
+            waiting[consumer] -= 1
+            if waiting[consumer] == 0:
+                level[consumer] = pending.pop(consumer)
+                ready.append(consumer)
+
+    if len(level) < len(waiting):
+        raise CyclicGraph(_cycle_among(frozenset(waiting) - frozenset(level), edges))
+    return {image: level[image] for image in edges}
 
 
 def _dependents_of(edges: Mapping[str, tuple[Dependency, ...]]) -> Mapping[str, tuple[str, ...]]:
     """The graph inverted. Usage is dropped: membership does not depend on it,
-    and the consumer's own `consumes` label states it more precisely."""
-    return {
-        image: tuple(
-            sorted(
-                consumer
-                for consumer, found in edges.items()
-                if any(dependency.image == image for dependency in found)
-            )
-        )
-        for image in edges
-    }
+    and the consumer's own `consumes` label states it more precisely.
+
+    Read off the adjacency index rather than by asking every consumer about
+    every image, which was quadratic in the number of images."""
+    consumers = _consumers_of(edges)
+    return {image: tuple(sorted(consumers.get(image, ()))) for image in edges}
 
 
 def _probe_for(edges: Mapping[str, tuple[Dependency, ...]]) -> tuple[str, str] | None:
@@ -570,7 +779,12 @@ def _dangling_in(
     return {target: tuple(sorted(referrers)) for target, referrers in sorted(dangling.items())}
 
 
-def graph(definitions: Mapping[str, Path], root: Path) -> Graph:
+def graph(
+    definitions: Mapping[str, Path],
+    root: Path,
+    cache: ParseCache | None = None,
+    workers: int | None = None,
+) -> Graph:
     """The whole tree's graph, read once.
 
     Raises `MisdeclaredReference` if a reference is written in a form the build
@@ -579,11 +793,28 @@ def graph(definitions: Mapping[str, Path], root: Path) -> Graph:
     three are questions about the whole tree rather than about one file: a name
     is dangling only if *nothing* defines it, and whether a literal reference
     should have been a declaration depends on what else the tree builds.
+
+    With a `cache`, only files whose bytes it has not seen are parsed; every
+    check below still runs over the whole tree.
+
+    `workers` bounds how wide reading and parsing fan out, defaulting to the
+    machine's cores; a tree too small to repay a pool is read on one regardless.
+    Everything after the parse runs in `definitions` order, so the graph and
+    every error message are the same however many workers produced them.
     """
     known = frozenset(definitions)
+    parses = cache if cache is not None else ParseCache()
+    width = workers if workers is not None else os.cpu_count() or 1
+    paths = tuple(root / path for path in definitions.values())
+    if width > 1 and len(paths) >= _POOL_MINIMUM:
+        # Threads for the reads: waiting on the disk releases the GIL.
+        with ThreadPoolExecutor(max_workers=width) as reader:
+            contents = tuple(reader.map(Path.read_bytes, paths))
+    else:
+        contents = tuple(path.read_bytes() for path in paths)
     parsed = {
-        image: _read((root / path).read_text(encoding="utf-8"), known)
-        for image, path in definitions.items()
+        image: _facts(found, known)
+        for image, found in zip(definitions, parses.parsed_all(contents, width), strict=True)
     }
 
     misdeclared = {
@@ -180,6 +180,7 @@ def run_section(
     probe: str | None,
     images: int,
     platforms: int,
+    scope: str | None = None,
 ) -> tuple[str, ...]:
     """What this run *is*, for someone opening the summary to troubleshoot.
 
@@ -192,6 +193,10 @@ def run_section(
     wrong from anywhere else, yet it silently means edges reaching past its end
     were left floating, which is the difference between the mechanism working and
     quietly doing nothing.
+
+    `scope` says why this run builds the images it does, when it was narrowed to
+    a change: a run that published three images looks broken beside yesterday's
+    thirty unless the summary says it meant to.
     """
     short = len(generations) < needed
     lines = [
@@ -202,6 +207,7 @@ def run_section(
         f"`<image>.{identity.batch}`",
         f"- commit `{identity.commit_sha}`, planned at `{identity.date_time}` UTC",
         f"- publishing {images} image(s) to `{identity.base_image}` for {platforms} platform(s)",
+        *((f"- planned {scope}",) if scope is not None else ()),
     ]
     if needed == 0:
         lines.append("- no image depends on another here, so no generations are needed")
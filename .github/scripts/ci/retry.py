@@ -15,6 +15,22 @@ effect that accumulates.
 
 The outcome is a closed sum rather than a bool-and-string pair, so "succeeded but
 carries an error" is not a state a caller can be handed.
+
+*One budget per process, on top of one per call.* Each call's budget is its own,
+so a registry outage put every slot into its own fifty-attempt loop, and the
+slots hammered the registry together. A `RetryGovernor` is shared by every call
+in the process. Retries draw from its token bucket, so their rate stays bounded
+however many calls are failing. And its breaker opens once failures correlate --
+several distinct operations failing in a short window, with no success between
+them. While it is open, every new attempt waits, without spending its budget,
+until one probe attempt succeeds. An outage then costs each process one backoff
+schedule, walked by its probe, rather than one per slot per task.
+
+Only calls that are registry operations and nothing else share it: manifest
+fusion, which is `imagetools create` and only that. A build pushes too, but the
+push is the last step of minutes of work that fails for its own reasons, so a
+build retries on its own backoff -- otherwise a few broken Dockerfiles would read
+as an outage and hold every slot behind a probe that is itself a whole build.
 """
 
 from __future__ import annotations
@@ -22,9 +38,13 @@ from __future__ import annotations
 import logging
 import random
 import subprocess
+import threading
 import time
 from collections.abc import Callable
 from dataclasses import dataclass
+from typing import assert_never
+
+logger = logging.getLogger("ci.retry")
 
 
 @dataclass(frozen=True, slots=True)
@@ -64,6 +84,167 @@ def backoff_seconds(
     return float(draw(0.0, cap))
 
 
+# --- the shared governor ----------------------------------------------------
+
+
+@dataclass(frozen=True, slots=True)
+class Closed:
+    """Attempts flow. Carries the recent failures, as (when, label), oldest first."""
+
+    failures: tuple[tuple[float, str], ...] = ()
+
+
+@dataclass(frozen=True, slots=True)
+class Open:
+    """Every attempt waits until `until`, when the next to arrive probes."""
+
+    until: float
+    pause: float
+
+
+@dataclass(frozen=True, slots=True)
+class Probing:
+    """One attempt is testing the dependency; every other attempt waits on it."""
+
+    pause: float
+
+
+BreakerState = Closed | Open | Probing
+
+
+class RetryGovernor:
+    """A retry token bucket and a circuit breaker, shared across a process.
+
+    First attempts are free; each retry takes a token, and the bucket refills at
+    a fixed rate. The breaker opens when `trip_after` distinct labels have
+    failed within `trip_window_seconds` and nothing has succeeded since. Distinct
+    labels, because one operation failing repeatedly is its own problem, and
+    its own budget already bounds it. Several operations failing together is a
+    shared dependency down.
+
+    Each failed probe doubles the pause before the next, up to
+    `max_pause_seconds`. A probe is a real attempt and counts against its own
+    caller's budget. So a dependency that never recovers still ends every call,
+    one probe at a time.
+
+    Thread-safe. Waits are served by polling the injectable clock and sleep, so
+    the whole policy can be tested without a thread or a real second.
+    """
+
+    def __init__(
+        self,
+        tokens: float = 10.0,
+        refill_per_second: float = 0.5,
+        trip_after: int = 4,
+        trip_window_seconds: float = 60.0,
+        first_pause_seconds: float = 15.0,
+        max_pause_seconds: float = 240.0,
+        poll_seconds: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        if tokens < 1 or refill_per_second <= 0 or trip_after < 2:
+            raise ValueError(
+                "a governor needs at least one token, a positive refill, and at "
+                "least two failures to correlate"
+            )
+        self._capacity = tokens
+        self._tokens = tokens
+        self._refill = refill_per_second
+        self._trip_after = trip_after
+        self._trip_window = trip_window_seconds
+        self._first_pause = first_pause_seconds
+        self._max_pause = max_pause_seconds
+        self._poll = poll_seconds
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._refilled_at = clock()
+        self._state: BreakerState = Closed()
+        self.trips = 0
+
+    @property
+    def state(self) -> BreakerState:
+        with self._lock:
+            return self._state
+
+    def admit(self, label: str, retry: bool) -> bool:
+        """Blocks until an attempt may start; True if that attempt is the probe."""
+        while True:
+            with self._lock:
+                now = self._clock()
+                match self._state:
+                    case Open(until, pause):
+                        if now >= until:
+                            self._state = Probing(pause)
+                            logger.info("%s: probing whether the outage is over.", label)
+                            return True
+                        wait = until - now
+                    case Probing():
+                        wait = self._poll
+                    case Closed():
+                        self._tokens = min(
+                            self._capacity,
+                            self._tokens + (now - self._refilled_at) * self._refill,
+                        )
+                        self._refilled_at = now
+                        if not retry:
+                            return False
+                        if self._tokens >= 1:
+                            self._tokens -= 1
+                            return False
+                        wait = (1 - self._tokens) / self._refill
+                    case other:
+                        assert_never(other)
+            self._sleep(min(wait, self._poll))
+
+    def settle(self, label: str, succeeded: bool, probe: bool) -> None:
+        """Records how an admitted attempt ended."""
+        with self._lock:
+            now = self._clock()
+            match self._state:
+                case Probing(pause) if probe:
+                    if succeeded:
+                        self._state = Closed()
+                        logger.info("%s: probe succeeded; attempts resume.", label)
+                    else:
+                        longer = min(self._max_pause, pause * 2)
+                        self._state = Open(until=now + longer, pause=longer)
+                        logger.warning("%s: probe failed; pausing %.0fs.", label, longer)
+                case Closed(failures):
+                    if succeeded:
+                        self._state = Closed()
+                        return
+                    recent = (
+                        *(f for f in failures if now - f[0] <= self._trip_window),
+                        (now, label),
+                    )
+                    operations = len({failed for _, failed in recent})
+                    if operations >= self._trip_after:
+                        self.trips += 1
+                        self._state = Open(until=now + self._first_pause, pause=self._first_pause)
+                        logger.warning(
+                            "%d operations failed within %.0fs; pausing every attempt "
+                            "for %.0fs, then probing.",
+                            operations,
+                            self._trip_window,
+                            self._first_pause,
+                        )
+                    else:
+                        self._state = Closed(recent)
+                case Open() | Probing():
+                    # An attempt admitted before the breaker opened. Its answer
+                    # is older than the decision to open, so it changes nothing.
+                    pass
+                case other:
+                    assert_never(other)
+
+
+# The process's one governor. Module-level for the reason `ratelimit.REGISTRY`
+# is: the call sites sharing it are layers apart, and sharing is the point.
+REGISTRY = RetryGovernor()
+
+
 # Both call sites shell out, so a failure arrives either as a non-zero exit
 # (CalledProcessError) or as the process never starting at all (OSError).
 _SUBPROCESS_FAILURES: tuple[type[BaseException], ...] = (subprocess.CalledProcessError, OSError)
@@ -77,6 +258,7 @@ def with_retries(
     sleep: Callable[[float], None] = time.sleep,
     backoff: Callable[[int], float] = backoff_seconds,
     retry_on: tuple[type[BaseException], ...] = _SUBPROCESS_FAILURES,
+    governor: RetryGovernor | None = None,
 ) -> RetryOutcome:
     """Runs `operation` until it returns without raising, or the budget is spent.
 
@@ -95,6 +277,10 @@ def with_retries(
     "failed for Creating manifest for 'redis'" once both call sites shared these
     strings -- correct, and clumsy enough to slow down whoever is reading a
     failure.
+
+    Under a `governor`, each attempt is admitted by it first. Time spent waiting
+    there is not an attempt, so an outage the breaker absorbs does not eat this
+    call's budget.
     """
     unlimited = max_retries <= 0
     budget = "∞" if unlimited else str(max_retries)
@@ -103,13 +289,22 @@ def with_retries(
 
     while unlimited or attempt < max_retries:
         attempt += 1
+        probe = governor.admit(label, retry=attempt > 1) if governor is not None else False
         log.info("%s: attempt %d/%s", label, attempt, budget)
+        succeeded = False
         try:
             operation()
-            return Succeeded(attempts=attempt)
+            succeeded = True
         except retry_on as error:
             last_error = str(error)
             log.warning("%s: attempt %d/%s failed: %s", label, attempt, budget, error)
+        finally:
+            # In `finally`, so a defect that propagates still settles a probe;
+            # otherwise every other attempt would wait on it forever.
+            if governor is not None:
+                governor.settle(label, succeeded, probe)
+        if succeeded:
+            return Succeeded(attempts=attempt)
 
         if not unlimited and attempt >= max_retries:
             break
@@ -184,9 +184,20 @@ def run_worker(
     poll_seconds: float = 3.0,
     sleep: Callable[[float], None] = time.sleep,
     clock: Callable[[], float] = time.monotonic,
+    admit: Callable[[], None] = lambda: None,
+    on_steal: Callable[[float], None] = lambda _: None,
 ) -> tuple[BuildOutcome, ...]:
     """Drains the queue with `slots` concurrent builds, stealing when idle.
 
+    `admit` is asked before a slot looks for its next task and may block, which
+    is how the disk governor pauses new builds while space is recovered. Asked
+    before stealing as well as before local work: a task taken from a peer that
+    this worker cannot yet start is a task that peer could have started itself.
+
+    `on_steal` is told, for each steal that paid off, how long its slot had sat
+    idle first. That wait is the mesh's latency as a build sees it, and the run
+    timeline reports it.
+
     Threads rather than processes: each build is a blocking subprocess call that
     releases the GIL for essentially its whole duration, and threads let the
     slots and the mesh server share one queue without a Manager proxy.
@@ -230,6 +241,7 @@ def run_worker(
         idle_since: float | None = None
 
         while True:
+            admit()
             local = queue.take_local()
             if local is not None:
                 idle_since = None
@@ -249,6 +261,7 @@ def run_worker(
             match action:
                 case Build(task, deferred):
                     queue.restore(deferred)
+                    on_steal(clock() - idle_since)
                     idle_since = None
                     run_one(task)
                 case WaitAndRetry():
@@ -0,0 +1,268 @@
+"""The whole run's timeline, merged from what each worker recorded.
+
+Each worker reports its own builds and its own effective parallelism, and that
+is all anyone saw. Whether the run as a whole was bound by the slowest chain of
+images, by capacity, or by workers idling while others still held work was not
+visible anywhere. So "would another worker have helped?" was answered by trying
+it.
+
+Each worker now writes what it did to a small JSON document: every build's
+wall-clock span and origin, and how long each successful steal waited. The
+workflow collects these as artifacts, and one merge step reads them all. These
+functions turn the merged set into the numbers that answer the question:
+
+- the *makespan*, first build start to last build end;
+- per-worker *idle*, the slot-seconds a worker held and did not build in;
+- *steal latency*, how long an idle slot waited before a steal paid off;
+- the *critical path*, the longest chain of builds through the image graph,
+  weighted by how long each build actually took;
+- the *lower bound*, the larger of that chain and the total build time spread
+  over every slot. No schedule finishes sooner.
+
+A makespan near the critical path means more workers cannot help, since the
+chain is the floor. A makespan near total work over capacity means they would.
+Between the two, the idle column shows where the time went.
+
+Wall-clock rather than monotonic: spans from different machines are compared
+here, and a monotonic reading means nothing off the machine that took it.
+"""
+
+from __future__ import annotations
+
+import statistics
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass
+from graphlib import TopologicalSorter
+from pathlib import Path
+
+from pydantic import TypeAdapter
+
+from ci import persisted
+from ci.domain import BuildOutcome, succeeded
+
+
+@dataclass(frozen=True, slots=True)
+class Span:
+    """One build, as the merge step reads it: plain values only."""
+
+    image: str
+    platform: str
+    start: float
+    duration: float
+    stolen: bool
+    succeeded: bool
+    attempts: int
+    dependencies: tuple[str, ...] = ()
+
+    @property
+    def end(self) -> float:
+        return self.start + self.duration
+
+
+@dataclass(frozen=True, slots=True)
+class WorkerTimeline:
+    """What one worker did: its window, its capacity, its builds, its steals."""
+
+    worker: str
+    platform: str
+    slots: int
+    began: float
+    finished: float
+    spans: tuple[Span, ...]
+    # Seconds each successful steal waited, from its slot going idle.
+    steal_waits: tuple[float, ...] = ()
+    # The runner it ran on, for the capacity history. Zero when not recorded.
+    cpus: int = 0
+    memory_bytes: int = 0
+
+
+_TIMELINE: TypeAdapter[WorkerTimeline] = TypeAdapter(WorkerTimeline)
+# Read through the optional form so an unreadable document defaults to nothing.
+_REPORTED: TypeAdapter[WorkerTimeline | None] = TypeAdapter(WorkerTimeline | None)
+
+
+def spans_of(
+    outcomes: Iterable[BuildOutcome], dealt: frozenset[str], offset: float
+) -> tuple[Span, ...]:
+    """Outcomes as spans, their monotonic starts moved onto the wall clock.
+
+    `offset` is wall-clock time minus monotonic time, read once on the worker
+    that took the readings.
+    """
+    return tuple(
+        Span(
+            image=outcome.task.image,
+            platform=str(outcome.task.platform),
+            start=outcome.started_at + offset,
+            duration=outcome.duration_seconds,
+            stolen=outcome.task.image not in dealt,
+            succeeded=succeeded(outcome),
+            attempts=outcome.attempts,
+            dependencies=tuple(sorted({edge.image for edge in outcome.task.dependencies})),
+        )
+        for outcome in outcomes
+    )
+
+
+def save(path: Path, timeline: WorkerTimeline) -> None:
+    persisted.save(path, _TIMELINE, timeline)
+
+
+def load_all(directory: Path) -> tuple[WorkerTimeline, ...]:
+    """Every worker's timeline under `directory`, skipping any that will not parse.
+
+    A worker that died before writing leaves nothing, and the merge describes
+    the workers that did report -- as it must, since the point is partly to
+    show what the others left behind.
+    """
+    found = (
+        persisted.load(path, _REPORTED, None) for path in sorted(directory.glob("**/*.json"))
+    )
+    return tuple(timeline for timeline in found if timeline is not None)
+
+
+# --- what the merged run says ------------------------------------------------
+
+
+@dataclass(frozen=True, slots=True)
+class WorkerIdle:
+    worker: str
+    held_seconds: float
+    idle_seconds: float
+
+
+@dataclass(frozen=True, slots=True)
+class RunShape:
+    makespan: float
+    total_work: float
+    capacity: int
+    critical_path: tuple[Span, ...]
+    idle: tuple[WorkerIdle, ...]
+    steal_waits: tuple[float, ...]
+
+    @property
+    def critical_seconds(self) -> float:
+        return sum(span.duration for span in self.critical_path)
+
+    @property
+    def lower_bound(self) -> float:
+        spread = self.total_work / self.capacity if self.capacity else 0.0
+        return max(self.critical_seconds, spread)
+
+
+def critical_path(spans: Sequence[Span]) -> tuple[Span, ...]:
+    """The longest duration-weighted chain of builds through the image graph.
+
+    Within one platform, since each platform's builds run on its own runners;
+    the longest of the platforms' chains is returned. A dependency with no span
+    -- not rebuilt this run -- contributes nothing, since nothing waited on it.
+    Where an image was built more than once, its last successful build counts.
+    """
+    best: tuple[Span, ...] = ()
+    for platform in sorted({span.platform for span in spans}):
+        builds: dict[str, Span] = {}
+        for span in sorted(
+            (span for span in spans if span.platform == platform),
+            key=lambda span: (span.succeeded, span.end),
+        ):
+            builds[span.image] = span
+
+        graph = {
+            image: [dependency for dependency in span.dependencies if dependency in builds]
+            for image, span in builds.items()
+        }
+        chains: dict[str, tuple[float, tuple[Span, ...]]] = {}
+        for image in TopologicalSorter(graph).static_order():
+            longest = max(
+                (chains[dependency] for dependency in graph[image]),
+                key=lambda chain: chain[0],
+                default=(0.0, ()),
+            )
+            chains[image] = (longest[0] + builds[image].duration, (*longest[1], builds[image]))
+        if chains:
+            heaviest = max(chains.values(), key=lambda chain: chain[0])[1]
+            if sum(span.duration for span in heaviest) > sum(span.duration for span in best):
+                best = heaviest
+    return best
+
+
+def shape(timelines: Sequence[WorkerTimeline]) -> RunShape:
+    """The merged run's numbers. Pure."""
+    spans = tuple(span for timeline in timelines for span in timeline.spans)
+    starts = tuple(span.start for span in spans)
+    ends = tuple(span.end for span in spans)
+    return RunShape(
+        makespan=max(ends) - min(starts) if spans else 0.0,
+        total_work=sum(span.duration for span in spans),
+        capacity=sum(timeline.slots for timeline in timelines),
+        critical_path=critical_path(spans),
+        idle=tuple(
+            WorkerIdle(
+                worker=timeline.worker,
+                held_seconds=(held := (timeline.finished - timeline.began) * timeline.slots),
+                idle_seconds=max(0.0, held - sum(span.duration for span in timeline.spans)),
+            )
+            for timeline in timelines
+        ),
+        steal_waits=tuple(wait for timeline in timelines for wait in timeline.steal_waits),
+    )
+
+
+def _minutes(seconds: float) -> str:
+    return f"{seconds / 60:.1f} min"
+
+
+def gantt(timelines: Sequence[WorkerTimeline]) -> tuple[str, ...]:
+    """A mermaid Gantt chart, one section per worker, failures marked critical.
+
+    `dateFormat X` reads Unix seconds, so each bar is drawn exactly where its
+    build ran, whichever machine it ran on.
+    """
+    lines = ["```mermaid", "gantt", "    dateFormat X", "    axisFormat %H:%M"]
+    for timeline in sorted(timelines, key=lambda timeline: timeline.worker):
+        lines.append(f"    section {timeline.worker}")
+        lines.extend(
+            f"    {span.image}{' (stolen)' if span.stolen else ''} :"
+            f"{'' if span.succeeded else 'crit, '}{int(span.start)}, {int(span.end)}"
+            for span in sorted(timeline.spans, key=lambda span: span.start)
+        )
+    lines.append("```")
+    return tuple(lines)
+
+
+def report(timelines: Sequence[WorkerTimeline]) -> tuple[str, ...]:
+    """The run-wide summary: the numbers, the idle table, then the chart."""
+    if not timelines:
+        return ("", "### Run timeline", "", "No worker reported a timeline.")
+    run = shape(timelines)
+    efficiency = run.lower_bound / run.makespan if run.makespan else 1.0
+    waits = run.steal_waits
+    return (
+        "",
+        "### Run timeline",
+        "",
+        f"- makespan **{_minutes(run.makespan)}**; no schedule could beat "
+        f"**{_minutes(run.lower_bound)}** ({efficiency * 100:.0f}% of that bound reached)",
+        f"- critical path {_minutes(run.critical_seconds)}: "
+        + " → ".join(f"`{span.image}`" for span in run.critical_path),
+        f"- total build time {_minutes(run.total_work)} over {run.capacity} slot(s): "
+        f"{_minutes(run.total_work / run.capacity if run.capacity else 0.0)} if perfectly "
+        "spread",
+        (
+            f"- {len(waits)} steal(s), waiting {statistics.median(waits):.0f}s median and "
+            f"{max(waits):.0f}s at worst"
+            if waits
+            else "- no steals"
+        ),
+        "- more workers help only while the makespan is well above the critical path",
+        "",
+        "| Worker | Slot time held | Idle | Idle share |",
+        "| --- | --- | --- | --- |",
+        *(
+            f"| {idle.worker} | {_minutes(idle.held_seconds)} | {_minutes(idle.idle_seconds)} "
+            f"| {idle.idle_seconds / idle.held_seconds * 100 if idle.held_seconds else 0:.0f}% |"
+            for idle in run.idle
+        ),
+        "",
+        *gantt(timelines),
+    )
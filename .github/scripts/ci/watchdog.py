@@ -0,0 +1,208 @@
+"""Keeping clean egress clean for the whole job, not only its first minute.
+
+`start_proxy` proves WARP egress once and then detaches mihomo for the life of
+the job. A MASQUE session that dies an hour later leaves every domain in the
+allowlist routed into a dead tunnel. Those are exactly the domains that were
+blackholed direct, so the builds stall on TCP retransmits: the ~525s failure
+`ci.egress` was written to remove, brought back by the remedy for it.
+
+The watchdog runs beside mihomo for as long as the job does and re-probes
+egress every minute. A single bad node is mihomo's own business: its
+load-balance group health-checks each node and stops using one that fails.
+What reaches the watchdog is the whole group failing. One failed probe is
+noise. A second in a row starts a recovery:
+
+1. Register a fresh fleet of WARP devices, render a new configuration for
+   it, and hot-reload mihomo through its loopback controller.
+2. Probe again. Healthy means recovered.
+3. Otherwise route the allowlisted domains DIRECT as well, and reload that.
+
+DIRECT is the runner's own path, which is what every build used before any of
+this existed. It may stall on the domains that were failing, but a dead tunnel
+is certain to. The listener never moves, so `BUILD_PROXY_URL`, already handed
+to later steps, stays correct whichever route is behind it. From DIRECT a new
+tunnel is tried every ten minutes, since the outage that caused the failover
+need not last.
+
+Every change of route is written to the state file named by EGRESS_STATE_FILE,
+so a build that fails can say which route it had.
+
+The policy is a class over injected effects -- probe, register, apply, record,
+clock -- so every transition is tested without a network, a tunnel or a
+process.
+"""
+
+from __future__ import annotations
+
+import datetime
+import logging
+import os
+import subprocess
+import sys
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from enum import StrEnum
+from pathlib import Path
+from typing import assert_never
+
+from pydantic import TypeAdapter
+
+from ci import persisted
+from ci.egress import Fleet, RegistrationFailed, private_log
+
+logger = logging.getLogger("ci.egress.watchdog")
+
+PROBE_INTERVAL_SECONDS = 60.0
+
+# Consecutive failed probes before a recovery starts. One is noise: a probe has
+# its own timeout, and a single slow answer is not a dead tunnel.
+FAILURES_BEFORE_RECOVERY = 2
+
+# How long after failing over to DIRECT a fresh tunnel is tried again.
+RETRY_TUNNEL_SECONDS = 600.0
+
+
+class Route(StrEnum):
+    """Where the allowlisted domains are sent right now."""
+
+    WARP = "warp"
+    DIRECT = "direct"
+
+
+@dataclass(frozen=True, slots=True)
+class EgressState:
+    """What the state file says. Wall-clock `since`, so a build can compare it."""
+
+    route: Route
+    since: float
+    reason: str
+    # Devices registered since the proxy started, the first fleet included.
+    registrations: int = 1
+
+
+_STATE: TypeAdapter[EgressState | None] = TypeAdapter(EgressState | None)
+
+
+def record_to(path: Path) -> Callable[[EgressState], None]:
+    """A recorder writing each state to `path`, atomically."""
+    return lambda state: persisted.save(path, _STATE, state)
+
+
+def read_state(path: Path) -> EgressState | None:
+    """The latest recorded state, or None if nothing usable was ever written."""
+    return persisted.load(path, _STATE, None)
+
+
+def describe(state: EgressState | None) -> str:
+    """One line for a failure report: which route a build had, and since when."""
+    if state is None:
+        return "no egress state recorded"
+    since = datetime.datetime.fromtimestamp(state.since, datetime.UTC).strftime("%H:%M:%S")
+    return f"{state.route} since {since} UTC ({state.reason})"
+
+
+class Watchdog:
+    """Probes egress, recovers the tunnel, and fails over to DIRECT. Single-threaded.
+
+    `apply` takes the nodes to route through, empty for DIRECT, and returns
+    whether mihomo took the configuration.
+    """
+
+    def __init__(
+        self,
+        probe: Callable[[], bool],
+        register: Callable[[], Fleet | RegistrationFailed],
+        apply: Callable[[Fleet], bool],
+        record: Callable[[EgressState], None],
+        clock: Callable[[], float] = time.time,
+        registered: int = 1,
+    ) -> None:
+        self._probe = probe
+        self._register = register
+        self._apply = apply
+        self._record = record
+        self._clock = clock
+        self._failures = 0
+        self._last_attempt = clock()
+        self.state = EgressState(Route.WARP, clock(), "provisioned", registered)
+
+    def check(self) -> EgressState:
+        """One cycle: probe, and recover if the route calls for it."""
+        match self.state.route:
+            case Route.WARP:
+                if self._probe():
+                    self._failures = 0
+                    return self.state
+                self._failures += 1
+                logger.warning("WARP egress probe failed (%d in a row).", self._failures)
+                if self._failures >= FAILURES_BEFORE_RECOVERY:
+                    self._recover("WARP egress stopped answering")
+            case Route.DIRECT:
+                if self._clock() - self._last_attempt >= RETRY_TUNNEL_SECONDS:
+                    self._recover("retrying a tunnel after failing over")
+        return self.state
+
+    def _recover(self, cause: str) -> None:
+        self._failures = 0
+        self._last_attempt = self._clock()
+        registrations = self.state.registrations
+        match self._register():
+            case tuple() as fleet:
+                registrations += len(fleet)
+                if self._apply(fleet) and self._probe():
+                    self._move(Route.WARP, f"{cause}; re-registered", registrations)
+                    return
+                reason = f"{cause}; a fresh fleet did not carry either"
+            case RegistrationFailed(failure):
+                reason = f"{cause}; re-registration failed: {failure}"
+            case other:
+                assert_never(other)
+
+        if self.state.route is Route.DIRECT:
+            # Already failed over; the tunnel just tried has to be undone, or
+            # the allowlist would stay pointed at it.
+            self._apply(())
+            logger.warning("%s; staying DIRECT.", reason)
+            self.state = EgressState(Route.DIRECT, self.state.since, reason, registrations)
+            self._record(self.state)
+            return
+        if not self._apply(()):
+            logger.error("%s, and mihomo refused the DIRECT configuration.", reason)
+        self._move(Route.DIRECT, reason, registrations)
+
+    def _move(self, route: Route, reason: str, registrations: int) -> None:
+        self.state = EgressState(route, self._clock(), reason, registrations)
+        logger.warning("Egress now %s: %s", route, reason)
+        self._record(self.state)
+
+    def run(self, sleep: Callable[[float], None] = time.sleep) -> None:
+        """Checks every PROBE_INTERVAL_SECONDS until the process is killed."""
+        self._record(self.state)
+        while True:
+            sleep(PROBE_INTERVAL_SECONDS)
+            self.check()
+
+
+def launch(script: Path, working_dir: Path, environment: dict[str, str]) -> bool:
+    """Starts the watchdog detached, as `start_proxy` starts mihomo.
+
+    Same lifetime and for the same reasons: it must outlive the step that
+    starts it, holds none of that step's pipes, and is reaped with the job.
+    Its log goes to a 0600 file beside the configuration, not the job log,
+    since it reloads configurations that hold a private key.
+    """
+    try:
+        with private_log(working_dir / "watchdog.log") as handle:
+            subprocess.Popen(
+                [sys.executable, str(script)],
+                env={**os.environ, **environment},
+                stdin=subprocess.DEVNULL,
+                stdout=handle,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+            )
+    except OSError as error:
+        logger.warning("Could not start the egress watchdog: %s", error)
+        return False
+    return True
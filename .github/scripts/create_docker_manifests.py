@@ -11,10 +11,12 @@ from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from typing import assert_never
 
-from ci.docker import manifest_tags, run_tag
+from ci import ratelimit, retry
+from ci.docker import tag_exists
 from ci.domain import Platform
-from ci.env import NAME_LIST, RETRIES, BuildIdentity, read, read_json
+from ci.env import FLAG, NAME_LIST, RETRIES, BuildIdentity, read, read_json
 from ci.logs import configure
+from ci.manifests import batch_tag, final_fusion
 from ci.retry import Exhausted, Succeeded, with_retries
 
 logger = logging.getLogger("ci.manifests")
@@ -41,30 +43,35 @@ def push_manifest(
     platforms: tuple[Platform, ...],
     identity: BuildIdentity,
     max_retries: int,
+    incremental: bool = False,
 ) -> ManifestOutcome:
     """Fuses one image's per-platform builds, retrying to the configured budget.
 
     Sources are the run-unique per-platform tags, so a manifest can only ever be
     assembled from images this run produced -- never from a previous day's
-    leftovers still sitting under a floating tag.
+    leftovers still sitting under a floating tag. Under `incremental`, an image
+    whose batch manifest a build already fused is sourced from that instead:
+    the same run-unique content, and only the floating tags left to publish.
     """
-    command = (
-        "docker",
-        "buildx",
-        "imagetools",
-        "create",
-        *(argument for tag in manifest_tags(image, identity) for argument in ("--tag", tag)),
-        *(run_tag(image, str(platform), identity) for platform in platforms),
-    )
+    fused_early = incremental and tag_exists(batch_tag(image, identity))
+    command = final_fusion(image, platforms, identity, fused_early)
 
     def fuse() -> None:
-        subprocess.run(command, check=True)
+        # Through the process's registry window, which captures the output to
+        # recognise a refusal; so what buildx said is logged here instead.
+        completed = ratelimit.REGISTRY.run(command)
+        if completed.returncode != 0:
+            logger.warning("imagetools create for '%s':\n%s", image, completed.stderr.strip())
+            raise subprocess.CalledProcessError(
+                completed.returncode, command, completed.stdout, completed.stderr
+            )
 
     match with_retries(
         operation=fuse,
         max_retries=max_retries,
         label=f"Creating manifest for '{image}'",
         log=logger,
+        governor=retry.REGISTRY,
     ):
         case Succeeded(attempts):
             logger.info("Pushed manifest for '%s'", image)
@@ -89,11 +96,26 @@ def main() -> int:
         return 1
 
     logger.info("Creating manifests for %d image(s) across %s", len(images), list(platforms))
-
-    # imagetools work is registry-side and I/O bound, so these run concurrently.
-    with ThreadPoolExecutor(max_workers=max(1, len(images))) as pool:
+    incremental = read("INCREMENTAL_MANIFESTS", FLAG, default=False)
+
+    # imagetools work is registry-side and I/O bound, so these run concurrently
+    # -- as many at once as the shared registry window admits, which widens
+    # while the registry keeps answering and halves when it starts refusing.
+    # Threads past the window's ceiling could only ever wait on it.
+    width = min(len(images), int(ratelimit.REGISTRY.window.ceiling))
+    with ThreadPoolExecutor(max_workers=max(1, width)) as pool:
         outcomes = tuple(
-            pool.map(lambda image: push_manifest(image, platforms, identity, max_retries), images)
+            pool.map(
+                lambda image: push_manifest(image, platforms, identity, max_retries, incremental),
+                images,
+            )
+        )
+
+    if ratelimit.REGISTRY.refusals:
+        logger.info(
+            "The registry refused %d call(s) for rate; the window ended at %d.",
+            ratelimit.REGISTRY.refusals,
+            ratelimit.REGISTRY.window.admits,
         )
 
     failures = tuple(outcome for outcome in outcomes if isinstance(outcome, ManifestFailed))
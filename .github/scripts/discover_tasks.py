@@ -8,11 +8,14 @@ import json
 import logging
 import sys
 from pathlib import Path
+from typing import assert_never
 
+from ci.affected import Everything, Only, plan_scope
 from ci.discovery import ConflictingDockerfiles, MatrixEntry, deal, discover, seed_for
 from ci.domain import Platform
 from ci.env import (
     COUNT,
+    OPTIONAL_TEXT,
     RETRIES,
     TEXT,
     BuildIdentity,
@@ -22,8 +25,9 @@ from ci.env import (
     write_summary,
 )
 from ci.logs import configure
-from ci.provenance import generations
-from ci.references import CyclicGraph, DanglingReference, MisdeclaredReference
+from ci.persisted import configured_path
+from ci.provenance import ProvenanceIndex, generations
+from ci.references import CyclicGraph, DanglingReference, MisdeclaredReference, ParseCache
 from ci.report import graph_section, run_section
 
 logger = logging.getLogger("ci.discover")
@@ -44,8 +48,15 @@ def main() -> int:
     # a comprehension.
     worker_count = read("WORKER_COUNT", COUNT, default=4)
 
+    # Optional, like the provenance index below: absent, every Dockerfile is
+    # parsed as it always was.
+    parses_path = configured_path(read("PARSE_CACHE", OPTIONAL_TEXT, default=""))
+    parses = ParseCache.load(parses_path) if parses_path is not None else ParseCache()
+
     try:
-        discovered = discover(Path.cwd(), platforms, read("MAX_RETRIES", RETRIES, default=50))
+        discovered = discover(
+            Path.cwd(), platforms, read("MAX_RETRIES", RETRIES, default=50), parses
+        )
     # Every one of these is a layout defect the tree states and only the whole
     # tree can detect, so all are reported here and refuse the run rather than
     # being carried into a build that would publish something arbitrary.
@@ -58,6 +69,10 @@ def main() -> int:
         logger.error("%s", defect)
         return 1
 
+    logger.info("Parsed %d Dockerfile(s); %d reused unchanged.", parses.misses, parses.hits)
+    if parses_path is not None:
+        parses.save(parses_path)
+
     tasks = discovered.tasks
     if not tasks:
         logger.error("No Dockerfiles found in the current directory or subdirectories.")
@@ -65,12 +80,31 @@ def main() -> int:
 
     logger.info("Discovered %d tasks across %d platform(s).", len(tasks), len(platforms))
 
+    # Empty unless a push supplied the commit it moved the branch from: scheduled
+    # and dispatched runs leave it unset and rebuild everything, which is how an
+    # upstream base that moved under an unchanged tree still gets picked up.
+    scope = plan_scope(read("PLAN_BASE", OPTIONAL_TEXT, default=""), tasks)
+    discovered_images = len({task.image for task in tasks})
+    match scope:
+        case Everything(reason):
+            planned = tasks
+            scope_line = f"all {discovered_images} image(s): {reason}"
+        case Only(images, changed):
+            planned = tuple(task for task in tasks if task.image in images)
+            scope_line = (
+                f"{len(images)} of {discovered_images} image(s): {len(changed)} changed, "
+                f"{len(images) - len(changed)} consuming them"
+            )
+        case _:
+            assert_never(scope)
+    logger.info("Planning %s.", scope_line)
+
     entries = tuple(
         MatrixEntry(platform=platform, worker_id=worker_id, tasks=share)
         for platform in platforms
         for worker_id, share in enumerate(
             deal(
-                tuple(task for task in tasks if task.platform is platform),
+                tuple(task for task in planned if task.platform is platform),
                 worker_count,
                 seed_for(platform),
             )
@@ -87,13 +121,23 @@ def main() -> int:
     # back to binfmt/QEMU emulation. Emitted from the same `platforms` tuple and
     # the same `runner_label` as the build matrix above, so the two stages
     # cannot drift onto different runner shapes.
+    #
+    # RECONCILE_WORKERS instances per architecture rather than one, when set: each
+    # checks everything and rebuilds its own share of what is missing, so a mass
+    # failure is repaired on several runners instead of queueing on one.
+    reconcile_workers = read("RECONCILE_WORKERS", COUNT, default=1)
     write_output(
         "reconcile_matrix",
         json.dumps(
             {
                 "include": [
-                    {"platform": str(platform), "runner": platform.runner_label}
+                    {
+                        "platform": str(platform),
+                        "runner": platform.runner_label,
+                        "worker_id": worker_id,
+                    }
                     for platform in platforms
+                    for worker_id in range(reconcile_workers)
                 ]
             }
         ),
@@ -105,6 +149,12 @@ def main() -> int:
     # look -- so it is reported here, once, from the only stage that sees it all.
     found = discovered.graph
     probe = found.probe
+
+    # Optional, and cold when absent: every hop past the newest names a pinned
+    # tag, so what an earlier plan job learned about it is still true, and the
+    # workflow carries it here through the Actions cache.
+    index_path = configured_path(read("PROVENANCE_INDEX", OPTIONAL_TEXT, default=""))
+    index = ProvenanceIndex.load(index_path) if index_path is not None else None
     table = (
         generations(
             probe=probe[0],
@@ -112,10 +162,18 @@ def main() -> int:
             registry_repository=registry_repository(),
             platform=platforms[0],
             depth=found.depth,
+            lookup=index,
         )
         if probe is not None
         else ()
     )
+    if index is not None and index_path is not None:
+        index.save(index_path)
+        logger.info(
+            "Generation walk: %d hop(s) from the index, %d asked of the registry.",
+            index.reused,
+            index.asked,
+        )
     write_summary(
         [
             *run_section(
@@ -123,8 +181,9 @@ def main() -> int:
                 generations=table,
                 needed=found.depth,
                 probe=probe[0] if probe else None,
-                images=len({task.image for task in tasks}),
+                images=len({task.image for task in planned}),
                 platforms=len(platforms),
+                scope=scope_line,
             ),
             *graph_section(found, resolved=len(table)),
         ]
@@ -135,7 +194,9 @@ def main() -> int:
     # differ between them mid-run.
     write_output("generations", ",".join(str(batch) for batch in table))
 
-    write_output("images", json.dumps(sorted({task.image for task in tasks})))
+    # Possibly empty: a push touching nothing any image owns plans no builds,
+    # and the workflow skips the build, reconcile, and manifest stages on it.
+    write_output("images", json.dumps(sorted({task.image for task in planned})))
     write_output("platforms", json.dumps([str(platform) for platform in platforms]))
     return 0
 
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+"""Entry point: learn from this job's DIRECT timeouts which hosts to route around.
+
+Runs after the builds, however they ended, and reads the log mihomo wrote
+through the job; see `ci/allowlist.py` for what is counted and when a host is
+adopted. Then dials every adopted host directly, since the log cannot say
+whether a host routed through WARP has recovered. Never fails the job: it is
+bookkeeping for the next one.
+
+Writes this job's sighting to EGRESS_SIGHTING, not the candidates themselves:
+the candidates restored from EGRESS_CANDIDATES are read only, and
+`merge_egress.py` folds every job's sighting into them once, at the end of the
+run. See "One writer" in `ci/allowlist.py`.
+"""
+
+from __future__ import annotations
+
+import datetime
+import logging
+import socket
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from ci import allowlist
+from ci.allowlist import (
+    ADOPT_AFTER_JOBS,
+    LEARNING,
+    Learning,
+    Sighting,
+    adopted,
+    direct_timeouts,
+    observed,
+)
+from ci.env import OPTIONAL_TEXT, TEXT, read, write_summary
+from ci.logs import configure
+from ci.persisted import configured_path
+
+logger = logging.getLogger("ci.egress.learn")
+
+# Longer than a healthy handshake from anywhere, far shorter than the kernel's
+# retransmit budget: a blackhole answers nothing, so waiting longer only delays
+# the same verdict.
+PROBE_TIMEOUT_SECONDS = 10.0
+
+
+def blackholed(host: str, timeout_seconds: float = PROBE_TIMEOUT_SECONDS) -> bool:
+    """Whether a direct connection to `host`'s HTTPS port times out.
+
+    Only a timeout counts. A refusal or a name that does not resolve is some
+    other fault, and not one routing through WARP is there to hide.
+    """
+    try:
+        with socket.create_connection((host, 443), timeout=timeout_seconds):
+            return False
+    except TimeoutError:
+        return True
+    except OSError:
+        return False
+
+
+def learn() -> None:
+    learning = read("EGRESS_LEARNING", LEARNING, default=Learning.OBSERVE)
+    path = configured_path(read("EGRESS_CANDIDATES", OPTIONAL_TEXT, default=""))
+    sighting = configured_path(read("EGRESS_SIGHTING", OPTIONAL_TEXT, default=""))
+    if learning is Learning.OFF or path is None or sighting is None:
+        logger.info("Egress learning is off for this job.")
+        return
+
+    log = Path(read("RUNNER_TEMP", TEXT, default="/tmp")) / "egress" / "mihomo.log"
+    try:
+        with log.open(encoding="utf-8", errors="replace") as lines:
+            timeouts = direct_timeouts(lines)
+    except FileNotFoundError:
+        logger.info("No proxy ran in this job; nothing to learn.")
+        return
+
+    today = datetime.datetime.now(datetime.UTC).date()
+    known = allowlist.load(path)
+    probed = adopted(known, learning)
+    with ThreadPoolExecutor(max_workers=max(1, min(8, len(probed)))) as pool:
+        verdicts = dict(zip(probed, pool.map(blackholed, probed), strict=True))
+    still_failing = tuple(host for host, failing in verdicts.items() if failing)
+    if verdicts:
+        logger.info(
+            "Adopted hosts still blackholed on the direct path: %s",
+            ", ".join(still_failing) or "(none)",
+        )
+    allowlist.save_sighting(
+        sighting, Sighting(day=today, timeouts=dict(timeouts), still_failing=still_failing)
+    )
+    if not timeouts:
+        return
+
+    # What this job alone would make of the candidates, for the summary. Other
+    # jobs of the run may add to the count when the sightings are merged.
+    candidates = observed(known, timeouts, today, still_failing)
+
+    logger.info("DIRECT timeouts this job: %s", dict(timeouts.most_common()))
+    write_summary(
+        [
+            "",
+            f"### Direct-path timeouts (learning: {learning})",
+            "",
+            "| Host | Timeouts this job | Jobs seen failing |",
+            "| --- | --- | --- |",
+            *(
+                f"| {host} | {count} | "
+                f"{candidates[host].jobs if host in candidates else 0}/{ADOPT_AFTER_JOBS} |"
+                for host, count in timeouts.most_common()
+            ),
+            "",
+        ]
+    )
+
+
+def main() -> int:
+    configure()
+    try:
+        learn()
+    except Exception:
+        # As in setup_egress: a measurement for the next job must never cost
+        # this one its result.
+        logger.warning("Egress learning raised; nothing was recorded", exc_info=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+"""Entry point: fold every job's egress sighting into the learned candidates.
+
+The one writer of EGRESS_CANDIDATES. Each build worker and reconcile job
+uploaded what it saw -- its DIRECT timeouts and its probes of adopted hosts --
+and this reads them all, applies them to the candidates the latest run saved,
+and saves the result for the next run to restore. See `ci/allowlist.py`.
+
+Never fails the run: a job that uploaded nothing simply has no sighting, and
+the candidates move on without it.
+"""
+
+from __future__ import annotations
+
+import logging
+import sys
+from pathlib import Path
+
+from ci import allowlist
+from ci.env import TEXT, read
+from ci.logs import configure
+
+logger = logging.getLogger("ci.egress.learn")
+
+
+def main() -> int:
+    configure()
+    path = Path(read("EGRESS_CANDIDATES", TEXT))
+    sightings = allowlist.load_sightings(Path(read("EGRESS_SIGHTINGS_DIR", TEXT)))
+    candidates = allowlist.folded(allowlist.load(path), sightings)
+    allowlist.save(path, candidates)
+    logger.info(
+        "Folded %d job sighting(s); %d candidate host(s) carried forward.",
+        len(sightings),
+        len(candidates),
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+"""Entry point: merge every worker's timeline into one run-wide report.
+
+Reads whatever the build workers uploaded, which may be fewer documents than
+there were workers: one that died early wrote nothing. The report describes
+the workers that did, and never fails the run -- it is a measurement, and a
+run is not worse for being measured incompletely.
+
+When CAPACITY_HISTORY names a file, the run's utilisation is appended to it for
+`recommend_capacity.py`; see `ci.capacity`.
+"""
+
+from __future__ import annotations
+
+import datetime
+import logging
+import sys
+from pathlib import Path
+
+from ci import capacity, timeline
+from ci.env import OPTIONAL_TEXT, TEXT, read, write_summary
+from ci.logs import configure
+from ci.persisted import configured_path
+
+logger = logging.getLogger("ci.timeline")
+
+
+def main() -> int:
+    configure()
+    directory = Path(read("TIMELINE_DIR", TEXT))
+    timelines = timeline.load_all(directory)
+    logger.info("Merging %d worker timeline(s) from %s.", len(timelines), directory)
+    write_summary(timeline.report(timelines))
+
+    history = configured_path(read("CAPACITY_HISTORY", OPTIONAL_TEXT, default=""))
+    if history is not None:
+        # Keyed on the run alone, not the attempt: a re-run's record replaces
+        # the one it re-ran.
+        records = capacity.records_of(
+            read("GITHUB_RUN_ID", TEXT),
+            datetime.datetime.now(datetime.UTC).date(),
+            timelines,
+        )
+        capacity.save(history, capacity.appended(capacity.load(history), records))
+        logger.info("Recorded %d platform(s) in the capacity history.", len(records))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+
+"""Entry point: suggest BUILD_SLOTS and WORKER_COUNT from the capacity history.
+
+Reads the history `merge_timelines.py` appends to and reports, per platform,
+the cheapest measured configuration expected to finish the build stage within
+TARGET_MAKESPAN_MINUTES, beside what the current configuration is expected to
+take. See `ci.capacity` for how the predictions are made.
+
+Advice only: nothing here changes the workflow's settings, and it never fails
+the run. Run it locally against a downloaded history the same way:
+
+    CAPACITY_HISTORY=history.json uv run python recommend_capacity.py
+"""
+
+from __future__ import annotations
+
+import logging
+import sys
+from pathlib import Path
+
+from ci import capacity
+from ci.env import COUNT, TEXT, read, write_summary
+from ci.logs import configure
+
+logger = logging.getLogger("ci.capacity")
+
+
+def main() -> int:
+    configure()
+    history = capacity.load(Path(read("CAPACITY_HISTORY", TEXT)))
+    target = read("TARGET_MAKESPAN_MINUTES", COUNT, default=60) * 60.0
+    lines = capacity.report(capacity.recommend(history, target), target)
+    logger.info("Capacity from %d recorded run(s):\n%s", len(history), "\n".join(lines))
+    write_summary(["", *lines])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -18,7 +18,7 @@ from __future__ import annotations
 
 import logging
 import sys
-from concurrent.futures import ThreadPoolExecutor
+from collections.abc import Callable
 from functools import partial
 from pathlib import Path
 
@@ -26,10 +26,13 @@ import httpx
 
 from ci.discovery import ConflictingDockerfiles, discover
 from ci.docker import build_and_push, free_disk_space, run_tag, tag_exists
-from ci.domain import BuildFailed, Platform, Task, succeeded
+from ci.domain import BuildFailed, BuildOutcome, Platform, Task, succeeded
 from ci.env import (
     COUNT,
+    FLAG,
+    INDEX,
     NAME_LIST,
+    OPTIONAL_TEXT,
     RETRIES,
     TEXT,
     BuildIdentity,
@@ -38,17 +41,18 @@ from ci.env import (
     write_summary,
 )
 from ci.logs import configure
+from ci.manifests import IncrementalFusion
 from ci.mesh import MeshClient, Rendezvous
+from ci.persisted import configured_path
+from ci.provenance import ResolutionCache
+from ci.reconcile import Share, stream
+from ci.references import ParseCache
 from ci.report import provenance_section
 
 logger = logging.getLogger("ci.reconcile")
 
 GITHUB_API = "https://api.github.com"
 
-# Registry inspections are network-bound and independent, so they run wide; the
-# bound exists to stay well inside registry rate limits, not to save CPU.
-_INSPECT_CONCURRENCY = 8
-
 
 def main() -> int:
     configure()
@@ -62,32 +66,45 @@ def main() -> int:
         logger.error("DOCKER_PLATFORM is not a supported architecture.")
         return 1
 
-    # This instance owns its architecture's slice of the rendezvous namespace and
-    # nothing else, so the per-platform cleanups below are disjoint rather than
-    # racing to delete the same refs.
-    rendezvous = Rendezvous(
-        repository=read("GITHUB_REPOSITORY", TEXT),
-        run_id=read("GITHUB_RUN_ID", TEXT),
-        platform=platform,
-    )
+    # One of RECONCILE_WORKERS instances for this architecture. Every instance
+    # checks every expected image, and rebuilds only the missing ones it owns.
+    try:
+        share = Share(
+            worker_id=read("WORKER_ID", INDEX, default=0),
+            workers=read("RECONCILE_WORKERS", COUNT, default=1),
+        )
+    except ValueError as error:
+        logger.error("Reconcile worker assignment is inconsistent: %s", error)
+        return 1
 
-    with httpx.Client(
-        base_url=GITHUB_API,
-        timeout=15.0,
-        headers={
-            "Authorization": f"Bearer {read('GITHUB_TOKEN', TEXT)}",
-            "Accept": "application/vnd.github+json",
-        },
-    ) as github:
-        removed = MeshClient(
-            secret=b"",
-            worker_id=-1,
-            rendezvous=rendezvous,
-            github=github,
-            peers_client=github,
-            expected_peers=0,
-        ).cleanup()
-        logger.info("Cleaned up %d %s mesh ref(s).", removed, platform)
+    # This architecture's first instance owns its slice of the rendezvous
+    # namespace and nothing else, so the per-platform cleanups below are disjoint
+    # rather than racing to delete the same refs -- across platforms, and across
+    # the reconcile workers of one.
+    if share.worker_id == 0:
+        rendezvous = Rendezvous(
+            repository=read("GITHUB_REPOSITORY", TEXT),
+            run_id=read("GITHUB_RUN_ID", TEXT),
+            platform=platform,
+        )
+
+        with httpx.Client(
+            base_url=GITHUB_API,
+            timeout=15.0,
+            headers={
+                "Authorization": f"Bearer {read('GITHUB_TOKEN', TEXT)}",
+                "Accept": "application/vnd.github+json",
+            },
+        ) as github:
+            removed = MeshClient(
+                secret=b"",
+                worker_id=-1,
+                rendezvous=rendezvous,
+                github=github,
+                peers_client=github,
+                expected_peers=0,
+            ).cleanup()
+            logger.info("Cleaned up %d %s mesh ref(s).", removed, platform)
 
     # Re-derive the task set from the tree rather than reconstructing paths from
     # image names. It is the same checkout at the same commit, so discovery is
@@ -95,61 +112,90 @@ def main() -> int:
     # reconstructing them here would quietly assume every Dockerfile sits one
     # directory down under a directory named after the image, which discovery
     # itself does not require.
+    #
+    # Read through the plan job's parses: the checkout is the same commit, so
+    # every file is a hit and none is parsed again.
+    parses_path = configured_path(read("PARSE_CACHE", OPTIONAL_TEXT, default=""))
+    parses = ParseCache.load(parses_path) if parses_path is not None else ParseCache()
     try:
-        expected = discover(Path.cwd(), (platform,), max_retries).tasks
+        discovery = discover(Path.cwd(), (platform,), max_retries, parses)
     except ConflictingDockerfiles as conflict:
         logger.error("%s", conflict)
         return 1
 
     # The image *set* is architecture-independent, so this still cross-checks the
-    # whole plan even though the tasks are one platform's.
-    if {task.image for task in expected} != set(images):
+    # whole plan even though the tasks are one platform's. A subset rather than
+    # equality: a plan narrowed to the images a push affected names fewer than
+    # discovery finds, and only those were built, so only those are owed. A name
+    # discovery cannot find is still a disagreement, and still refused.
+    planned = set(images)
+    unknown = planned - {task.image for task in discovery.tasks}
+    if unknown:
         logger.error(
             "Discovery disagrees with the planned image list; refusing to guess. "
-            "planned-only=%s discovered-only=%s",
-            sorted(set(images) - {task.image for task in expected}),
-            sorted({task.image for task in expected} - set(images)),
+            "planned-only=%s",
+            sorted(unknown),
         )
         return 1
+    expected = tuple(task for task in discovery.tasks if task.image in planned)
 
     logger.info("Verifying %d expected %s image(s)...", len(expected), platform)
 
     def landed(task: Task) -> bool:
         return tag_exists(run_tag(task.image, str(task.platform), identity))
 
-    with ThreadPoolExecutor(max_workers=_INSPECT_CONCURRENCY) as pool:
-        present = tuple(pool.map(landed, expected))
+    # Shared across the rebuilds for the reason a worker shares one: missing
+    # images cluster around the ones that failed, and those share dependencies.
+    lookup = ResolutionCache()
 
-    missing = tuple(task for task, found in zip(expected, present, strict=True) if not found)
+    # The same slot count a build worker uses, for the same reason: if a whole
+    # build stage failed, every image in the repository is missing, and one
+    # thread each would put 30+ concurrent multi-gigabyte layer writes on one
+    # disk. Sharing BUILD_SLOTS keeps reconcile the same shape as the workers it
+    # is standing in for, so tuning that number tunes both.
+    rebuild: Callable[[Task], BuildOutcome] = partial(
+        build_and_push, identity=identity, lookup=lookup
+    )
+    # A rebuild completes an image's platforms as surely as a build does, and is
+    # usually the last of them to land.
+    if read("INCREMENTAL_MANIFESTS", FLAG, default=False):
+        architectures = read_json("PLATFORMS", NAME_LIST)
+        fusion = IncrementalFusion(
+            identity, tuple(filter(None, map(Platform.parse, architectures)))
+        )
+        rebuild = fusion.around(rebuild)
+
+    recovery = stream(
+        expected,
+        landed=landed,
+        rebuild=rebuild,
+        slots=read("BUILD_SLOTS", COUNT, default=4),
+        cleanup=free_disk_space,
+        levels=discovery.graph.levels,
+        share=share,
+    )
+    missing, outcomes = recovery.missing, recovery.outcomes
 
     if not missing:
         logger.info("All expected images are present. Nothing to reconcile.")
         return 0
 
     logger.warning(
-        "%d image(s) missing after the build stage: %s",
+        "%d image(s) were missing after the build stage: %s",
         len(missing),
         ", ".join(f"{task.image}.{task.platform}" for task in missing),
     )
 
-    free_disk_space()
-
-    # The same slot count a build worker uses, for the same reason: if a whole
-    # build stage failed this list is every image in the repository, and one
-    # thread each would put 30+ concurrent multi-gigabyte layer writes on one
-    # disk. Sharing BUILD_SLOTS keeps reconcile the same shape as the workers it
-    # is standing in for, so tuning that number tunes both.
-    concurrency = min(len(missing), read("BUILD_SLOTS", COUNT, default=4))
-    logger.info("Rebuilding %d image(s), %d at a time.", len(missing), concurrency)
-
-    with ThreadPoolExecutor(max_workers=concurrency) as pool:
-        outcomes = tuple(pool.map(partial(build_and_push, identity=identity), missing))
-
+    title = (
+        f"Reconcile ({platform}, worker {share.worker_id})"
+        if share.workers > 1
+        else f"Reconcile ({platform})"
+    )
     write_summary(
         [
-            *provenance_section(f"Reconcile ({platform}): what each rebuild consumed", outcomes),
+            *provenance_section(f"{title}: what each rebuild consumed", outcomes),
             "",
-            f"### Reconcile ({platform})",
+            f"### {title}",
             "",
             f"Rebuilt {len(missing)} missing image(s).",
             "",
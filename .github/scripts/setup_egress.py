@@ -4,7 +4,12 @@
 
 Provisions the WARP tunnel and local proxy described in `ci/egress.py`, then
 hands the result to the rest of the job through `$GITHUB_ENV`. Steps that follow
-read `BUILD_PROXY_URL` and route builds through it.
+read `BUILD_PROXY_URL` and route builds through it, and `EGRESS_STATE_FILE` for
+the route the watchdog started here last recorded.
+
+The build worker does not run this as a step. It calls `provision` itself,
+beside the rest of its provisioning (see `ci.provisioning`), and applies what
+comes back to its own environment; the reconcile job still runs it here.
 
 This step cannot fail the job, by construction. `main` catches everything and
 always exits 0, and the workflow marks the step `continue-on-error` on top of
@@ -21,22 +26,30 @@ the runner's own address, which is what it does today.
 
 from __future__ import annotations
 
+import json
 import logging
+import secrets
 import sys
 from pathlib import Path
+from typing import assert_never
 
+from ci import allowlist, watchdog
+from ci.allowlist import LEARNING, Learning, adopted
 from ci.domain import Installed, InstallFailed, ProxyReady, ProxyUnavailable
 from ci.egress import (
+    DEFAULT_CONTROLLER_PORT,
     DEFAULT_PROXY_PORT,
-    MasqueNode,
+    Controller,
     RegistrationFailed,
     host_platform,
-    register,
+    proxied_domains,
+    register_fleet,
     resolve_binary,
     start_proxy,
 )
-from ci.env import PORT, TEXT, mask, read, write_env
+from ci.env import COUNT, OPTIONAL_TEXT, PORT, TEXT, mask, read, write_env
 from ci.logs import configure
+from ci.persisted import configured_path
 
 logger = logging.getLogger("ci.egress.setup")
 
@@ -45,12 +58,16 @@ logger = logging.getLogger("ci.egress.setup")
 _DEGRADED = "%s (%s); builds will use the runner's own path"
 
 
-def provision() -> None:
-    """Sets up clean egress, or explains in one line why it did not."""
+def provision() -> dict[str, str]:
+    """Sets up clean egress, or explains in one line why it did not.
+
+    Returns the variables to export, empty when degraded: the caller decides
+    whether they reach later steps, this process, or both.
+    """
     platform = host_platform()
     if platform is None:
         logger.warning(_DEGRADED, "unsupported runner architecture", "no mihomo build")
-        return
+        return {}
 
     port = read("EGRESS_PROXY_PORT", PORT, default=DEFAULT_PROXY_PORT)
     working_dir = Path(read("RUNNER_TEMP", TEXT, default="/tmp")) / "egress"
@@ -58,45 +75,117 @@ def provision() -> None:
     match resolve_binary(platform):
         case InstallFailed(reason):
             logger.warning(_DEGRADED, "mihomo unavailable", reason)
-            return
+            return {}
         case Installed(binary, version):
             logger.info("Using mihomo %s", version)
 
-    match register():
+    # One MASQUE session per node, load-balanced: proxied throughput scales
+    # with how many builds share it only if there is more than one session.
+    nodes = read("EGRESS_NODES", COUNT, default=1)
+    match register_fleet(nodes):
         case RegistrationFailed(reason):
             logger.warning(_DEGRADED, "WARP registration failed", reason)
-            return
-        case MasqueNode() as node:
-            # The private key reaches a config file on disk and nothing else,
-            # but registering it for redaction costs nothing and closes the gap
-            # if a future traceback ever carries it into the log.
-            mask(node.private_key)
-            logger.info("Registered an ephemeral WARP device")
-
-    match start_proxy(binary, node, working_dir, port=port):
+            return {}
+        case tuple() as fleet:
+            # The private keys reach a config file on disk and nothing else,
+            # but registering them for redaction costs nothing and closes the
+            # gap if a future traceback ever carries one into the log.
+            for node in fleet:
+                mask(node.private_key)
+            logger.info("Registered %d ephemeral WARP device(s)", len(fleet))
+
+    controller = Controller(
+        port=read("EGRESS_CONTROLLER_PORT", PORT, default=DEFAULT_CONTROLLER_PORT),
+        secret=secrets.token_urlsafe(32),
+    )
+    mask(controller.secret)
+
+    domains = proxied_domains(learned_hosts())
+
+    match start_proxy(
+        binary, fleet, working_dir, port=port, controller=controller, proxied_domains=domains
+    ):
         case ProxyUnavailable(reason):
             logger.warning(_DEGRADED, "proxy did not come up", reason)
+            return {}
         case ProxyReady(local_url, container_url):
             # Only the container-facing address is exported. Host tooling is
             # deliberately left alone: registry pushes and the Actions control
             # plane are the critical path, and putting a userspace hop in front
             # of multi-gigabyte layer uploads to fix an unrelated upstream is
             # the wrong trade.
-            write_env("BUILD_PROXY_URL", container_url)
             logger.info("Clean egress ready; builds will route through %s", container_url)
             logger.debug("Proxy also reachable from the runner at %s", local_url)
+            exports = {"BUILD_PROXY_URL": container_url}
+            if state := watch(working_dir, port, nodes, domains, controller, container_url):
+                exports["EGRESS_STATE_FILE"] = str(state)
+            return exports
+        case other:
+            assert_never(other)
+
+
+def learned_hosts() -> tuple[str, ...]:
+    """The candidates `learn_egress.py` recorded in earlier jobs, as policy allows."""
+    learning = read("EGRESS_LEARNING", LEARNING, default=Learning.OBSERVE)
+    path = configured_path(read("EGRESS_CANDIDATES", OPTIONAL_TEXT, default=""))
+    if path is None or learning is Learning.OFF:
+        return ()
+    hosts = adopted(allowlist.load(path), learning)
+    if hosts:
+        logger.info("Routing %d learned host(s) through WARP: %s", len(hosts), ", ".join(hosts))
+    return hosts
+
+
+def watch(
+    working_dir: Path,
+    port: int,
+    nodes: int,
+    domains: tuple[str, ...],
+    controller: Controller,
+    probe_via: str,
+) -> Path | None:
+    """Keeps the proxy's route honest for the rest of the job. Best-effort.
+
+    Without the watchdog the proxy behaves as it always did, so a failure to
+    start one is a warning and nothing more. Returns the state file it will
+    record routes in, if it started.
+    """
+    state = working_dir / "state.json"
+    started = watchdog.launch(
+        Path(__file__).with_name("watch_egress.py"),
+        working_dir,
+        {
+            "EGRESS_PROXY_PORT": str(port),
+            "EGRESS_CONTROLLER_PORT": str(controller.port),
+            "EGRESS_CONTROLLER_SECRET": controller.secret,
+            "EGRESS_CONFIG": str(working_dir / "config.yaml"),
+            "EGRESS_PROBE_URL": probe_via,
+            "EGRESS_NODES": str(nodes),
+            # The allowlist as rendered, learned hosts included, so a reload
+            # re-renders the same rules rather than only the hand-written ones.
+            "EGRESS_DOMAINS": json.dumps(domains),
+            "EGRESS_STATE_FILE": str(state),
+        },
+    )
+    if not started:
+        return None
+    logger.info("Egress watchdog started; route changes are recorded in %s", state)
+    return state
 
 
 def main() -> int:
     configure()
     try:
-        provision()
+        exports = provision()
     except Exception:
         # Deliberately bare. The point is not to enumerate what can go wrong out
         # there -- it is that *nothing* going wrong out there may cost this run
         # its build. The traceback is logged because a silent skip that nobody
         # can diagnose is its own failure mode.
         logger.warning("Egress setup raised; builds will use the runner's own path", exc_info=True)
+        return 0
+    for name, value in exports.items():
+        write_env(name, value)
     return 0
 
 
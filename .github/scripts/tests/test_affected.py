@@ -0,0 +1,108 @@
+"""Narrowing a plan to what a change affected, and every way it widens back."""
+
+from __future__ import annotations
+
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from ci.affected import Everything, Only, plan_scope, scope
+from ci.domain import Platform, Task
+
+
+def task(image: str, *dependents: str, context: str | None = None) -> Task:
+    return Task(
+        image=image,
+        dockerfile=f"{image}/Dockerfile",
+        context=image if context is None else context,
+        platform=Platform.AMD64,
+        max_retries=1,
+        dependents=dependents,
+    )
+
+
+# base <- python <- notebook, and an unrelated redis.
+TREE = (
+    task("base", "python"),
+    task("python", "notebook"),
+    task("notebook"),
+    task("redis"),
+)
+
+
+def test_a_changed_dockerfile_plans_its_image_and_every_consumer() -> None:
+    assert scope(["base/Dockerfile"], TREE) == Only(
+        images=frozenset({"base", "python", "notebook"}), changed=frozenset({"base"})
+    )
+
+
+def test_a_file_in_the_context_is_a_change_to_the_image() -> None:
+    assert scope(["redis/redis.conf"], TREE) == Only(
+        images=frozenset({"redis"}), changed=frozenset({"redis"})
+    )
+
+
+def test_a_path_that_merely_shares_a_prefix_is_not_in_the_context() -> None:
+    # `redis-tools/` starts with the string "redis" and is nothing of redis's.
+    assert scope(["redis-tools/README.md"], TREE) == Only(
+        images=frozenset(), changed=frozenset()
+    )
+
+
+def test_a_leaf_change_does_not_reach_upwards() -> None:
+    assert scope(["notebook/Dockerfile"], TREE) == Only(
+        images=frozenset({"notebook"}), changed=frozenset({"notebook"})
+    )
+
+
+def test_paths_no_image_owns_plan_nothing() -> None:
+    assert scope(["README.md", "LICENSE"], TREE) == Only(
+        images=frozenset(), changed=frozenset()
+    )
+
+
+def test_a_root_context_owns_every_path() -> None:
+    rooted = (*TREE, task("everything", context=""))
+    assert scope(["README.md"], rooted) == Only(
+        images=frozenset({"everything"}), changed=frozenset({"everything"})
+    )
+
+
+@pytest.mark.parametrize("path", [".github/scripts/ci/docker.py", ".discoveryignore"])
+def test_orchestration_changes_plan_everything(path: str) -> None:
+    assert isinstance(scope(["redis/redis.conf", path], TREE), Everything)
+
+
+@pytest.mark.parametrize("base", ["", "0" * 40])
+def test_no_base_plans_everything(base: str) -> None:
+    assert plan_scope(base, TREE) == Everything("no base commit to compare against")
+
+
+def _git(root: Path, *arguments: str) -> str:
+    return subprocess.run(
+        ("git", "-C", str(root), *arguments), capture_output=True, text=True, check=True
+    ).stdout.strip()
+
+
+def test_an_unreadable_diff_plans_everything(tmp_path: Path) -> None:
+    _git(tmp_path, "init", "--quiet")
+    assert isinstance(plan_scope("f" * 40, TREE, str(tmp_path)), Everything)
+
+
+def test_the_diff_is_read_from_git(tmp_path: Path) -> None:
+    _git(tmp_path, "init", "--quiet")
+    for image in ("base", "redis"):
+        (tmp_path / image).mkdir()
+        (tmp_path / image / "Dockerfile").write_text("FROM scratch\n")
+    identity = ("-c", "user.name=test", "-c", "user.email=test@example.com")
+    _git(tmp_path, "add", ".")
+    _git(tmp_path, *identity, "commit", "--quiet", "-m", "first")
+    base = _git(tmp_path, "rev-parse", "HEAD")
+
+    (tmp_path / "redis" / "Dockerfile").write_text("FROM scratch\nLABEL changed=yes\n")
+    _git(tmp_path, *identity, "commit", "--quiet", "-am", "second")
+
+    assert plan_scope(base, TREE, str(tmp_path)) == Only(
+        images=frozenset({"redis"}), changed=frozenset({"redis"})
+    )
@@ -0,0 +1,95 @@
+"""Learning the allowlist: what counts as a timeout, when a host is adopted, and never."""
+
+from __future__ import annotations
+
+import datetime
+from pathlib import Path
+
+from ci import allowlist
+from ci.allowlist import Candidate, Learning, Sighting, adopted, direct_timeouts, folded, observed
+from ci.egress import proxied_domains
+
+TODAY = datetime.date(2026, 10, 19)
+
+
+def timeout(host: str, route: str = "DIRECT") -> str:
+    return (
+        f'time="2026-10-19T10:00:00Z" level=warning msg="[TCP] dial {route} (match Match/) '
+        f"172.17.0.2:50112 --> {host}:443 error: dial tcp 185.125.190.80:443: i/o timeout\""
+    )
+
+
+def test_only_direct_timeouts_to_named_hosts_are_counted() -> None:
+    lines = (
+        timeout("ppa.launchpadcontent.net"),
+        timeout("PPA.launchpadcontent.net"),
+        timeout("keyserver.ubuntu.com", route="warp"),
+        timeout("185.125.190.80"),
+        'level=warning msg="[TCP] dial DIRECT (match Match/) a:1 --> x.org:443 error: refused"',
+    )
+    assert direct_timeouts(lines) == {"ppa.launchpadcontent.net": 2}
+
+
+def test_registries_are_never_candidates() -> None:
+    lines = [timeout("registry-1.docker.io")] * 5 + [timeout("ghcr.io")] * 5
+    assert direct_timeouts(lines) == {}
+
+
+def test_a_sighting_needs_several_timeouts_in_one_job() -> None:
+    assert observed({}, {"slow.example": 2}, TODAY) == {}
+    assert observed({}, {"dead.example": 3}, TODAY) == {
+        "dead.example": Candidate(jobs=1, last_seen=TODAY)
+    }
+
+
+def test_a_host_is_adopted_after_failing_in_two_jobs_and_only_under_adopt() -> None:
+    once = observed({}, {"dead.example": 5}, TODAY)
+    assert adopted(once, Learning.ADOPT) == ()
+
+    twice = observed(once, {"dead.example": 5}, TODAY)
+    assert adopted(twice, Learning.ADOPT) == ("dead.example",)
+    assert adopted(twice, Learning.OBSERVE) == ()
+
+
+def test_a_host_that_stops_failing_is_forgotten() -> None:
+    stale = {"dead.example": Candidate(jobs=4, last_seen=TODAY - datetime.timedelta(days=30))}
+    assert observed(stale, {}, TODAY) == {}
+
+
+def test_an_adopted_host_is_kept_while_its_direct_probe_still_fails() -> None:
+    """Adopted hosts go through WARP, so only the probe can say they still fail."""
+    month_ago = TODAY - datetime.timedelta(days=30)
+    stale = {"dead.example": Candidate(jobs=4, last_seen=month_ago)}
+    kept = {"dead.example": Candidate(jobs=4, last_seen=TODAY)}
+    assert observed(stale, {}, TODAY, still_failing=("dead.example",)) == kept
+    assert observed(stale, {}, TODAY, still_failing=()) == {}
+
+
+def test_every_jobs_sighting_counts_when_a_run_is_merged(tmp_path: Path) -> None:
+    """Two workers failing on one host in the same run are two jobs, not one."""
+    for worker in ("build-amd64-0", "reconcile-arm64-1"):
+        (tmp_path / worker).mkdir()
+        allowlist.save_sighting(
+            tmp_path / worker / "egress-sighting.json",
+            Sighting(day=TODAY, timeouts={"dead.example": 4}),
+        )
+
+    candidates = folded({}, allowlist.load_sightings(tmp_path))
+
+    assert candidates == {"dead.example": Candidate(jobs=2, last_seen=TODAY)}
+    assert adopted(candidates, Learning.ADOPT) == ("dead.example",)
+
+
+def test_candidates_round_trip(tmp_path: Path) -> None:
+    path = tmp_path / "candidates.json"
+    candidates = {"dead.example": Candidate(jobs=2, last_seen=TODAY)}
+    allowlist.save(path, candidates)
+    assert allowlist.load(path) == candidates
+    assert allowlist.load(tmp_path / "absent.json") == {}
+
+
+def test_learned_hosts_join_the_allowlist_unless_already_covered() -> None:
+    domains = proxied_domains(("ppa.launchpadcontent.net", "dead.example"))
+    assert domains[-1] == "dead.example"
+    assert "ppa.launchpadcontent.net" not in domains
+    assert "launchpadcontent.net" in domains
@@ -12,8 +12,10 @@ import gzip
 import hashlib
 import os
 import stat
+from collections.abc import Iterator
 from pathlib import Path
 
+import httpx
 import pytest
 
 from ci import assets
@@ -26,8 +28,12 @@ PAYLOAD = b"#!/bin/sh\necho hello\n"
 class _FakeStream:
     """Stands in for `httpx.stream`, yielding bytes or raising on demand."""
 
-    def __init__(self, body: bytes) -> None:
+    def __init__(
+        self, body: bytes, status_code: int = 200, headers: dict[str, str] | None = None
+    ) -> None:
         self._body = body
+        self.status_code = status_code
+        self.headers = headers or {}
 
     def __enter__(self) -> _FakeStream:
         return self
@@ -38,11 +44,11 @@ class _FakeStream:
     def raise_for_status(self) -> None:
         return None
 
-    def iter_bytes(self, chunk_size: int = 0) -> list[bytes]:
+    def iter_bytes(self, chunk_size: int = 0) -> Iterator[bytes]:
         # Deliberately more than one chunk: a digest computed over a single
         # read would pass a test the streaming implementation must also pass.
         midpoint = len(self._body) // 2
-        return [self._body[:midpoint], self._body[midpoint:]]
+        yield from (self._body[:midpoint], self._body[midpoint:])
 
 
 def _serve(monkeypatch: pytest.MonkeyPatch, body: bytes) -> list[str]:
@@ -57,6 +63,10 @@ def _serve(monkeypatch: pytest.MonkeyPatch, body: bytes) -> list[str]:
     return requested
 
 
+def _no_sleep(_seconds: float) -> None:
+    return None
+
+
 def _gzipped(body: bytes) -> bytes:
     return gzip.compress(body)
 
@@ -129,7 +139,7 @@ def test_a_failed_download_leaves_nothing_half_installed(
     monkeypatch.setattr("ci.assets.httpx.stream", exploding_stream)
     destination = tmp_path / "binary"
 
-    outcome = install("https://example/bin", _digest(PAYLOAD), destination)
+    outcome = install("https://example/bin", _digest(PAYLOAD), destination, sleep=_no_sleep)
 
     assert isinstance(outcome, InstallFailed)
     assert "download failed" in outcome.reason
@@ -252,6 +262,155 @@ def test_an_unsupported_platform_degrades_rather_than_guessing(
     assert "no pinned digest" in outcome.reason
 
 
+# --- resumption -------------------------------------------------------------
+
+
+class _RangeServer:
+    """Serves `body`, honouring Range; optionally drops the first connection midway."""
+
+    def __init__(self, body: bytes, drop_first: bool = False, ranges: bool = True) -> None:
+        self.body = body
+        self.drop_first = drop_first
+        self.ranges = ranges
+        self.requested: list[str | None] = []
+
+    def __call__(self, _method: str, _url: str, **kwargs: object) -> _FakeStream:
+        headers = kwargs.get("headers")
+        assert isinstance(headers, dict)
+        requested = headers.get("Range")
+        self.requested.append(requested)
+        if self.drop_first and len(self.requested) == 1:
+            return _Dropping(self.body[: len(self.body) // 2])
+        if requested is None or not self.ranges:
+            return _FakeStream(self.body)
+        offset = int(requested.removeprefix("bytes=").removesuffix("-"))
+        if offset >= len(self.body):
+            return _FakeStream(b"", status_code=416)
+        content_range = f"bytes {offset}-{len(self.body) - 1}/{len(self.body)}"
+        return _FakeStream(
+            self.body[offset:], status_code=206, headers={"content-range": content_range}
+        )
+
+
+class _Dropping(_FakeStream):
+    """Delivers its bytes, then loses the connection."""
+
+    def iter_bytes(self, chunk_size: int = 0) -> Iterator[bytes]:
+        yield self._body
+        raise httpx.RemoteProtocolError("peer closed connection")
+
+
+BODY = os.urandom(4096)
+
+
+def test_a_dropped_connection_is_resumed_rather_than_restarted(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    server = _RangeServer(BODY, drop_first=True)
+    monkeypatch.setattr("ci.assets.httpx.stream", server)
+    destination = tmp_path / "binary"
+
+    outcome = install("https://e/bin", _digest(BODY), destination, sleep=_no_sleep)
+
+    assert isinstance(outcome, Installed)
+    assert destination.read_bytes() == BODY
+    assert server.requested == [None, f"bytes={len(BODY) // 2}-"]
+    assert not destination.with_suffix(".download").exists()
+
+
+def test_a_partial_from_an_earlier_install_is_resumed(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    destination = tmp_path / "binary"
+    destination.with_suffix(".download").write_bytes(BODY[:1000])
+    server = _RangeServer(BODY)
+    monkeypatch.setattr("ci.assets.httpx.stream", server)
+
+    assert isinstance(install("https://e/bin", _digest(BODY), destination), Installed)
+    assert server.requested == ["bytes=1000-"]
+    assert destination.read_bytes() == BODY
+
+
+def test_a_server_that_ignores_the_range_is_taken_from_byte_zero(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    destination = tmp_path / "binary"
+    destination.with_suffix(".download").write_bytes(BODY[:1000])
+    monkeypatch.setattr("ci.assets.httpx.stream", _RangeServer(BODY, ranges=False))
+
+    assert isinstance(install("https://e/bin", _digest(BODY), destination), Installed)
+    assert destination.read_bytes() == BODY
+
+
+def test_a_partial_that_is_already_whole_is_verified_without_a_body(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    destination = tmp_path / "binary"
+    destination.with_suffix(".download").write_bytes(BODY)
+    monkeypatch.setattr("ci.assets.httpx.stream", _RangeServer(BODY))
+
+    assert isinstance(install("https://e/bin", _digest(BODY), destination), Installed)
+    assert destination.read_bytes() == BODY
+
+
+def test_a_stale_partial_is_discarded_and_the_asset_fetched_whole(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    """Resumed bytes are never trusted: another version's prefix fails the digest."""
+    destination = tmp_path / "binary"
+    destination.with_suffix(".download").write_bytes(b"x" * 1000)
+    server = _RangeServer(BODY)
+    monkeypatch.setattr("ci.assets.httpx.stream", server)
+
+    assert isinstance(install("https://e/bin", _digest(BODY), destination), Installed)
+    assert server.requested == ["bytes=1000-", None]
+    assert destination.read_bytes() == BODY
+
+
+def test_a_download_that_keeps_failing_leaves_its_partial_to_resume(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    monkeypatch.setattr("ci.assets.httpx.stream", lambda *_, **__: _Dropping(BODY[:100]))
+    destination = tmp_path / "binary"
+
+    outcome = install("https://e/bin", _digest(BODY), destination, sleep=_no_sleep)
+
+    assert isinstance(outcome, InstallFailed)
+    assert not destination.exists()
+    assert destination.with_suffix(".download").exists()
+
+
+class _Refusing(_FakeStream):
+    """Answers every request with `status_code`, as `raise_for_status` reports it."""
+
+    def raise_for_status(self) -> None:
+        request = httpx.Request("GET", "https://e/bin")
+        response = httpx.Response(self.status_code, request=request)
+        raise httpx.HTTPStatusError("refused", request=request, response=response)
+
+
+@pytest.mark.parametrize(("status", "attempts"), [(404, 1), (403, 1), (429, 3), (503, 3)])
+def test_only_a_refusal_another_attempt_could_change_is_retried(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path, status: int, attempts: int
+) -> None:
+    requested: list[str] = []
+
+    def refusing(_method: str, url: str, **_kwargs: object) -> _FakeStream:
+        requested.append(url)
+        return _Refusing(b"", status_code=status)
+
+    monkeypatch.setattr("ci.assets.httpx.stream", refusing)
+    slept: list[float] = []
+
+    outcome = install("https://e/bin", _digest(BODY), tmp_path / "binary", sleep=slept.append)
+
+    assert isinstance(outcome, InstallFailed)
+    assert len(requested) == attempts
+    # A pause between attempts, none after the last.
+    assert len(slept) == attempts - 1
+    assert all(0 <= delay <= assets._RETRY_DELAY_CAP_SECONDS for delay in slept)
+
+
 # --- the digest helper ------------------------------------------------------
 
 
@@ -0,0 +1,96 @@
+"""Warming a worker's Docker Hub bases through a local mirror, against a fake one."""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import httpx
+import pytest
+
+from ci.bases import HubImage, buildkitd_config, on_hub, prefetch, wanted
+from ci.docker import builder_config_args
+from ci.domain import Platform, Task
+
+
+@pytest.mark.parametrize(
+    ("reference", "expected"),
+    [
+        ("alpine:3.21", HubImage("library/alpine", "3.21")),
+        ("alpine", HubImage("library/alpine", "latest")),
+        ("tailscale/tailscale:stable", HubImage("tailscale/tailscale", "stable")),
+        ("docker.io/library/redis:alpine", HubImage("library/redis", "alpine")),
+        ("python@sha256:abc", HubImage("library/python", "sha256:abc")),
+        ("lscr.io/linuxserver/nextcloud:latest", None),
+        ("localhost:5000/thing:1", None),
+        ("ghcr.io/example/dockerfiles:base", None),
+    ],
+)
+def test_only_docker_hub_references_are_mirrored(
+    reference: str, expected: HubImage | None
+) -> None:
+    assert on_hub(reference) == expected
+
+
+def test_a_share_is_warmed_once_per_distinct_base(tmp_path: Path) -> None:
+    for name, text in {
+        "a": "FROM alpine:3.21 AS base\nFROM scratch\nCOPY --from=base / /\n",
+        "b": "FROM alpine:3.21\n",
+    }.items():
+        (tmp_path / name).write_text(text)
+    tasks = [
+        Task(
+            image=name,
+            dockerfile=str(tmp_path / name),
+            context=str(tmp_path),
+            platform=Platform.AMD64,
+            max_retries=1,
+        )
+        for name in ("a", "b", "missing")
+    ]
+    assert wanted(tasks) == ("alpine:3.21",)
+
+
+def registry(fetched: list[str]) -> httpx.MockTransport:
+    """A mirror serving `library/alpine` for two platforms, and nothing else."""
+    index = {
+        "manifests": [
+            {"digest": "sha256:arm", "platform": {"os": "linux", "architecture": "arm64"}},
+            {"digest": "sha256:amd", "platform": {"os": "linux", "architecture": "amd64"}},
+        ]
+    }
+    manifest = {"config": {"digest": "sha256:config"}, "layers": [{"digest": "sha256:layer"}]}
+    bodies = {
+        "/v2/library/alpine/manifests/3.21": json.dumps(index).encode(),
+        "/v2/library/alpine/manifests/sha256:amd": json.dumps(manifest).encode(),
+        "/v2/library/alpine/blobs/sha256:config": b"{}",
+        "/v2/library/alpine/blobs/sha256:layer": b"x" * 1000,
+    }
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        fetched.append(request.url.path)
+        body = bodies.get(request.url.path)
+        return httpx.Response(404) if body is None else httpx.Response(200, content=body)
+
+    return httpx.MockTransport(handler)
+
+
+def test_a_base_is_pulled_for_this_platform_and_failures_are_counted() -> None:
+    fetched: list[str] = []
+    with httpx.Client(base_url="http://mirror", transport=registry(fetched)) as client:
+        warmed = prefetch(
+            client,
+            ("alpine:3.21", "debian:12", "lscr.io/linuxserver/nextcloud:latest"),
+            Platform.AMD64,
+        )
+
+    assert warmed.images == ("alpine:3.21",)
+    assert warmed.failed == ("debian:12",)
+    assert warmed.bytes_read == 1002
+    assert "/v2/library/alpine/manifests/sha256:arm" not in fetched
+
+
+def test_builders_use_the_mirror_only_when_there_is_one() -> None:
+    assert builder_config_args(None) == ()
+    assert builder_config_args("/tmp/buildkitd.toml") == ("--config", "/tmp/buildkitd.toml")
+    assert 'mirrors = ["172.17.0.1:5000"]' in buildkitd_config("172.17.0.1:5000")
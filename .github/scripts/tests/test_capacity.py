@@ -0,0 +1,118 @@
+"""The capacity history and the configuration it recommends, on built records."""
+
+from __future__ import annotations
+
+import datetime
+from pathlib import Path
+
+from ci import capacity
+from ci.capacity import RunRecord, WorkerUtilisation, appended, predict, recommend, records_of
+from ci.timeline import Span, WorkerTimeline
+
+DAY = datetime.date(2026, 10, 1)
+
+
+def span(image: str, start: float, duration: float, succeeded: bool = True) -> Span:
+    return Span(
+        image=image,
+        platform="amd64",
+        start=start,
+        duration=duration,
+        stolen=False,
+        succeeded=succeeded,
+        attempts=1,
+    )
+
+
+def record(
+    run: str,
+    slots: int,
+    duration: float,
+    makespan: float,
+    parallelism: float = 1.0,
+    platform: str = "amd64",
+) -> RunRecord:
+    """Two workers building eight images of `duration`, one chain of one image."""
+    return RunRecord(
+        run=run,
+        day=DAY,
+        platform=platform,
+        workers=2,
+        slots=slots,
+        cpus=4,
+        memory_bytes=16 << 30,
+        makespan=makespan,
+        critical_seconds=duration,
+        utilisation=(WorkerUtilisation(slots, parallelism, slots),) * 2,
+        durations={f"image-{index}": duration for index in range(8)},
+    )
+
+
+def test_a_run_is_recorded_per_platform_with_each_workers_utilisation() -> None:
+    worker = WorkerTimeline(
+        worker="amd64/0",
+        platform="amd64",
+        slots=2,
+        began=0.0,
+        finished=200.0,
+        spans=(span("a", 0.0, 100.0), span("b", 0.0, 100.0), span("c", 100.0, 50.0, False)),
+        cpus=4,
+        memory_bytes=16 << 30,
+    )
+
+    (recorded,) = records_of("123", DAY, (worker,))
+
+    assert recorded.durations == {"a": 100.0, "b": 100.0}
+    assert recorded.utilisation == (WorkerUtilisation(slots=2, parallelism=5 / 3, peak=2),)
+    assert (recorded.workers, recorded.slots, recorded.cpus) == (1, 2, 4)
+    assert recorded.makespan == 150.0
+
+
+def test_a_rerun_replaces_its_record_and_old_runs_age_out() -> None:
+    history = tuple(record(str(run), 2, 600.0, 1440.0) for run in range(3))
+    rerun = record("2", 4, 900.0, 1080.0)
+
+    updated = appended(history, (rerun,), keep=2)
+
+    assert [entry.run for entry in updated] == ["1", "2"]
+    assert updated[-1] == rerun
+
+
+def test_the_history_round_trips(tmp_path: Path) -> None:
+    history = (record("1", 2, 600.0, 1440.0), record("1", 2, 600.0, 1440.0, platform="arm64"))
+    path = tmp_path / "history.json"
+    capacity.save(path, history)
+    assert capacity.load(path) == history
+
+
+# --- prediction -------------------------------------------------------------
+
+# At two slots every image took 600s; at four, 900s. Both runs finished at 1.2x
+# their floor, so the bounds collapse onto the prediction.
+HISTORY = (record("1", 2, 600.0, 1440.0), record("2", 4, 900.0, 1080.0, parallelism=3.8))
+
+
+def test_a_prediction_is_the_stretched_floor_times_the_measured_inefficiency() -> None:
+    # Each image's median is 750s, so two slots stretch by 0.8 and four by 1.2.
+    prediction = predict(HISTORY, workers=2, slots=2)
+    assert prediction.makespan == prediction.low == prediction.high
+    assert round(prediction.makespan) == round(8 * 750 * 0.8 / 4 * 1.2)
+
+
+def test_the_cheapest_configuration_meeting_the_target_is_recommended() -> None:
+    (recommendation,) = recommend(HISTORY, target_seconds=30 * 60)
+
+    assert recommendation.meets_target
+    assert (recommendation.chosen.workers, recommendation.chosen.slots) == (2, 4)
+    # Four slots ran saturated, so a fifth is worth a run.
+    assert recommendation.explore_slots
+    assert (recommendation.current.workers, recommendation.current.slots) == (2, 4)
+
+
+def test_an_unreachable_target_recommends_the_fastest_with_the_fewest_workers() -> None:
+    (recommendation,) = recommend(HISTORY, target_seconds=10 * 60)
+
+    assert not recommendation.meets_target
+    assert (recommendation.chosen.workers, recommendation.chosen.slots) == (4, 2)
+    notes = capacity.report((recommendation,), 10 * 60)
+    assert any("no measured configuration meets the target" in line for line in notes)
@@ -98,6 +98,20 @@ def test_an_oversized_key_is_reduced_rather_than_rejected() -> None:
     assert D.of("m", key=b"x" * 5000) != D.of("m", key=b"y" * 5000)
 
 
+@pytest.mark.parametrize("key", [b"", b"secret", b"x" * 5000])
+def test_a_prepared_derivation_agrees_with_the_one_shot_form(key: bytes) -> None:
+    """The fast path is only a fast path if no peer can tell it from the slow one."""
+    prepared = D.prepared(key)
+    assert prepared.of("m", "n") == D.of("m", "n", key=key)
+    assert prepared.over(b"body") == D.over(b"body", key=key)
+
+
+def test_a_prepared_state_is_not_consumed_by_use() -> None:
+    prepared = D.prepared(b"secret")
+    assert prepared.of("first") == prepared.of("first")
+    assert prepared.of("second") == D.of("second", key=b"secret")
+
+
 # --- projections ------------------------------------------------------------
 
 
@@ -9,7 +9,14 @@ from pathlib import Path
 
 import pytest
 
-from ci.discovery import ConflictingDockerfiles, deal, definitions, discover, seed_for
+from ci.discovery import (
+    IGNORE_FILE,
+    ConflictingDockerfiles,
+    deal,
+    definitions,
+    discover,
+    seed_for,
+)
 from ci.docker import manifest_tags, tags_for
 from ci.domain import BatchId, Platform, Task
 from ci.env import BuildIdentity
@@ -201,9 +208,10 @@ def test_two_spellings_of_one_image_are_refused_rather_than_resolved(tmp_path: P
 def test_discovery_is_ordered_and_reproducible_across_both_layouts(tmp_path: Path) -> None:
     """`deal` is only reproducible from its seed if what it shuffles is ordered.
 
-    Two globs mean two streams, so the union is sorted rather than each stream
-    -- otherwise every `*.Dockerfile` would sort after every plain one and the
-    order would depend on which pattern found what.
+    The walk yields files in whatever order the filesystem lists them, and two
+    layouts match within it, so the union is sorted rather than trusted --
+    otherwise the order would depend on the directory's on-disk layout and on
+    which pattern found what.
     """
     (tmp_path / "alpha").mkdir()
     (tmp_path / "alpha" / "Dockerfile").write_text("FROM scratch\n")
@@ -223,6 +231,44 @@ def test_discovery_is_ordered_and_reproducible_across_both_layouts(tmp_path: Pat
     assert found == discover(tmp_path, (Platform.AMD64,), max_retries=1).tasks
 
 
+def dockerfile_at(root: Path, relative: str) -> None:
+    path = root / relative
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("FROM scratch\n")
+
+
+def test_version_control_and_dependency_trees_are_never_entered(tmp_path: Path) -> None:
+    dockerfile_at(tmp_path, "app/Dockerfile")
+    dockerfile_at(tmp_path, ".git/modules/x/Dockerfile")
+    dockerfile_at(tmp_path, "app/web/node_modules/pkg/Dockerfile")
+
+    assert set(definitions(tmp_path)) == {"app"}
+
+
+def test_the_ignore_file_prunes_a_vendored_tree_but_not_its_image(tmp_path: Path) -> None:
+    """A vendored source tree's own Dockerfiles are not images of this repository.
+
+    Unpruned, `guacamole-client/src/docker/Dockerfile` would be claimed as an
+    image called `docker`. The image the directory itself defines is kept.
+    """
+    dockerfile_at(tmp_path, "guacamole-client/Dockerfile")
+    dockerfile_at(tmp_path, "guacamole-client/src/docker/Dockerfile")
+    dockerfile_at(tmp_path, "other/vendor/Dockerfile")
+    dockerfile_at(tmp_path, "other/deep/vendor/Dockerfile")
+    (tmp_path / IGNORE_FILE).write_text(
+        "# vendored upstream sources\nguacamole-client/src/\nvendor\n"
+    )
+
+    assert set(definitions(tmp_path)) == {"guacamole-client"}
+
+
+def test_a_symlinked_directory_is_not_followed(tmp_path: Path) -> None:
+    dockerfile_at(tmp_path, "real/Dockerfile")
+    (tmp_path / "alias").symlink_to(tmp_path / "real", target_is_directory=True)
+
+    assert set(definitions(tmp_path)) == {"real"}
+
+
 # --- the batch id -----------------------------------------------------------
 
 _BATCH_INPUTS = {
@@ -0,0 +1,141 @@
+"""The disk governor's policy, and its interpreter driven by a fake disk."""
+
+from __future__ import annotations
+
+import threading
+
+import pytest
+
+from ci.disk import (
+    GIB,
+    STALE_CACHE_MINUTES,
+    Admit,
+    DiskGovernor,
+    Hold,
+    Reclaim,
+    Watermarks,
+    decide_admission,
+    idle_builders,
+    pressured,
+    prune_commands,
+)
+
+MARKS = Watermarks.gibibytes(low=10, high=20)
+
+
+def test_watermarks_reject_an_inverted_pair() -> None:
+    with pytest.raises(ValueError, match="low <= high"):
+        Watermarks.gibibytes(low=20, high=10)
+
+
+# --- pressure: hysteresis between the marks --------------------------------
+
+
+def test_pressure_is_entered_below_the_low_mark() -> None:
+    assert pressured(9 * GIB, MARKS, was_pressured=False)
+
+
+def test_pressure_is_left_only_at_the_high_mark() -> None:
+    # Between the marks the answer is whatever it was: a prune that clawed back
+    # a little must not reopen admission straight away.
+    assert pressured(15 * GIB, MARKS, was_pressured=True)
+    assert not pressured(15 * GIB, MARKS, was_pressured=False)
+    assert not pressured(20 * GIB, MARKS, was_pressured=True)
+
+
+# --- decide_admission: total over its inputs -------------------------------
+
+
+def test_no_pressure_admits_whatever_is_building() -> None:
+    assert decide_admission(under_pressure=False, building=8, pruned=False) == Admit()
+
+
+def test_pressure_reclaims_before_it_holds() -> None:
+    assert decide_admission(under_pressure=True, building=3, pruned=False) == Reclaim()
+    assert decide_admission(under_pressure=True, building=3, pruned=True) == Hold()
+
+
+def test_never_holds_with_nothing_building() -> None:
+    # Nothing in flight can give space back, so holding would wait forever.
+    assert decide_admission(under_pressure=True, building=0, pruned=True) == Admit()
+
+
+def test_only_this_workers_idle_builders_are_pruned() -> None:
+    listed = ("default", "builder_b_amd64", "builder_a_amd64", "builder_c_amd64")
+    busy = frozenset({"builder_c_amd64"})
+    assert idle_builders(listed, busy) == ("builder_a_amd64", "builder_b_amd64")
+
+
+def test_a_busy_builder_is_pruned_only_of_stale_records() -> None:
+    listed = ("default", "builder_a_amd64", "builder_c_amd64")
+    commands = prune_commands(listed, frozenset({"builder_c_amd64"}))
+
+    whole = [command for command in commands if "--all" in command]
+    assert [command[4] for command in whole] == ["builder_a_amd64"]
+    (busy,) = [command for command in commands if "builder_c_amd64" in command]
+    assert "--all" not in busy
+    assert busy[-2:] == ("--filter", f"until={STALE_CACHE_MINUTES}m")
+    assert not any("default" in command for command in commands)
+
+
+# --- the governor ----------------------------------------------------------
+
+
+class FakeDisk:
+    """Free space that a prune and a finished build can each give back."""
+
+    def __init__(self, free: int, reclaimed_by_prune: int = 0) -> None:
+        self.free = free
+        self.reclaimed_by_prune = reclaimed_by_prune
+        self.pruned_with: list[frozenset[str]] = []
+
+    def measure(self, _path: str) -> int:
+        return self.free
+
+    def prune(self, busy: frozenset[str]) -> None:
+        self.pruned_with.append(busy)
+        self.free += self.reclaimed_by_prune
+
+
+def test_plenty_of_space_admits_without_pruning() -> None:
+    disk = FakeDisk(free=50 * GIB)
+    DiskGovernor(MARKS, measure=disk.measure, prune=disk.prune).admit()
+    assert disk.pruned_with == []
+
+
+def test_a_prune_that_restores_the_high_mark_admits_at_once() -> None:
+    disk = FakeDisk(free=5 * GIB, reclaimed_by_prune=30 * GIB)
+    governor = DiskGovernor(MARKS, measure=disk.measure, prune=disk.prune)
+    with governor.building("builder_running_amd64"):
+        governor.admit()
+    # The running build's builder was passed as busy, so it was never touched.
+    assert disk.pruned_with == [frozenset({"builder_running_amd64"})]
+
+
+def test_holds_until_a_finished_build_restores_the_high_mark() -> None:
+    disk = FakeDisk(free=5 * GIB)
+    governor = DiskGovernor(MARKS, measure=disk.measure, prune=disk.prune, poll_seconds=5.0)
+    admitted = threading.Event()
+    running = governor.building("builder_running_amd64")
+    running.__enter__()
+
+    def slot() -> None:
+        governor.admit()
+        admitted.set()
+
+    waiter = threading.Thread(target=slot)
+    waiter.start()
+    # Pruning found nothing and a build is still running, so the slot waits.
+    assert not admitted.wait(timeout=0.2)
+
+    disk.free = 25 * GIB
+    running.__exit__(None, None, None)
+    assert admitted.wait(timeout=2.0)
+    waiter.join()
+
+
+def test_admits_anyway_when_nothing_is_building() -> None:
+    disk = FakeDisk(free=1 * GIB)
+    governor = DiskGovernor(MARKS, measure=disk.measure, prune=disk.prune)
+    governor.admit()
+    assert len(disk.pruned_with) == 1
@@ -72,27 +72,27 @@ def test_rules_end_in_direct() -> None:
     stack -- and Docker Hub pulls lose the source-IP waiver that keeps them out
     of the anonymous 100-per-6-hours bucket.
     """
-    rules = render_config(NODE).split("rules:", 1)[1].strip().splitlines()
+    rules = render_config((NODE,)).split("rules:", 1)[1].strip().splitlines()
     assert rules[-1].strip() == "- MATCH,DIRECT"
     assert all(rule.strip().endswith(",warp") for rule in rules[:-1])
 
 
 def test_launchpad_is_routed_through_warp() -> None:
     """The host whose blackhole started all of this."""
-    config = render_config(NODE)
+    config = render_config((NODE,))
     assert "  - DOMAIN-SUFFIX,launchpad.net,warp" in config
     assert "  - DOMAIN-SUFFIX,launchpadcontent.net,warp" in config
 
 
 def test_registries_are_not_in_the_allowlist() -> None:
     """Docker Hub and GHCR must keep the address their entitlements key on."""
-    config = render_config(NODE)
+    config = render_config((NODE,))
     for host in ("docker.io", "docker.com", "ghcr.io", "github.com"):
         assert f"{host},warp" not in config
 
 
 def test_configured_domains_are_the_only_proxied_ones() -> None:
-    config = render_config(NODE, proxied_domains=("example.test",))
+    config = render_config((NODE,), proxied_domains=("example.test",))
     assert "  - DOMAIN-SUFFIX,example.test,warp" in config
     assert "launchpad.net" not in config
 
@@ -106,12 +106,12 @@ def test_default_port_avoids_the_conventional_ones() -> None:
     """
     assert DEFAULT_PROXY_PORT not in {1080, 3128, 7890, 7891, 8080, 8118, 8888, 9090}
     assert DEFAULT_PROXY_PORT > 1024
-    assert f"mixed-port: {DEFAULT_PROXY_PORT}" in render_config(NODE)
+    assert f"mixed-port: {DEFAULT_PROXY_PORT}" in render_config((NODE,))
 
 
 def test_sni_does_not_name_the_warp_service() -> None:
     """The handshake should not self-identify as WARP to anything on the path."""
-    config = render_config(NODE)
+    config = render_config((NODE,))
     assert "sni: api.cloudflare.com" in config
     assert "masque.cloudflareclient.com" not in config
     # The destination is chosen by address, not by the name presented.
@@ -119,7 +119,7 @@ def test_sni_does_not_name_the_warp_service() -> None:
 
 
 def test_node_addresses_reach_the_config_as_cidr() -> None:
-    config = render_config(NODE, port=1234)
+    config = render_config((NODE,), port=1234)
     assert "mixed-port: 1234" in config
     assert "ip: 172.16.0.2/32" in config
     assert "ipv6: fd00::2/128" in config
@@ -128,11 +128,34 @@ def test_node_addresses_reach_the_config_as_cidr() -> None:
 
 def test_listener_is_reachable_off_loopback() -> None:
     """A loopback-only bind is invisible to a RUN step in its own namespace."""
-    config = render_config(NODE)
+    config = render_config((NODE,))
     assert "allow-lan: true" in config
     assert "bind-address: '*'" in config
 
 
+def test_several_nodes_sit_behind_one_health_checked_group() -> None:
+    other = MasqueNode(private_key="b3RoZXI=", address_v4="172.16.0.3", address_v6="fd00::3")
+    config = render_config((NODE, other))
+
+    assert '  - name: "warp-1"' in config and '  - name: "warp-2"' in config
+    assert "proxies: [ warp-1, warp-2 ]" in config
+    assert "type: load-balance" in config and "strategy: round-robin" in config
+    # Checked through the probe URL, so a node is judged the way the tunnel is.
+    assert f"url: {egress._WARP_PROBE_URL}" in config
+    # The rules still name the group, and only the group.
+    assert "  - DOMAIN-SUFFIX,launchpad.net,warp\n" in config
+
+
+def test_a_partial_fleet_is_a_smaller_fleet() -> None:
+    answers = iter((NODE, egress.RegistrationFailed("429")))
+    assert egress.register_fleet(2, enrol=lambda: next(answers)) == (NODE,)
+
+
+def test_a_fleet_fails_only_when_no_device_enrolled() -> None:
+    outcome = egress.register_fleet(3, enrol=lambda: egress.RegistrationFailed("503"))
+    assert outcome == egress.RegistrationFailed("503")
+
+
 # --- bridge detection ------------------------------------------------------
 
 
@@ -184,7 +207,7 @@ def test_unreachable_proxy_is_never_published(
     monkeypatch.setattr(egress, "bridge_address", lambda default="172.17.0.1": "172.17.0.1")
     monkeypatch.setattr("ci.egress.subprocess.Popen", lambda *a, **k: _StubProcess())
 
-    outcome = egress.start_proxy(tmp_path / "mihomo", NODE, tmp_path / "work")
+    outcome = egress.start_proxy(tmp_path / "mihomo", (NODE,), tmp_path / "work")
     assert isinstance(outcome, ProxyUnavailable)
     assert "no confirmed WARP egress" in outcome.reason
 
@@ -197,7 +220,7 @@ def test_reachable_proxy_is_published_with_both_addresses(
     monkeypatch.setattr(egress, "bridge_address", lambda default="172.17.0.1": "172.17.0.1")
     monkeypatch.setattr("ci.egress.subprocess.Popen", lambda *a, **k: _StubProcess())
 
-    outcome = egress.start_proxy(tmp_path / "mihomo", NODE, tmp_path / "work", port=29277)
+    outcome = egress.start_proxy(tmp_path / "mihomo", (NODE,), tmp_path / "work", port=29277)
     assert isinstance(outcome, ProxyReady)
     assert outcome.local_url == "http://127.0.0.1:29277"
     assert outcome.container_url == "http://172.17.0.1:29277"
@@ -213,7 +236,7 @@ def test_probe_host_is_in_the_allowlist_or_it_asserts_nothing() -> None:
     assert egress._WARP_PROBE_HOST == "cloudflare.com"
     assert egress._WARP_PROBE_URL == "https://cloudflare.com/cdn-cgi/trace"
     assert egress._WARP_PROBE_HOST in egress._PROXIED_DOMAINS
-    assert f"  - DOMAIN-SUFFIX,{egress._WARP_PROBE_HOST},warp" in render_config(NODE)
+    assert f"  - DOMAIN-SUFFIX,{egress._WARP_PROBE_HOST},warp" in render_config((NODE,))
 
 
 # --- the never-fails guarantee ---------------------------------------------
@@ -234,5 +257,18 @@ def test_setup_exits_zero_even_when_provisioning_explodes(monkeypatch: pytest.Mo
 
 
 def test_setup_exits_zero_on_the_happy_path(monkeypatch: pytest.MonkeyPatch) -> None:
-    monkeypatch.setattr(setup_egress, "provision", lambda: None)
+    monkeypatch.setattr(setup_egress, "provision", dict)
+    assert setup_egress.main() == 0
+
+
+def test_setup_exports_what_provisioning_returns(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    """The step hands later steps exactly what the build worker applies in-process."""
+    github_env = tmp_path / "github_env"
+    monkeypatch.setenv("GITHUB_ENV", str(github_env))
+    monkeypatch.setattr(
+        setup_egress, "provision", lambda: {"BUILD_PROXY_URL": "http://172.17.0.1:29277"}
+    )
     assert setup_egress.main() == 0
+    assert github_env.read_text() == "BUILD_PROXY_URL=http://172.17.0.1:29277\n"
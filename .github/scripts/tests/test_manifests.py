@@ -0,0 +1,82 @@
+"""Early fusion publishes the batch manifest and never a floating tag."""
+
+from __future__ import annotations
+
+from ci.docker import manifest_tags, run_tag
+from ci.domain import BuildFailed, BuildOutcome, BuildSucceeded, Platform, Task
+from ci.manifests import IncrementalFusion, batch_tag, final_fusion, fusion_command
+from tests.test_provenance import BATCH
+from tests.test_report import identity
+
+IDENTITY = identity(BATCH)
+PLATFORMS = (Platform.AMD64, Platform.ARM64)
+
+
+def task(platform: Platform) -> Task:
+    return Task(
+        image="redis",
+        dockerfile="redis/Dockerfile",
+        context="redis",
+        platform=platform,
+        max_retries=1,
+    )
+
+
+def succeeded(task: Task) -> BuildOutcome:
+    return BuildSucceeded(task=task, attempts=1, duration_seconds=1.0)
+
+
+def failed(task: Task) -> BuildOutcome:
+    return BuildFailed(task=task, attempts=1, duration_seconds=1.0, error="x", metrics={})
+
+
+def fusion(landed: set[str]) -> tuple[IncrementalFusion, list[tuple[str, ...]]]:
+    commands: list[tuple[str, ...]] = []
+
+    def run(command: tuple[str, ...]) -> int:
+        commands.append(command)
+        return 0
+
+    return IncrementalFusion(IDENTITY, PLATFORMS, landed.__contains__, run), commands
+
+
+def sources() -> tuple[str, ...]:
+    return tuple(run_tag("redis", str(platform), IDENTITY) for platform in PLATFORMS)
+
+
+def test_the_last_platform_to_land_fuses_only_the_batch_tag() -> None:
+    early, commands = fusion(landed={run_tag("redis", "amd64", IDENTITY)})
+    early.around(succeeded)(task(Platform.ARM64))
+
+    assert commands == [fusion_command((batch_tag("redis", IDENTITY),), sources())]
+
+
+def test_nothing_is_fused_while_a_platform_is_missing() -> None:
+    early, commands = fusion(landed=set())
+    early.around(succeeded)(task(Platform.ARM64))
+    assert commands == []
+
+
+def test_a_failed_build_fuses_nothing() -> None:
+    early, commands = fusion(landed={run_tag("redis", "amd64", IDENTITY)})
+    early.around(failed)(task(Platform.ARM64))
+    assert commands == []
+
+
+def test_an_image_is_fused_early_once_per_process() -> None:
+    early, commands = fusion(landed=set(sources()))
+    build = early.around(succeeded)
+    build(task(Platform.ARM64))
+    build(task(Platform.ARM64))
+    assert len(commands) == 1
+
+
+def test_the_manifest_stage_fills_only_the_gap_an_early_fusion_left() -> None:
+    command = final_fusion("redis", PLATFORMS, IDENTITY, fused_early=True)
+    floating = manifest_tags("redis", IDENTITY)[:-1]
+    assert command == fusion_command(floating, (batch_tag("redis", IDENTITY),))
+
+
+def test_without_an_early_fusion_the_manifest_stage_fuses_everything() -> None:
+    command = final_fusion("redis", PLATFORMS, IDENTITY, fused_early=False)
+    assert command == fusion_command(manifest_tags("redis", IDENTITY), sources())
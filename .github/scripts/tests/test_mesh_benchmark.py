@@ -0,0 +1,36 @@
+"""The mesh harness, run small: the real mesh, end to end, on loopback.
+
+The benchmark's timings are not asserted on. What is asserted is what no
+timing can excuse -- every image built exactly once, and a run that ends on
+evidence rather than on the grace period whenever every peer turned up.
+"""
+
+from __future__ import annotations
+
+from benchmarks.mesh import Deal, Topology, run
+
+# Fast enough that a run of a dozen minute-long builds takes well under a
+# second of wall time, slow enough that loopback round trips stay small
+# against the scheduler's poll.
+SPEEDUP = 2000.0
+
+DURATIONS = {f"image-{index:02d}": 60.0 for index in range(12)}
+
+
+def test_a_skewed_deal_is_spread_by_stealing_without_building_anything_twice() -> None:
+    result = run(DURATIONS, Topology(workers=3, slots=1, deal=Deal.SKEWED, speedup=SPEEDUP))
+
+    assert result.built == dict.fromkeys(DURATIONS, 1)
+    assert result.stolen > 0
+    assert result.requests["POST refs (publish)"] == 3
+
+
+def test_a_full_mesh_stops_before_the_grace_period_and_a_missing_peer_does_not() -> None:
+    full = run(DURATIONS, Topology(workers=2, slots=1, grace_seconds=600.0, speedup=SPEEDUP))
+    short = run(
+        DURATIONS,
+        Topology(workers=2, slots=1, absent=1, grace_seconds=600.0, speedup=SPEEDUP),
+    )
+
+    assert max(full.lingered) < 600.0
+    assert max(short.lingered) >= 600.0
@@ -0,0 +1,43 @@
+"""Documents carried between runs: parsed on the way in, atomic on the way out."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+from pydantic import TypeAdapter
+
+from ci.persisted import configured_path, load, save
+
+COUNTS: TypeAdapter[dict[str, int]] = TypeAdapter(dict[str, int])
+
+
+def test_a_saved_document_loads_back(tmp_path: Path) -> None:
+    path = tmp_path / "nested" / "counts.json"
+    save(path, COUNTS, {"a": 1})
+    assert load(path, COUNTS, {}) == {"a": 1}
+    # Nothing staged is left beside it.
+    assert [entry.name for entry in path.parent.iterdir()] == ["counts.json"]
+
+
+def test_absence_is_a_cold_start(tmp_path: Path) -> None:
+    assert load(tmp_path / "missing.json", COUNTS, {"default": 0}) == {"default": 0}
+
+
+def test_a_document_in_another_shape_is_not_believed(tmp_path: Path) -> None:
+    """Written by an earlier version, perhaps, and read as untrusted input."""
+    path = tmp_path / "counts.json"
+    for raw in ("not json", '["a", 1]', '{"a": "one"}', ""):
+        path.write_text(raw)
+        assert load(path, COUNTS, {}) == {}
+
+
+def test_an_unwritable_destination_is_not_fatal(tmp_path: Path) -> None:
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    save(blocker / "counts.json", COUNTS, {"a": 1})
+
+
+def test_an_empty_setting_means_nothing_is_kept() -> None:
+    assert configured_path("") is None
+    assert configured_path("  ") is None
+    assert configured_path("/tmp/x.json") == Path("/tmp/x.json")
@@ -9,7 +9,10 @@ SOURCE_DATE_EPOCH monthly precisely so that unchanged images keep theirs.
 from __future__ import annotations
 
 import json
+import threading
+import time
 from collections.abc import Callable
+from pathlib import Path
 from typing import Any
 
 import pytest
@@ -30,11 +33,17 @@ from ci.provenance import (
     BATCH_LABEL,
     CONSUMES_LABEL,
     IMAGE_LABEL,
+    ProvenanceIndex,
+    ResolutionCache,
     _batch_in,
     _built_on,
     _configuration_for,
+    _platform_manifest,
+    _repository_of,
+    generations,
     label_arguments,
     rendered,
+    resolve,
     resolve_all,
     selector_arguments,
 )
@@ -452,3 +461,287 @@ def test_an_unparseable_consumes_label_yields_no_claims() -> None:
     """Written by an earlier run of unknown vintage, so nothing is guessed at."""
     for raw in ("not json", "{}", json.dumps([{"image": 1}]), json.dumps(["x"])):
         assert _built_on({"config": {"Labels": {CONSUMES_LABEL: raw}}}) == {}
+
+
+# --- the shared resolution cache --------------------------------------------
+
+
+class Registry:
+    """A counting stand-in for `resolve`, optionally held until released."""
+
+    def __init__(self, answer: Provenance, gate: threading.Event | None = None) -> None:
+        self.answer = answer
+        self.gate = gate
+        self.asked: list[str] = []
+        self.lock = threading.Lock()
+
+    def __call__(self, reference: str, _platform: Platform) -> Provenance:
+        with self.lock:
+            self.asked.append(reference)
+        if self.gate is not None:
+            self.gate.wait(timeout=5.0)
+        return self.answer
+
+
+def test_a_pinned_reference_is_inspected_once_per_run() -> None:
+    registry = Registry(Minted(BATCH, "sha256:a"))
+    now = [0.0]
+    cache = ResolutionCache(ttl_seconds=1.0, resolver=registry, clock=lambda: now[0])
+    pinned = f"reg:code-server-base.{BATCH}"
+
+    for _ in range(3):
+        assert cache(pinned, Platform.AMD64) == Minted(BATCH, "sha256:a")
+        now[0] += 3600.0
+
+    assert registry.asked == [pinned]
+
+
+def test_a_floating_reference_is_asked_again_once_its_ttl_lapses() -> None:
+    registry = Registry(Minted(BATCH, "sha256:a"))
+    now = [0.0]
+    cache = ResolutionCache(ttl_seconds=60.0, resolver=registry, clock=lambda: now[0])
+
+    cache("reg:code-server-base", Platform.AMD64)
+    now[0] = 30.0
+    cache("reg:code-server-base", Platform.AMD64)
+    now[0] = 61.0
+    cache("reg:code-server-base", Platform.AMD64)
+
+    assert len(registry.asked) == 2
+
+
+def test_an_unreadable_answer_is_never_remembered() -> None:
+    """A timeout is a fact about one instant, not about the reference."""
+    registry = Registry(Unreadable("inspect exited 1"))
+    cache = ResolutionCache(resolver=registry)
+    pinned = f"reg:code-server-base.{BATCH}"
+
+    cache(pinned, Platform.AMD64)
+    cache(pinned, Platform.AMD64)
+
+    assert len(registry.asked) == 2
+
+
+def test_platforms_are_cached_apart() -> None:
+    registry = Registry(Unlabelled("sha256:a"))
+    cache = ResolutionCache(resolver=registry)
+    cache("reg:x", Platform.AMD64)
+    cache("reg:x", Platform.ARM64)
+    assert len(registry.asked) == 2
+
+
+def test_concurrent_siblings_share_one_inspection() -> None:
+    """Siblings start together, so a plain memo would miss four times at once."""
+    gate = threading.Event()
+    registry = Registry(Minted(BATCH, "sha256:a"), gate=gate)
+    cache = ResolutionCache(resolver=registry)
+    results: list[Provenance] = []
+
+    def sibling() -> None:
+        results.append(cache(f"reg:code-server-base.{BATCH}", Platform.AMD64))
+
+    threads = [threading.Thread(target=sibling) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    gate.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(registry.asked) == 1
+    assert results == [Minted(BATCH, "sha256:a")] * 4
+
+
+def test_resolve_all_asks_through_the_lookup_it_is_given() -> None:
+    registry = Registry(Minted(BATCH, "sha256:a"))
+    (edge,) = resolve_all(
+        (Dependency(image="code-server-base", usage=Usage.BASE, argument="REF_BASE"),),
+        "reg",
+        Platform.AMD64,
+        lookup=registry,
+    )
+    assert registry.asked == ["reg:code-server-base"]
+    assert edge.provenance == Minted(BATCH, "sha256:a")
+
+
+def test_edges_resolve_together_but_keep_their_order() -> None:
+    """The startup delay is the slowest edge, and the labels never reorder.
+
+    Each edge is held until every one of them has been asked, which can only
+    complete if they are in flight at the same time; the first is then answered
+    last, and still comes back first.
+    """
+    dependencies = tuple(
+        Dependency(image=f"toolchain-{index}", usage=Usage.ARTIFACT, argument=f"REF_{index}")
+        for index in range(3)
+    )
+    everyone_asked = threading.Barrier(len(dependencies), timeout=5.0)
+
+    def answer(reference: str, _platform: Platform) -> Provenance:
+        everyone_asked.wait()
+        if reference.endswith("-0"):
+            time.sleep(0.05)
+        return Unlabelled(f"sha256:{reference[-1]}")
+
+    resolved = resolve_all(dependencies, "reg", Platform.AMD64, lookup=answer)
+
+    assert [edge.dependency.image for edge in resolved] == [d.image for d in dependencies]
+    assert [edge.provenance for edge in resolved] == [
+        Unlabelled(f"sha256:{index}") for index in range(3)
+    ]
+
+
+# --- one platform's configuration, and only that one ------------------------
+
+
+def descriptor(architecture: str, digest: str, os: str = "linux") -> dict[str, Any]:
+    return {"digest": digest, "platform": {"os": os, "architecture": architecture}}
+
+
+INDEX = {
+    "digest": "sha256:index",
+    "manifests": [
+        descriptor("amd64", "sha256:amd"),
+        descriptor("arm64", "sha256:arm"),
+        # The attestation manifest buildx publishes beside each image.
+        descriptor("unknown", "sha256:att", os="unknown"),
+    ],
+}
+
+
+def test_only_this_platforms_manifest_is_chosen() -> None:
+    assert _platform_manifest(INDEX, Platform.AMD64) == "sha256:amd"
+    assert _platform_manifest(INDEX, Platform.ARM64) == "sha256:arm"
+    assert _platform_manifest({"manifests": [descriptor("arm64", "x")]}, Platform.AMD64) is None
+
+
+@pytest.mark.parametrize(
+    ("reference", "repository"),
+    [
+        ("ghcr.io/o/r:code-server", "ghcr.io/o/r"),
+        ("localhost:5000/o/r:tag", "localhost:5000/o/r"),
+        ("localhost:5000/o/r", "localhost:5000/o/r"),
+        ("ghcr.io/o/r@sha256:abc", "ghcr.io/o/r"),
+    ],
+)
+def test_a_repository_is_read_apart_from_its_tag(reference: str, repository: str) -> None:
+    assert _repository_of(reference) == repository
+
+
+def test_resolve_fetches_one_configuration_by_digest(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Registry traffic per edge no longer grows with the platforms published.
+
+    The index is asked for alone, then exactly one configuration -- this
+    platform's, named by digest. The digest reported is still the index's,
+    since that is what a consumer pulling the tag receives.
+    """
+    asked: list[tuple[str, str]] = []
+
+    def inspect(reference: str, template: str) -> Any:
+        asked.append((reference, template))
+        return INDEX if ".Manifest" in template else configuration(str(BATCH))
+
+    monkeypatch.setattr("ci.provenance._inspect", inspect)
+
+    assert resolve("reg/r:code-server-base", Platform.ARM64) == Minted(BATCH, "sha256:index")
+    assert asked == [
+        ("reg/r:code-server-base", "{{json .Manifest}}"),
+        ("reg/r@sha256:arm", "{{json .Image}}"),
+    ]
+
+
+def test_an_index_without_this_platform_is_unreadable(monkeypatch: pytest.MonkeyPatch) -> None:
+    index = {"digest": "sha256:index", "manifests": [descriptor("arm64", "sha256:arm")]}
+    monkeypatch.setattr("ci.provenance._inspect", lambda _r, _t: index)
+    found = resolve("reg/r:x", Platform.AMD64)
+    assert found == Unreadable("no image configuration for linux/amd64")
+
+
+# --- the generation walk, carried between runs -------------------------------
+
+
+def chain(length: int) -> dict[str, Provenance]:
+    """A probe published by `length` successive runs, each on the one before."""
+    batches = [
+        BatchId.derive(run_id=str(run), run_attempt="1", commit_sha="a", date_time="t")
+        for run in range(length)
+    ]
+    answers: dict[str, Provenance] = {}
+    for position, batch in enumerate(batches):
+        built_on = {"code-server-base": batches[position - 1]} if position else {}
+        minted = Minted(batch, f"sha256:{position}", built_on)
+        answers[f"reg:code-server.{batch}"] = minted
+    answers["reg:code-server"] = answers[f"reg:code-server.{batches[-1]}"]
+    return answers
+
+
+def walk(lookup: ProvenanceIndex) -> tuple[BatchId, ...]:
+    return generations("code-server", "code-server-base", "reg", Platform.AMD64, 4, lookup)
+
+
+def test_a_warm_index_leaves_only_the_newest_hop_to_the_registry(tmp_path: Path) -> None:
+    path = tmp_path / "index.json"
+    answers = chain(6)
+    asked: list[str] = []
+
+    def registry(reference: str, _platform: Platform) -> Provenance:
+        asked.append(reference)
+        return answers.get(reference, Unreadable("inspect exited 1"))
+
+    cold = ProvenanceIndex.load(path, resolver=registry)
+    first = walk(cold)
+    cold.save(path)
+    assert len(asked) == 4
+
+    asked.clear()
+    warm = ProvenanceIndex.load(path, resolver=registry)
+    assert walk(warm) == first
+    assert asked == ["reg:code-server"]
+
+
+def test_the_index_follows_the_chain_as_it_grows(tmp_path: Path) -> None:
+    """A run later, the old newest hop is the one the walk asks for second."""
+    path = tmp_path / "index.json"
+    shorter, longer = chain(5), chain(6)
+    asked: list[str] = []
+
+    def registry(answers: dict[str, Provenance]) -> Callable[[str, Platform], Provenance]:
+        def answer(reference: str, _platform: Platform) -> Provenance:
+            asked.append(reference)
+            return answers.get(reference, Unreadable("inspect exited 1"))
+
+        return answer
+
+    before = ProvenanceIndex.load(path, resolver=registry(shorter))
+    walk(before)
+    before.save(path)
+
+    asked.clear()
+    assert len(walk(ProvenanceIndex.load(path, resolver=registry(longer)))) == 4
+    assert asked == ["reg:code-server"]
+
+
+def test_a_corrupt_index_is_a_cold_start(tmp_path: Path) -> None:
+    path = tmp_path / "index.json"
+    path.write_text('{"not": "a list"}')
+    answers = chain(3)
+    index = ProvenanceIndex.load(path, resolver=lambda r, _p: answers[r])
+    assert len(walk(index)) == 3
+    assert index.reused == 0
+
+
+def test_an_index_never_answers_for_a_floating_tag(tmp_path: Path) -> None:
+    """The floating probe is the hop that must be verified every time."""
+    path = tmp_path / "index.json"
+    answers = chain(2)
+    first = ProvenanceIndex.load(path, resolver=lambda r, _p: answers[r])
+    first("reg:code-server", Platform.AMD64)
+    first.save(path)
+
+    asked: list[str] = []
+
+    def registry(reference: str, _platform: Platform) -> Provenance:
+        asked.append(reference)
+        return answers[reference]
+
+    ProvenanceIndex.load(path, resolver=registry)("reg:code-server", Platform.AMD64)
+    assert asked == ["reg:code-server"]
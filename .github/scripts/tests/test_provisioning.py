@@ -0,0 +1,115 @@
+"""The provisioning stages: concurrency, stated dependencies, and fallbacks."""
+
+from __future__ import annotations
+
+import threading
+from collections.abc import Callable
+
+from ci.provisioning import Finished, Overran, Provisioning, Raised
+
+# Long enough that a stage which is genuinely waiting never finishes inside it
+# by accident, short enough that a failure does not stall the suite.
+TIMEOUT = 5.0
+
+
+def test_independent_stages_run_at_once() -> None:
+    # Each stage waits for the other to arrive, so this passes only if neither
+    # had to finish before the other started.
+    both = threading.Barrier(2, timeout=TIMEOUT)
+    provisioning = Provisioning()
+    disk = provisioning.start("disk", lambda: both.wait() >= 0, fallback=False)
+    egress = provisioning.start("egress", lambda: both.wait() >= 0, fallback=False)
+
+    assert disk.wait() and egress.wait()
+    assert isinstance(disk.settled, Finished) and isinstance(egress.settled, Finished)
+
+
+def test_a_stage_starts_only_after_the_stages_it_needs() -> None:
+    release = threading.Event()
+    order: list[str] = []
+
+    def cloudflared() -> str:
+        release.wait(TIMEOUT)
+        order.append("cloudflared")
+        return "/opt/cloudflared"
+
+    def tunnel() -> str:
+        order.append("tunnel")
+        return "abc.trycloudflare.com"
+
+    provisioning = Provisioning()
+    binary = provisioning.start("cloudflared", cloudflared, fallback="")
+    hostname = provisioning.start("tunnel", tunnel, fallback="", needs=(binary,))
+
+    assert order == []
+    release.set()
+    assert hostname.wait() == "abc.trycloudflare.com"
+    assert order == ["cloudflared", "tunnel"]
+
+
+def test_a_stage_that_raises_yields_its_fallback() -> None:
+    def register() -> str:
+        raise RuntimeError("cloudflare is having a day")
+
+    provisioning = Provisioning()
+    egress = provisioning.start("egress", register, fallback="")
+
+    assert egress.wait() == ""
+    assert isinstance(egress.settled, Raised)
+    assert egress.settled.error == "cloudflare is having a day"
+
+
+def test_a_stage_still_running_at_its_deadline_yields_its_fallback() -> None:
+    """The consumer moves on, and a result arriving afterwards is not used."""
+    release = threading.Event()
+    threads: list[threading.Thread] = []
+
+    def spawn(body: Callable[[], None], name: str) -> None:
+        threads.append(threading.Thread(target=body, name=name))
+        threads[-1].start()
+
+    def slow() -> dict[str, str]:
+        release.wait(TIMEOUT)
+        return {"BUILD_PROXY_URL": "http://172.17.0.1:29277"}
+
+    nothing: dict[str, str] = {}
+    provisioning = Provisioning(spawn=spawn)
+    egress = provisioning.start("egress", slow, fallback=nothing, deadline_seconds=0.05)
+
+    assert egress.wait() == {}
+    assert egress.settled == Overran(0.05)
+
+    # The late finish lands, and changes neither the answer nor the record.
+    release.set()
+    threads[0].join(TIMEOUT)
+    assert egress.wait() == {}
+    assert egress.settled == Overran(0.05)
+
+
+def test_the_summary_reports_each_stage_and_the_time_saved() -> None:
+    ticks = iter((0.0, 0.0, 30.0, 0.0, 20.0, 40.0))
+
+    def clock() -> float:
+        return next(ticks)
+
+    def inline(body: Callable[[], None], name: str) -> None:
+        body()
+
+    # Synchronous stages on a scripted clock: disk takes 30s, egress raises
+    # after 20s, and the whole of provisioning is read at 40s.
+    def broken() -> None:
+        raise RuntimeError("no mihomo build")
+
+    provisioning = Provisioning(clock=clock, spawn=inline)
+    provisioning.start("disk cleanup", lambda: None, fallback=None)
+    provisioning.start("clean egress", broken, fallback=None)
+
+    assert provisioning.summary() == [
+        "- provisioned in **40s** (stages sum to 50s)",
+        "",
+        "| Stage | Outcome | Took |",
+        "| --- | --- | --- |",
+        "| disk cleanup | ready | 30s |",
+        "| clean egress | fell back: no mihomo build | 20s |",
+        "",
+    ]
@@ -0,0 +1,86 @@
+"""The registry window: its arithmetic, what counts as a refusal, and the limiter."""
+
+from __future__ import annotations
+
+import itertools
+import subprocess
+
+import pytest
+
+from ci.ratelimit import AdaptiveLimiter, Window, throttled
+
+
+def test_a_window_of_successes_widens_the_window_by_one() -> None:
+    window = Window(size=4.0)
+    for _ in range(4):
+        window = window.grown()
+    assert window.admits == 4 and window.size > 4.9
+
+
+def test_a_refusal_halves_the_window_but_never_below_the_floor() -> None:
+    assert Window(size=8.0).halved().admits == 4
+    assert Window(size=1.5).halved().size == 1.0
+
+
+def test_growth_stops_at_the_ceiling() -> None:
+    assert Window(size=16.0).grown().size == 16.0
+
+
+def test_an_inconsistent_window_is_refused() -> None:
+    with pytest.raises(ValueError, match="floor <= size <= ceiling"):
+        Window(size=32.0)
+
+
+@pytest.mark.parametrize(
+    "stderr",
+    [
+        "ERROR: unexpected status: 429 Too Many Requests",
+        "toomanyrequests: retry-after: 12, allowed: 44000/minute",
+    ],
+)
+def test_refusals_are_recognised_in_either_spelling(stderr: str) -> None:
+    assert throttled(stderr)
+
+
+def test_other_failures_are_not_refusals() -> None:
+    assert not throttled("ERROR: ghcr.io/x/y:z: not found")
+    assert not throttled("digest sha256:4290aa... mismatch")
+
+
+def answers(*results: tuple[int, str]) -> list[subprocess.CompletedProcess[str]]:
+    return [subprocess.CompletedProcess((), code, "", stderr) for code, stderr in results]
+
+
+def test_a_refused_call_is_retried_after_the_pause_and_shrinks_the_window() -> None:
+    replies = iter(answers((1, "429 Too Many Requests"), (0, "")))
+    calls: list[tuple[str, ...]] = []
+
+    def runner(command: tuple[str, ...], **_: object) -> subprocess.CompletedProcess[str]:
+        calls.append(command)
+        return next(replies)
+
+    # Every reading of the clock is ten seconds on, so the pause is always over.
+    ticks = itertools.count(step=10.0)
+    limiter = AdaptiveLimiter(Window(size=8.0), clock=lambda: next(ticks), runner=runner)
+
+    completed = limiter.run(("docker", "buildx", "imagetools", "inspect", "x"))
+
+    assert completed.returncode == 0
+    assert len(calls) == 2
+    assert limiter.refusals == 1
+    assert limiter.window.admits == 4
+
+
+def test_refusals_from_one_window_halve_it_once() -> None:
+    limiter = AdaptiveLimiter(Window(size=8.0), clock=lambda: 0.0)
+    first, second = limiter._admit(), limiter._admit()
+    limiter._release(first, refused=True)
+    limiter._release(second, refused=True)
+    assert limiter.window.admits == 4
+
+
+def test_a_failure_that_is_not_a_refusal_is_returned_at_once() -> None:
+    replies = iter(answers((1, "not found")))
+    limiter = AdaptiveLimiter(runner=lambda *_, **__: next(replies))
+    assert limiter.run(("docker",)).returncode == 1
+    assert limiter.refusals == 0
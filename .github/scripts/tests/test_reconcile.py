@@ -0,0 +1,164 @@
+"""The reconcile pipeline, driven by fake registry checks and fake builds."""
+
+from __future__ import annotations
+
+import threading
+
+import pytest
+
+from ci.domain import BuildOutcome, BuildSucceeded, Dependency, Platform, Task, Usage
+from ci.reconcile import Share, priorities, stream
+
+
+def task(name: str, on: tuple[str, ...] = (), by: tuple[str, ...] = ()) -> Task:
+    return Task(
+        image=name,
+        dockerfile=f"{name}/Dockerfile",
+        context=name,
+        platform=Platform.AMD64,
+        max_retries=1,
+        dependencies=tuple(
+            Dependency(image=image, usage=Usage.BASE, argument="BASE") for image in on
+        ),
+        dependents=by,
+    )
+
+
+def built(task: Task) -> BuildOutcome:
+    return BuildSucceeded(task=task, attempts=1, duration_seconds=0.0)
+
+
+def test_a_rebuild_starts_before_the_remaining_checks_finish() -> None:
+    """The check for `slow` can only return once `missing` has started rebuilding."""
+    started = threading.Event()
+
+    def landed(task: Task) -> bool:
+        if task.image == "slow":
+            return started.wait(timeout=5)
+        return False
+
+    def rebuild(task: Task) -> BuildOutcome:
+        started.set()
+        return built(task)
+
+    recovery = stream((task("slow"), task("missing")), landed, rebuild, slots=1)
+
+    assert recovery.missing == (task("missing"),)
+
+
+def test_cleanup_runs_once_and_only_when_something_is_missing() -> None:
+    calls: list[str] = []
+
+    stream((task("a"),), lambda _: True, built, slots=1, cleanup=lambda: calls.append("x"))
+    assert calls == []
+
+    stream(
+        (task("a"), task("b"), task("c")),
+        lambda _: False,
+        built,
+        slots=2,
+        cleanup=lambda: calls.append("x"),
+    )
+    assert calls == ["x"]
+
+
+def test_results_come_back_in_expected_order_whatever_finishes_first() -> None:
+    first_may_finish = threading.Event()
+
+    def rebuild(task: Task) -> BuildOutcome:
+        if task.image == "a":
+            first_may_finish.wait(timeout=5)
+        else:
+            first_may_finish.set()
+        return built(task)
+
+    expected = (task("a"), task("present"), task("b"))
+    recovery = stream(expected, lambda task: task.image == "present", rebuild, slots=2)
+
+    assert recovery.missing == (task("a"), task("b"))
+    assert tuple(outcome.task for outcome in recovery.outcomes) == recovery.missing
+
+
+# --- order: what a rebuild waits for, and what goes first -------------------
+
+
+def test_a_consumer_is_rebuilt_only_after_its_missing_base() -> None:
+    """Both missing, two slots free: the consumer still waits for the base."""
+    finished: list[str] = []
+    started_with: dict[str, list[str]] = {}
+    lock = threading.Lock()
+
+    def rebuild(task: Task) -> BuildOutcome:
+        with lock:
+            started_with[task.image] = list(finished)
+        outcome = built(task)
+        with lock:
+            finished.append(task.image)
+        return outcome
+
+    expected = (task("app", on=("base",)), task("base", by=("app",)))
+    recovery = stream(expected, lambda _: False, rebuild, slots=2, levels={"base": 1, "app": 2})
+
+    assert started_with["app"] == ["base"]
+    assert recovery.missing == expected
+
+
+def test_within_a_level_the_longest_chain_behind_goes_first() -> None:
+    expected = (
+        task("leaf"),
+        task("deep", by=("mid",)),
+        task("mid", on=("deep",), by=("top",)),
+        task("top", on=("mid",)),
+    )
+    order = priorities(expected, {"leaf": 1, "deep": 1, "mid": 2, "top": 3})
+    assert sorted(order, key=order.__getitem__) == ["deep", "leaf", "mid", "top"]
+
+
+def test_a_peers_missing_base_is_waited_for_in_the_registry() -> None:
+    """Worker 1 owns `app`; worker 0 owns `base`, so worker 1 polls until it lands."""
+    polls: list[float] = []
+    started: list[str] = []
+
+    def landed(task: Task) -> bool:
+        return task.image == "base" and len(polls) >= 2
+
+    def rebuild(task: Task) -> BuildOutcome:
+        assert len(polls) >= 2, "rebuilt before its base landed"
+        started.append(task.image)
+        return built(task)
+
+    expected = (task("base", by=("app",)), task("app", on=("base",)))
+    recovery = stream(
+        expected,
+        landed,
+        rebuild,
+        slots=1,
+        levels={"base": 1, "app": 2},
+        share=Share(worker_id=1, workers=2),
+        sleep=polls.append,
+    )
+
+    assert started == ["app"]
+    assert recovery.missing == (task("app", on=("base",)),)
+
+
+def test_a_peers_missing_image_nothing_here_needs_is_not_waited_for() -> None:
+    """Worker 1 owns `app`, which is missing; `other` is worker 0's and unrelated."""
+    polls: list[float] = []
+
+    recovery = stream(
+        (task("other"), task("app")),
+        landed=lambda task: False,
+        rebuild=built,
+        slots=1,
+        share=Share(worker_id=1, workers=2),
+        sleep=polls.append,
+    )
+
+    assert polls == []
+    assert recovery.missing == (task("app"),)
+
+
+def test_a_share_names_a_worker_that_exists() -> None:
+    with pytest.raises(ValueError, match="not one of"):
+        Share(worker_id=2, workers=2)
@@ -14,6 +14,7 @@ from pathlib import Path
 
 import pytest
 
+from ci import references
 from ci.domain import Dependency, Usage
 from ci.references import (
     CyclicGraph,
@@ -22,6 +23,10 @@ from ci.references import (
     Internal,
     Misdeclared,
     MisdeclaredReference,
+    ParseCache,
+    _dependents_of,
+    _levels_of,
+    bases_in,
     classify,
     dependencies_in,
     graph,
@@ -457,6 +462,23 @@ def test_every_reference_lands_in_exactly_one_variant() -> None:
             raise AssertionError(other)
 
 
+def test_the_bases_a_file_pulls_are_its_external_references_resolved() -> None:
+    """What the warm-up fetches: no alias, no scratch, none of our own images."""
+    text = preamble(["base"]) + (
+        "ARG ALPINE_VERSION=3.21\n"
+        "FROM alpine:${ALPINE_VERSION} AS builder\n"
+        "FROM --platform=$BUILDPLATFORM maven:3 AS tools\n"
+        "FROM $UNDECLARED AS unknowable\n"
+        f"FROM {ref('base')}\n"
+        "COPY --from=builder /out /out\n"
+        "COPY --from=0 /out /out\n"
+        "COPY --from=tailscale/tailscale:stable /usr/local/bin/tailscaled /bin/\n"
+        "FROM scratch\n"
+        "COPY --from=alpine:3.21 / /\n"
+    )
+    assert bases_in(text, KNOWN) == ("alpine:3.21", "maven:3", "tailscale/tailscale:stable")
+
+
 def test_membership_is_what_separates_a_defect_from_an_external_image() -> None:
     """The same reference is a defect or not depending on what the tree builds.
 
@@ -515,3 +537,133 @@ def test_a_graph_with_no_chain_needs_no_generations(tmp_path: Path) -> None:
 
     assert found.probe is None
     assert found.depth == 0
+
+
+# --- parses carried between jobs --------------------------------------------
+
+
+def three_images(tmp_path: Path) -> tuple[Path, dict[str, Path]]:
+    root = tree(
+        tmp_path,
+        {
+            "base/Dockerfile": "FROM scratch\n",
+            "mid/Dockerfile": f"FROM {ref('base')}\n",
+            "top/Dockerfile": f"FROM {ref('mid')}\n",
+        },
+    )
+    return root, {name: Path(f"{name}/Dockerfile") for name in ("base", "mid", "top")}
+
+
+def test_only_changed_bytes_are_parsed_again(tmp_path: Path) -> None:
+    root, definitions = three_images(tmp_path / "tree")
+    saved = tmp_path / "parses.json"
+
+    cold = ParseCache.load(saved)
+    first = graph(definitions, root, cold)
+    cold.save(saved)
+    assert (cold.hits, cold.misses) == (0, 3)
+
+    top = root / "top/Dockerfile"
+    top.write_text(top.read_text() + "RUN true\n")
+    warm = ParseCache.load(saved)
+    second = graph(definitions, root, warm)
+
+    assert (warm.hits, warm.misses) == (2, 1)
+    assert second == first
+
+
+def test_whole_tree_checks_still_run_over_cached_parses(tmp_path: Path) -> None:
+    """A parse is a fact about one file; dangling is a fact about the tree.
+
+    Every parse here is a hit, yet removing the image `top` builds on has to be
+    refused -- which it can only be if classification and the checks are run
+    again rather than cached with the parse.
+    """
+    root, definitions = three_images(tmp_path / "tree")
+    saved = tmp_path / "parses.json"
+    cache = ParseCache.load(saved)
+    graph(definitions, root, cache)
+    cache.save(saved)
+
+    without_mid = {name: path for name, path in definitions.items() if name != "mid"}
+    warm = ParseCache.load(saved)
+    with pytest.raises(DanglingReference):
+        graph(without_mid, root, warm)
+    assert warm.misses == 0
+
+
+def test_a_pooled_parse_is_indistinguishable_from_a_serial_one(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Same graph, same counts, and the same first error, from two processes."""
+    root, definitions = three_images(tmp_path / "tree")
+    (root / "dup").mkdir()
+    (root / "dup/Dockerfile").write_bytes((root / "base/Dockerfile").read_bytes())
+    definitions["dup"] = Path("dup/Dockerfile")
+
+    serial = ParseCache()
+    expected = graph(definitions, root, serial, workers=1)
+
+    monkeypatch.setattr(references, "_POOL_MINIMUM", 0)
+    pooled = ParseCache()
+    assert graph(definitions, root, pooled, workers=2) == expected
+    assert (pooled.hits, pooled.misses) == (serial.hits, serial.misses) == (1, 3)
+
+    without_mid = {name: path for name, path in definitions.items() if name != "mid"}
+    with pytest.raises(DanglingReference) as serially:
+        graph(without_mid, root, workers=1)
+    with pytest.raises(DanglingReference) as in_a_pool:
+        graph(without_mid, root, workers=2)
+    assert str(in_a_pool.value) == str(serially.value)
+
+
+# --- the walks, at sizes the tree may one day reach ---------------------------
+
+
+def on(*images: str, usage: Usage = Usage.BASE) -> tuple[Dependency, ...]:
+    return tuple(Dependency(image=image, usage=usage, argument="X") for image in images)
+
+
+def test_a_chain_deeper_than_the_interpreter_stack_is_levelled() -> None:
+    """The recursive walk stopped at Python's recursion limit; Kahn's does not."""
+    depth = 5_000
+    edges = {f"i{n}": on(f"i{n - 1}") if n else () for n in range(depth)}
+    assert _levels_of(edges)[f"i{depth - 1}"] == depth
+
+
+def test_a_level_is_one_more_than_the_deepest_dependency() -> None:
+    edges = {
+        "root": (),
+        "short": on("root"),
+        "long": on("short"),
+        "diamond": on("short", "long") + on("root", usage=Usage.ARTIFACT),
+    }
+    assert _levels_of(edges) == {"root": 1, "short": 2, "long": 3, "diamond": 4}
+
+
+def test_the_cycle_reported_is_the_cycle_and_nothing_upstream_of_it() -> None:
+    edges = {"leaf": on("a"), "a": on("b"), "b": on("c"), "c": on("a"), "free": ()}
+    with pytest.raises(CyclicGraph) as raised:
+        _levels_of(edges)
+    assert raised.value.cycle == ("a", "b", "c", "a")
+
+
+@pytest.mark.parametrize(
+    "edges",
+    [
+        {"x": (), "a": on("x", "b"), "b": on("x", "a")},
+        {"x": (), "a": on("x", "b"), "b": on("a")},
+    ],
+)
+def test_a_cycle_hanging_off_a_root_is_still_a_cycle(
+    edges: dict[str, tuple[Dependency, ...]],
+) -> None:
+    """Reaching a cycle's members from a root must not count as placing them."""
+    with pytest.raises(CyclicGraph) as raised:
+        _levels_of(edges)
+    assert raised.value.cycle == ("a", "b", "a")
+
+
+def test_a_consumer_of_one_image_in_two_ways_is_one_dependent() -> None:
+    edges = {"base": (), "app": on("base") + on("base", usage=Usage.ARTIFACT)}
+    assert _dependents_of(edges) == {"base": ("app",), "app": ()}
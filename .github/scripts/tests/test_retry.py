@@ -14,7 +14,17 @@ from collections.abc import Callable
 
 import pytest
 
-from ci.retry import Exhausted, Succeeded, backoff_seconds, with_retries
+from ci.retry import (
+    BreakerState,
+    Closed,
+    Exhausted,
+    Open,
+    Probing,
+    RetryGovernor,
+    Succeeded,
+    backoff_seconds,
+    with_retries,
+)
 
 LOG = logging.getLogger("test.retry")
 
@@ -120,3 +130,133 @@ def test_backoff_is_capped_and_fully_jittered() -> None:
     assert backoff_seconds(4, uniform=lambda _lo, hi: hi) == 8.0
     assert backoff_seconds(50, uniform=lambda _lo, hi: hi) == 60.0
     assert backoff_seconds(3, uniform=lambda lo, _hi: lo) == 0.0
+
+
+# --- the shared governor ---------------------------------------------------
+
+
+class FakeTime:
+    """A clock that only moves when something sleeps on it."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def clock(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+def governor(time: FakeTime, **overrides: float) -> RetryGovernor:
+    settings: dict[str, float] = {"tokens": 2.0, "refill_per_second": 0.5, **overrides}
+    return RetryGovernor(
+        tokens=settings["tokens"],
+        refill_per_second=settings["refill_per_second"],
+        trip_after=3,
+        trip_window_seconds=60.0,
+        first_pause_seconds=10.0,
+        clock=time.clock,
+        sleep=time.sleep,
+    )
+
+
+def state(shared: RetryGovernor) -> BreakerState:
+    # A call, not the property: mypy narrows a property on each comparison,
+    # and a breaker's state is exactly what changes between two of them.
+    return shared.state
+
+
+def test_first_attempts_are_free_and_retries_draw_on_the_bucket() -> None:
+    time = FakeTime()
+    shared = governor(time)
+    for _ in range(5):
+        shared.admit("a", retry=False)
+    shared.admit("a", retry=True)
+    shared.admit("a", retry=True)
+    assert time.now == 0.0
+    # Empty: the third retry waits for one token at half a token a second.
+    shared.admit("a", retry=True)
+    assert time.now == 2.0
+
+
+def test_one_operation_failing_repeatedly_does_not_open_the_breaker() -> None:
+    shared = governor(FakeTime())
+    for _ in range(10):
+        shared.settle("a", succeeded=False, probe=False)
+    assert isinstance(state(shared), Closed)
+
+
+def test_correlated_failures_open_it_and_a_success_between_them_does_not() -> None:
+    shared = governor(FakeTime())
+    shared.settle("a", succeeded=False, probe=False)
+    shared.settle("b", succeeded=False, probe=False)
+    shared.settle("c", succeeded=True, probe=False)
+    shared.settle("d", succeeded=False, probe=False)
+    assert state(shared) == Closed(failures=((0.0, "d"),))
+
+    shared.settle("e", succeeded=False, probe=False)
+    shared.settle("f", succeeded=False, probe=False)
+    assert state(shared) == Open(until=10.0, pause=10.0)
+    assert shared.trips == 1
+
+
+def test_failures_outside_the_window_are_not_correlated() -> None:
+    time = FakeTime()
+    shared = governor(time)
+    for label in ("a", "b", "c"):
+        shared.settle(label, succeeded=False, probe=False)
+        time.now += 45.0
+    assert isinstance(state(shared), Closed)
+
+
+def test_an_open_breaker_admits_one_probe_after_the_pause() -> None:
+    time = FakeTime()
+    shared = governor(time)
+    for label in ("a", "b", "c"):
+        shared.settle(label, succeeded=False, probe=False)
+
+    assert shared.admit("d", retry=False) is True
+    assert time.now == 10.0
+    assert state(shared) == Probing(pause=10.0)
+
+
+def test_a_failed_probe_doubles_the_pause_and_a_good_one_closes_it() -> None:
+    shared = governor(FakeTime())
+    for label in ("a", "b", "c"):
+        shared.settle(label, succeeded=False, probe=False)
+    shared.admit("d", retry=False)
+
+    shared.settle("d", succeeded=False, probe=True)
+    assert state(shared) == Open(until=30.0, pause=20.0)
+
+    shared.admit("d", retry=True)
+    shared.settle("d", succeeded=True, probe=True)
+    assert state(shared) == Closed()
+
+
+def test_waiting_on_an_open_breaker_spends_no_attempts() -> None:
+    time = FakeTime()
+    shared = governor(time)
+    for label in ("a", "b", "c"):
+        shared.settle(label, succeeded=False, probe=False)
+
+    calls, operation = _failing(0)
+    outcome = with_retries(operation, 1, "build", LOG, sleep=time.sleep, governor=shared)
+
+    assert outcome == Succeeded(attempts=1)
+    assert state(shared) == Closed()
+
+
+def test_a_defect_in_the_probe_still_settles_it() -> None:
+    time = FakeTime()
+    shared = governor(time)
+    for label in ("a", "b", "c"):
+        shared.settle(label, succeeded=False, probe=False)
+
+    def operation() -> None:
+        raise ZeroDivisionError("a real bug")
+
+    with pytest.raises(ZeroDivisionError):
+        with_retries(operation, 3, "build", LOG, sleep=time.sleep, governor=shared)
+    assert isinstance(state(shared), Open)
@@ -242,3 +242,32 @@ def test_worker_terminates_with_no_peers_and_no_work() -> None:
         grace_seconds=0.0,
     )
     assert outcomes == ()
+
+
+def test_every_build_is_admitted_before_it_starts() -> None:
+    # The hook the disk governor pauses slots through. A build that started
+    # without asking would be exactly the one that fills the disk.
+    admitted = 0
+    started: list[str] = []
+    lock = threading.Lock()
+
+    def admit() -> None:
+        nonlocal admitted
+        with lock:
+            admitted += 1
+
+    def execute(t: Task) -> BuildOutcome:
+        with lock:
+            started.append(t.image)
+            assert admitted >= len(started)
+        return BuildSucceeded(task=t, attempts=1, duration_seconds=0.0)
+
+    outcomes = run_worker(
+        queue=TaskQueue([task(f"t{index}") for index in range(4)]),
+        mesh=FakeMesh(drained_after=1),
+        execute=execute,
+        slots=2,
+        sleep=lambda _: None,
+        admit=admit,
+    )
+    assert len(outcomes) == 4
@@ -0,0 +1,125 @@
+"""The merged run: its critical path, its floor, its idle time, and its report."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+from ci import timeline
+from ci.domain import BuildFailed, BuildSucceeded, Dependency, Platform, Task, Usage
+from ci.timeline import Span, WorkerTimeline, critical_path, shape
+
+
+def span(
+    image: str, start: float, duration: float, *dependencies: str, platform: str = "amd64"
+) -> Span:
+    return Span(
+        image=image,
+        platform=platform,
+        start=start,
+        duration=duration,
+        stolen=False,
+        succeeded=True,
+        attempts=1,
+        dependencies=dependencies,
+    )
+
+
+def worker(name: str, slots: int, *spans: Span, waits: tuple[float, ...] = ()) -> WorkerTimeline:
+    return WorkerTimeline(
+        worker=name,
+        platform="amd64",
+        slots=slots,
+        began=min((s.start for s in spans), default=0.0),
+        finished=max((s.end for s in spans), default=0.0),
+        spans=spans,
+        steal_waits=waits,
+    )
+
+
+def test_the_critical_path_follows_the_heaviest_chain_not_the_longest_build() -> None:
+    spans = (
+        span("base", 0, 100),
+        span("python", 100, 50, "base"),
+        span("django", 150, 50, "python"),
+        span("huge", 0, 180),
+    )
+    assert [s.image for s in critical_path(spans)] == ["base", "python", "django"]
+
+
+def test_dependencies_not_rebuilt_this_run_are_not_on_the_path() -> None:
+    assert [s.image for s in critical_path((span("python", 0, 50, "base"),))] == ["python"]
+
+
+def test_platforms_are_separate_graphs() -> None:
+    spans = (
+        span("base", 0, 10),
+        span("python", 0, 50, "base", platform="arm64"),
+    )
+    assert [s.image for s in critical_path(spans)] == ["python"]
+
+
+def test_the_lower_bound_is_capacity_when_the_work_is_wide() -> None:
+    # Four independent 100-second builds on two slots: no chain longer than
+    # 100s, but 400s of work over two slots cannot finish in under 200s.
+    run = shape((worker("amd64/0", 2, *(span(f"i{n}", 0, 100) for n in range(4))),))
+    assert run.critical_seconds == 100
+    assert run.lower_bound == 200
+
+
+def test_idle_is_held_slot_time_without_a_build_in_it() -> None:
+    run = shape((worker("amd64/0", 2, span("a", 0, 100), span("b", 0, 40)),))
+    assert run.idle[0].held_seconds == 200
+    assert run.idle[0].idle_seconds == 60
+
+
+def test_spans_place_monotonic_starts_on_the_wall_clock_and_mark_steals() -> None:
+    def task(image: str, *dependencies: str) -> Task:
+        return Task(
+            image=image,
+            dockerfile=f"{image}/Dockerfile",
+            context=image,
+            platform=Platform.AMD64,
+            max_retries=1,
+            dependencies=tuple(
+                Dependency(image=d, usage=Usage.BASE, argument="BASE") for d in dependencies
+            ),
+        )
+
+    outcomes = (
+        BuildSucceeded(task=task("python", "base"), attempts=1, duration_seconds=5, started_at=7),
+        BuildFailed(
+            task=task("node"), attempts=2, duration_seconds=3, error="x", metrics={}, started_at=9
+        ),
+    )
+    spans = timeline.spans_of(outcomes, dealt=frozenset({"python"}), offset=1000.0)
+
+    assert spans[0] == Span("python", "amd64", 1007.0, 5, False, True, 1, ("base",))
+    assert spans[1] == Span("node", "amd64", 1009.0, 3, True, False, 2, ())
+
+
+def test_timelines_round_trip_and_unreadable_ones_are_skipped(tmp_path: Path) -> None:
+    written = worker("amd64/0", 1, span("a", 10, 5), waits=(3.0,))
+    timeline.save(tmp_path / "timeline-amd64-0" / "timeline.json", written)
+    (tmp_path / "broken.json").write_text("{", encoding="utf-8")
+
+    assert timeline.load_all(tmp_path) == (written,)
+
+
+def test_the_report_names_the_floor_the_path_and_each_worker() -> None:
+    lines = "\n".join(
+        timeline.report(
+            (
+                worker("amd64/0", 1, span("base", 0, 60), waits=(4.0,)),
+                worker("amd64/1", 1, span("python", 60, 60, "base")),
+            )
+        )
+    )
+    assert "makespan **2.0 min**" in lines
+    assert "`base` → `python`" in lines
+    assert "1 steal(s), waiting 4s median" in lines
+    assert "| amd64/1 |" in lines
+    assert "python :60, 120" in lines
+
+
+def test_a_run_with_no_timelines_says_so() -> None:
+    assert "No worker reported a timeline." in timeline.report(())
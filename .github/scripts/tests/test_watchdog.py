@@ -0,0 +1,134 @@
+"""The egress watchdog's transitions, with every effect stubbed out."""
+
+from __future__ import annotations
+
+from collections.abc import Iterator
+from pathlib import Path
+
+from ci.egress import Controller, Fleet, MasqueNode, RegistrationFailed, render_config
+from ci.watchdog import (
+    RETRY_TUNNEL_SECONDS,
+    EgressState,
+    Route,
+    Watchdog,
+    describe,
+    read_state,
+    record_to,
+)
+
+NODE = MasqueNode(private_key="cHJpdmF0ZQ==", address_v4="172.16.0.2", address_v6="fd00::2")
+FRESH = MasqueNode(private_key="ZnJlc2g=", address_v4="172.16.0.3", address_v6="fd00::3")
+
+
+class Effects:
+    """Scripted probe and registration answers, and a log of what was applied."""
+
+    def __init__(self, probes: list[bool], registrations: list[Fleet | RegistrationFailed]):
+        self._probes: Iterator[bool] = iter(probes)
+        self._registrations = iter(registrations)
+        self.applied: list[Fleet] = []
+        self.recorded: list[EgressState] = []
+        self.now = 1000.0
+
+    def watchdog(self) -> Watchdog:
+        return Watchdog(
+            probe=lambda: next(self._probes),
+            register=lambda: next(self._registrations),
+            apply=self.apply,
+            record=self.recorded.append,
+            clock=lambda: self.now,
+        )
+
+    def apply(self, fleet: Fleet) -> bool:
+        self.applied.append(fleet)
+        return True
+
+
+def test_a_healthy_tunnel_is_left_alone() -> None:
+    effects = Effects(probes=[True, True], registrations=[])
+    watchdog = effects.watchdog()
+    watchdog.check()
+    watchdog.check()
+    assert watchdog.state.route is Route.WARP
+    assert effects.applied == [] and effects.recorded == []
+
+
+def test_one_failed_probe_is_noise() -> None:
+    effects = Effects(probes=[False, True], registrations=[])
+    watchdog = effects.watchdog()
+    watchdog.check()
+    watchdog.check()
+    assert effects.applied == []
+
+
+def test_a_dead_tunnel_is_replaced_by_a_fresh_registration() -> None:
+    effects = Effects(probes=[False, False, True], registrations=[(FRESH,)])
+    watchdog = effects.watchdog()
+    watchdog.check()
+    state = watchdog.check()
+
+    assert effects.applied == [(FRESH,)]
+    assert state.route is Route.WARP and state.registrations == 2
+    assert effects.recorded == [state]
+
+
+def test_when_no_tunnel_comes_back_the_allowlist_goes_direct() -> None:
+    effects = Effects(probes=[False, False, False], registrations=[(FRESH,)])
+    watchdog = effects.watchdog()
+    watchdog.check()
+    state = watchdog.check()
+
+    assert effects.applied == [(FRESH,), ()]
+    assert state.route is Route.DIRECT
+    assert "did not carry" in state.reason
+
+
+def test_a_failed_registration_goes_direct_without_touching_the_tunnel_config() -> None:
+    effects = Effects(probes=[False, False], registrations=[RegistrationFailed("503")])
+    watchdog = effects.watchdog()
+    watchdog.check()
+    state = watchdog.check()
+
+    assert effects.applied == [()]
+    assert state.route is Route.DIRECT and "503" in state.reason
+
+
+def test_direct_retries_a_tunnel_only_after_the_interval() -> None:
+    effects = Effects(
+        probes=[False, False, True], registrations=[RegistrationFailed("x"), (FRESH,)]
+    )
+    watchdog = effects.watchdog()
+    watchdog.check()
+    watchdog.check()
+
+    effects.now += RETRY_TUNNEL_SECONDS / 2
+    assert watchdog.check().route is Route.DIRECT
+
+    effects.now += RETRY_TUNNEL_SECONDS
+    assert watchdog.check().route is Route.WARP
+    assert effects.applied == [(), (FRESH,)]
+
+
+def test_the_state_file_round_trips_and_describes_itself(tmp_path: Path) -> None:
+    path = tmp_path / "state.json"
+    state = EgressState(Route.DIRECT, since=0.0, reason="tunnel down", registrations=3)
+    record_to(path)(state)
+
+    assert read_state(path) == state
+    assert describe(read_state(path)) == "direct since 00:00:00 UTC (tunnel down)"
+    assert describe(read_state(tmp_path / "absent.json")) == "no egress state recorded"
+
+
+def test_the_failover_config_routes_the_allowlist_direct_on_the_same_port() -> None:
+    config = render_config((), port=1234)
+    assert "mixed-port: 1234" in config
+    assert "proxies: []" in config
+    assert "  - DOMAIN-SUFFIX,launchpad.net,DIRECT" in config
+    assert ",warp" not in config
+
+
+def test_the_controller_listens_on_loopback_behind_its_secret() -> None:
+    config = render_config((NODE,), controller=Controller(port=4321, secret="s3cret"))
+    assert "external-controller: '127.0.0.1:4321'" in config
+    assert "secret: 's3cret'" in config
+    assert "external-controller: ''" in render_config((NODE,))
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+"""Entry point: watch this runner's clean egress until the job ends.
+
+Started detached by `setup_egress.py` once the proxy is proven, never by the
+workflow directly; see `ci/watchdog.py` for the policy. Everything it needs
+arrives in its environment, the controller secret included, so none of it
+appears on a command line another process could read.
+"""
+
+from __future__ import annotations
+
+import logging
+import sys
+from functools import partial
+from pathlib import Path
+
+from ci.egress import (
+    Controller,
+    Fleet,
+    register_fleet,
+    reload,
+    render_config,
+    warp_egress,
+    write_config,
+)
+from ci.env import COUNT, NAME_LIST, PORT, TEXT, read, read_json
+from ci.logs import configure
+from ci.watchdog import Watchdog, record_to
+
+logger = logging.getLogger("ci.egress.watchdog")
+
+
+def main() -> int:
+    configure()
+    port = read("EGRESS_PROXY_PORT", PORT)
+    controller = Controller(
+        port=read("EGRESS_CONTROLLER_PORT", PORT), secret=read("EGRESS_CONTROLLER_SECRET", TEXT)
+    )
+    config = Path(read("EGRESS_CONFIG", TEXT))
+    probe_url = read("EGRESS_PROBE_URL", TEXT)
+
+    nodes = read("EGRESS_NODES", COUNT, default=1)
+    domains = read_json("EGRESS_DOMAINS", NAME_LIST)
+
+    def apply(fleet: Fleet) -> bool:
+        write_config(config, render_config(fleet, port, domains, controller))
+        return reload(controller, config)
+
+    watchdog = Watchdog(
+        probe=lambda: warp_egress(probe_url),
+        register=partial(register_fleet, nodes),
+        apply=apply,
+        record=record_to(Path(read("EGRESS_STATE_FILE", TEXT))),
+        registered=nodes,
+    )
+    logger.info("Watching egress through %s", probe_url)
+    watchdog.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())